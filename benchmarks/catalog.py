@@ -0,0 +1,87 @@
+"""Синтетический каталог для бенчмарков.
+
+    python -m benchmarks.catalog 10 10 100 --clear --seed 1
+
+С --seed идентификаторы воспроизводимы: повторный прогон с --clear дает тот же каталог.
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import delete, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import async_session_maker
+from src.restaurant import models
+from src.services.cache_services import init_cache, invalidate_catalog
+from src.services.import_services import insert_rows
+
+
+async def clear_catalog(session: AsyncSession) -> None:
+    """ удалить весь каталог """
+    for model in (models.Dish, models.Submenu, models.Menu):
+        await session.execute(delete(model))
+    await session.commit()
+
+
+async def analyze_catalog(session: AsyncSession) -> None:
+    """ свежая статистика, иначе планировщик оценивает таблицы как пустые """
+    for table in ('menu', 'submenu', 'dish'):
+        await session.execute(text(f'ANALYZE {table}'))
+    await session.commit()
+
+
+async def seed_catalog(session: AsyncSession, menus: int, submenus: int, dishes: int,
+                       seed: int | None = None) -> list[uuid.UUID]:
+    """ синтетический каталог: menus меню x submenus субменю x dishes блюд, счетчики заполнены """
+    rng = random.Random(seed)
+
+    def new_id() -> uuid.UUID:
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+    menu_ids = []
+    for menu_number in range(menus):
+        menu_id = new_id()
+        menu_ids.append(menu_id)
+        submenu_rows, dish_rows = [], []
+        for submenu_number in range(submenus):
+            submenu_id = new_id()
+            submenu_rows.append({'id': submenu_id, 'menu_id': menu_id, 'dishes_count': dishes,
+                                 'title': f'Submenu {menu_number}.{submenu_number}',
+                                 'description': f'Submenu {menu_number}.{submenu_number} description'})
+            dish_rows += [{'id': new_id(), 'submenu_id': submenu_id, 'price': Decimal(f'{number % 100}.99'),
+                           'title': f'Dish {menu_number}.{submenu_number}.{number}',
+                           'description': f'Dish {menu_number}.{submenu_number}.{number} description'}
+                          for number in range(dishes)]
+        await session.execute(insert(models.Menu), [{
+            'id': menu_id, 'title': f'Menu {menu_number}', 'description': f'Menu {menu_number} description',
+            'submenus_count': submenus, 'dishes_count': submenus * dishes}])
+        await insert_rows(session, models.Submenu, submenu_rows)
+        await insert_rows(session, models.Dish, dish_rows)
+        await session.commit()
+    return menu_ids
+
+
+async def main(menus: int, submenus: int, dishes: int, clear: bool, seed: int | None) -> None:
+    async with async_session_maker() as session:
+        if clear:
+            await clear_catalog(session)
+        await seed_catalog(session, menus, submenus, dishes, seed)
+        await analyze_catalog(session)
+    # запущенное приложение не должно отдавать из кэша прежний каталог
+    init_cache()
+    await invalidate_catalog()
+    print(f'seeded: {menus} menus, {menus * submenus} submenus, {menus * submenus * dishes} dishes')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.catalog')
+    parser.add_argument('menus', type=int)
+    parser.add_argument('submenus', type=int, help='субменю в каждом меню')
+    parser.add_argument('dishes', type=int, help='блюд в каждом субменю')
+    parser.add_argument('--clear', action='store_true', help='сначала удалить весь каталог')
+    parser.add_argument('--seed', type=int, help='зерно генератора идентификаторов')
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.menus, arguments.submenus, arguments.dishes, arguments.clear, arguments.seed))
@@ -0,0 +1,73 @@
+"""Удаление меню с большим поддеревом: ON DELETE CASCADE против каскада ORM.
+
+    python -m benchmarks.delete_menu --submenus 10 --dishes 1000 --rounds 3
+
+В каждом раунде засеивается одно меню (по умолчанию 10 x 1000 = 10k блюд) и удаляется
+MenuRepository.delete_menu - один DELETE. Для сравнения --orm удаляет так же засеянное меню
+прежним способом: дерево загружается в сессию, session.delete удаляет каждую строку отдельно.
+"""
+import argparse
+import asyncio
+import time
+from uuid import UUID
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from benchmarks.catalog import seed_catalog
+from src.database import async_session_maker, engine
+from src.restaurant import models
+from src.services.menu_services import MenuRepository
+
+
+async def delete_cascade(menu_id: UUID, session: AsyncSession) -> None:
+    await MenuRepository().delete_menu(menu_id, session)
+
+
+async def delete_orm(menu_id: UUID, session: AsyncSession) -> None:
+    """ прежний путь: загрузить меню со всеми субменю и блюдами и удалить через сессию """
+    db_menu = await session.scalar(select(models.Menu).where(models.Menu.id == menu_id).options(
+        selectinload(models.Menu.submenus).selectinload(models.Submenu.dishes)))
+    await session.delete(db_menu)
+    await session.commit()
+
+
+async def measure(name: str, submenus: int, dishes: int, rounds: int) -> None:
+    delete = delete_orm if name == 'orm' else delete_cascade
+    statements = [0]
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements[0] += 1
+
+    best = float('inf')
+    for _ in range(rounds):
+        async with async_session_maker() as session:
+            menu_id, = await seed_catalog(session, 1, submenus, dishes)
+        statements[0] = 0
+        event.listen(engine.sync_engine, 'before_cursor_execute', count_statement)
+        try:
+            async with async_session_maker() as session:
+                started = time.perf_counter()
+                await delete(menu_id, session)
+                best = min(best, time.perf_counter() - started)
+        finally:
+            event.remove(engine.sync_engine, 'before_cursor_execute', count_statement)
+    print(f'{name:>8}: {best * 1e3:9.1f} ms, {statements[0]} statement(s)')
+
+
+async def main(submenus: int, dishes: int, rounds: int, orm: bool) -> None:
+    print(f'menu with {submenus} submenus x {dishes} dishes, best of {rounds} rounds:')
+    await measure('cascade', submenus, dishes, rounds)
+    if orm:
+        await measure('orm', submenus, dishes, rounds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.delete_menu')
+    parser.add_argument('--submenus', type=int, default=10)
+    parser.add_argument('--dishes', type=int, default=1000, help='блюд в каждом субменю')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--orm', action='store_true', help='сравнить с удалением через каскад ORM')
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.submenus, arguments.dishes, arguments.rounds, arguments.orm))
@@ -0,0 +1,88 @@
+"""EXPLAIN ANALYZE для запросов репозиториев.
+
+    python -m benchmarks.explain_queries --seed 10 10 100
+
+Запросы перехватываются событием before_cursor_execute во время вызова метода репозитория
+и затем повторяются с теми же параметрами под EXPLAIN (ANALYZE, BUFFERS) в откатываемой транзакции.
+"""
+import argparse
+import asyncio
+from collections.abc import Awaitable, Callable
+from decimal import Decimal
+from typing import Any
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmarks.catalog import analyze_catalog, seed_catalog
+from src.database import async_session_maker, engine
+from src.restaurant import models
+from src.services.counter_services import CounterRepository
+from src.services.dish_services import DishRepository
+from src.services.menu_services import MenuRepository
+from src.services.submenu_services import SubMenuRepository
+
+
+def scenarios(session: AsyncSession, menu_id: Any, submenu_id: Any,
+              dish_id: Any) -> dict[str, Callable[[], Awaitable[Any]]]:
+    menu, submenu, dish = MenuRepository(), SubMenuRepository(), DishRepository()
+    return {
+        'get_menus': lambda: menu.get_menus(0, 100, session),
+        'get_menus (cursor)': lambda: menu.get_menus(0, 100, session, menu_id),
+        'read_menu': lambda: menu.read_menu(menu_id, session),
+        'read_menu_tree': lambda: menu.read_menu_tree(menu_id, True, session),
+        'get_submenus': lambda: submenu.get_submenus(menu_id, session),
+        'read_submenu': lambda: submenu.read_submenu(menu_id, submenu_id, session),
+        'get_dishes': lambda: dish.get_dishes(menu_id, submenu_id, session),
+        'get_dishes (cursor)': lambda: dish.get_dishes(menu_id, submenu_id, session, cursor=dish_id),
+        'get_dishes (price range)': lambda: dish.get_dishes(menu_id, submenu_id, session, min_price=Decimal(10),
+                                                            max_price=Decimal(50), order_by='price'),
+        'get_dishes (price cursor)': lambda: dish.get_dishes(menu_id, submenu_id, session, cursor=dish_id, order_by='price'),
+        'read_dish': lambda: dish.read_dish(menu_id, submenu_id, dish_id, session),
+        'check_counters': lambda: CounterRepository().check_counters(session),
+    }
+
+
+async def explain_queries() -> None:
+    captured: list[tuple[str, Any]] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    async with async_session_maker() as session:
+        menu_id, submenu_id = (await session.execute(
+            select(models.Submenu.menu_id, models.Submenu.id).limit(1))).one()
+        dish_id = await session.scalar(select(models.Dish.id).where(models.Dish.submenu_id == submenu_id).limit(1))
+
+        for name, call in scenarios(session, menu_id, submenu_id, dish_id).items():
+            captured.clear()
+            event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+            try:
+                await call()
+            finally:
+                event.remove(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+            session.expunge_all()
+
+            print(f'=== {name}: {len(captured)} statement(s)')
+            connection = await session.connection()
+            for statement, parameters in captured:
+                print(statement)
+                plan = await connection.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+                for line in plan.scalars():
+                    print(f'    {line}')
+            await session.rollback()
+
+
+async def main(seed: list[int] | None) -> None:
+    if seed:
+        async with async_session_maker() as session:
+            await seed_catalog(session, *seed)
+            await analyze_catalog(session)
+    await explain_queries()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.explain_queries')
+    parser.add_argument('--seed', nargs=3, type=int, metavar=('MENUS', 'SUBMENUS', 'DISHES'),
+                        help='сначала засеять каталог заданного размера')
+    asyncio.run(main(parser.parse_args().seed))
@@ -0,0 +1,335 @@
+"""Нагрузочный прогон всех маршрутов API со смесью чтения и записи.
+
+    python -m benchmarks.load_test --seed 10 10 100 --requests 5000 --concurrency 20 --output run.json
+    python -m benchmarks.load_test --url http://localhost:8000 --requests 5000 --output run.json
+
+Без --url приложение вызывается в процессе через ASGI-транспорт httpx, и каждому запросу
+засчитываются его SQL-запросы (событие before_cursor_execute, запрос определяется по contextvar).
+С --url нагружается запущенный uvicorn; каталог и идентификаторы берутся из той же локальной БД,
+число SQL-запросов на запрос в этом режиме не считается.
+Последовательность сценариев задается --random-seed, поэтому прогоны с одними параметрами сравнимы.
+Результат - задержки p50/p95/p99 по сценариям, пропускная способность, SQL-запросы на запрос
+и доля попаданий в кэш за прогон (по /api/v1/cache/stats) - печатается и сохраняется в JSON.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+from sqlalchemy import event, select
+
+from benchmarks.catalog import analyze_catalog, clear_catalog, seed_catalog
+from src.database import all_engines, async_session_maker, replicas
+from src.main import app
+from src.restaurant import models
+from src.services.cache_services import (
+    init_cache,
+    invalidate_catalog,
+    start_invalidation_listener,
+)
+
+SAMPLE_SIZE = 1000
+LIST_LIMIT = 50
+# id в пакетном чтении
+BATCH_SIZE = 20
+# заголовки засеянного каталога - 'Dish 1.2.3', 'Submenu 1.2'
+SEARCH_QUERIES = ('dish', 'submenu 1', 'dish 2 description', 'sub', 'menu 3')
+
+# счетчик SQL-запросов текущего HTTP-запроса
+current_queries: ContextVar[list[int] | None] = ContextVar('current_queries', default=None)
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = current_queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+@dataclass
+class Catalog:
+    """ случайная выборка засеянного каталога и объекты, созданные прогоном """
+    menus: list[str]
+    submenus: list[tuple[str, str]]
+    dishes: list[tuple[str, str, str]]
+    created_menus: list[str] = field(default_factory=list)
+    created_submenus: list[tuple[str, str]] = field(default_factory=list)
+    created_dishes: list[tuple[str, str, str]] = field(default_factory=list)
+
+
+async def load_catalog(rng: random.Random) -> Catalog:
+    async with async_session_maker() as session:
+        submenus = (await session.execute(select(models.Submenu.menu_id, models.Submenu.id))).all()
+        dishes = (await session.execute(select(models.Submenu.menu_id, models.Dish.submenu_id, models.Dish.id)
+                                        .join(models.Submenu).order_by(models.Dish.id)
+                                        .limit(SAMPLE_SIZE * 10))).all()
+    if not dishes:
+        raise SystemExit('catalog is empty: run with --seed MENUS SUBMENUS DISHES')
+    submenus = rng.sample(sorted(submenus), min(SAMPLE_SIZE, len(submenus)))
+    dishes = rng.sample(dishes, min(SAMPLE_SIZE, len(dishes)))
+    return Catalog(menus=sorted({str(menu_id) for menu_id, _ in submenus}),
+                   submenus=[(str(menu_id), str(submenu_id)) for menu_id, submenu_id in submenus],
+                   dishes=[(str(menu_id), str(submenu_id), str(dish_id)) for menu_id, submenu_id, dish_id in dishes])
+
+
+Scenario = Callable[[httpx.AsyncClient, random.Random, Catalog], Awaitable[httpx.Response]]
+
+MENUS_URL = '/api/v1/menus'
+
+
+def menu_url(menu_id: str) -> str:
+    return f'{MENUS_URL}/{menu_id}'
+
+
+def submenu_url(menu_id: str, submenu_id: str) -> str:
+    return f'{MENUS_URL}/{menu_id}/submenus/{submenu_id}'
+
+
+def dish_url(menu_id: str, submenu_id: str, dish_id: str) -> str:
+    return f'{submenu_url(menu_id, submenu_id)}/dishes/{dish_id}'
+
+
+def title(rng: random.Random, kind: str) -> dict[str, str]:
+    number = rng.randrange(10 ** 6)
+    return {'title': f'Load {kind} {number}', 'description': f'Load {kind} {number} description'}
+
+
+def price(rng: random.Random) -> str:
+    return f'{rng.randrange(100, 10000) / 100}'
+
+
+async def create_menu(client: httpx.AsyncClient, rng: random.Random, catalog: Catalog) -> httpx.Response:
+    response = await client.post(MENUS_URL, json=title(rng, 'menu'))
+    catalog.created_menus.append(response.json()['id'])
+    return response
+
+
+async def delete_menu(client: httpx.AsyncClient, rng: random.Random, catalog: Catalog) -> httpx.Response:
+    if not catalog.created_menus:
+        return await create_menu(client, rng, catalog)
+    return await client.delete(menu_url(catalog.created_menus.pop()))
+
+
+async def create_submenu(client: httpx.AsyncClient, rng: random.Random, catalog: Catalog) -> httpx.Response:
+    menu_id = rng.choice(catalog.menus)
+    response = await client.post(f'{menu_url(menu_id)}/submenus', json=title(rng, 'submenu'))
+    catalog.created_submenus.append((menu_id, response.json()['id']))
+    return response
+
+
+async def delete_submenu(client: httpx.AsyncClient, rng: random.Random, catalog: Catalog) -> httpx.Response:
+    if not catalog.created_submenus:
+        return await create_submenu(client, rng, catalog)
+    return await client.delete(submenu_url(*catalog.created_submenus.pop()))
+
+
+async def create_dish(client: httpx.AsyncClient, rng: random.Random, catalog: Catalog) -> httpx.Response:
+    menu_id, submenu_id = rng.choice(catalog.submenus)
+    response = await client.post(f'{submenu_url(menu_id, submenu_id)}/dishes',
+                                 json={**title(rng, 'dish'), 'price': price(rng)})
+    catalog.created_dishes.append((menu_id, submenu_id, response.json()['id']))
+    return response
+
+
+async def delete_dish(client: httpx.AsyncClient, rng: random.Random, catalog: Catalog) -> httpx.Response:
+    if not catalog.created_dishes:
+        return await create_dish(client, rng, catalog)
+    return await client.delete(dish_url(*catalog.created_dishes.pop()))
+
+
+async def import_catalog(client: httpx.AsyncClient, rng: random.Random, catalog: Catalog) -> httpx.Response:
+    menu = {**title(rng, 'import'), 'submenus': [
+        {**title(rng, 'import submenu'), 'dishes': [{**title(rng, 'import dish'), 'price': price(rng)}]}]}
+    return await client.post(f'{MENUS_URL}/import', json=[menu])
+
+
+# сценарий: (доля внутри чтения или записи, вызов)
+READS: dict[str, tuple[float, Scenario]] = {
+    'menus': (5, lambda client, rng, catalog: client.get(MENUS_URL, params={'limit': LIST_LIMIT})),
+    'menu': (10, lambda client, rng, catalog: client.get(menu_url(rng.choice(catalog.menus)))),
+    'menu include': (2, lambda client, rng, catalog: client.get(menu_url(rng.choice(catalog.menus)),
+                                                                params={'include': 'submenus,dishes'})),
+    'menus tree': (0.5, lambda client, rng, catalog: client.get(f'{MENUS_URL}/tree')),
+    'submenus': (8, lambda client, rng, catalog: client.get(f'{menu_url(rng.choice(catalog.menus))}/submenus')),
+    'submenu': (12, lambda client, rng, catalog: client.get(submenu_url(*rng.choice(catalog.submenus)))),
+    'dishes': (15, lambda client, rng, catalog: client.get(f'{submenu_url(*rng.choice(catalog.submenus))}/dishes',
+                                                           params={'limit': LIST_LIMIT})),
+    'dishes by price': (5, lambda client, rng, catalog: client.get(
+        f'{submenu_url(*rng.choice(catalog.submenus))}/dishes',
+        params={'min_price': 10, 'max_price': 50, 'order_by': 'price', 'limit': LIST_LIMIT})),
+    'dish': (30, lambda client, rng, catalog: client.get(dish_url(*rng.choice(catalog.dishes)))),
+    'batch dishes': (3, lambda client, rng, catalog: client.post('/api/v1/dishes:batchGet', json={
+        'ids': [dish_id for _, _, dish_id in rng.sample(catalog.dishes, min(BATCH_SIZE, len(catalog.dishes)))]})),
+    'batch submenus': (1, lambda client, rng, catalog: client.post('/api/v1/submenus:batchGet', json={
+        'ids': [submenu_id for _, submenu_id in rng.sample(catalog.submenus, min(BATCH_SIZE, len(catalog.submenus)))]})),
+    'search': (2, lambda client, rng, catalog: client.get('/api/v1/search', params={'q': rng.choice(SEARCH_QUERIES)})),
+    'export': (0.1, lambda client, rng, catalog: client.get(f'{MENUS_URL}/export')),
+    'cache stats': (0.1, lambda client, rng, catalog: client.get('/api/v1/cache/stats')),
+    'db stats': (0.1, lambda client, rng, catalog: client.get('/api/v1/db/stats')),
+}
+WRITES: dict[str, tuple[float, Scenario]] = {
+    'create menu': (1, create_menu),
+    'update menu': (1, lambda client, rng, catalog: client.patch(menu_url(rng.choice(catalog.menus)),
+                                                                 json=title(rng, 'menu'))),
+    'delete menu': (1, delete_menu),
+    'create submenu': (2, create_submenu),
+    'update submenu': (2, lambda client, rng, catalog: client.patch(submenu_url(*rng.choice(catalog.submenus)),
+                                                                    json=title(rng, 'submenu'))),
+    'delete submenu': (2, delete_submenu),
+    'create dish': (5, create_dish),
+    'update dish': (5, lambda client, rng, catalog: client.patch(
+        dish_url(*rng.choice(catalog.dishes)), json={**title(rng, 'dish'), 'price': price(rng)})),
+    'delete dish': (5, delete_dish),
+    'import': (0.5, import_catalog),
+}
+SCENARIOS = {**READS, **WRITES}
+
+
+def plan(rng: random.Random, requests: int, write_ratio: float) -> list[tuple[str, int]]:
+    """ воспроизводимая последовательность сценариев; у каждого запроса свое зерно, чтобы параметры
+    не зависели от того, в каком порядке конкурентные запросы обращаются к генератору """
+    def choose(scenarios: dict[str, tuple[float, Scenario]]) -> str:
+        return rng.choices(list(scenarios), weights=[weight for weight, _ in scenarios.values()])[0]
+
+    return [(choose(WRITES if rng.random() < write_ratio else READS), rng.getrandbits(32)) for _ in range(requests)]
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    """ p50/p95/p99 и среднее, миллисекунды """
+    if len(latencies) < 2:
+        latencies = latencies * 2 or [0.0, 0.0]
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {'mean': round(statistics.fmean(latencies) * 1000, 3),
+            **{f'p{q}': round(cuts[q - 1] * 1000, 3) for q in (50, 95, 99)}}
+
+
+@dataclass
+class Sample:
+    scenario: str
+    latency: float
+    status: int
+    queries: int | None
+
+
+def summarize(samples: list[Sample]) -> dict[str, Any]:
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    return {'requests': len(samples), 'errors': sum(sample.status >= 400 for sample in samples),
+            'latency_ms': percentiles([sample.latency for sample in samples]),
+            'queries_per_request': round(sum(queries) / len(queries), 3) if queries else None}
+
+
+def cache_delta(before: dict[str, Any], after: dict[str, Any]) -> dict[str, Any]:
+    """ попадания в кэш за прогон: разность счетчиков /api/v1/cache/stats
+
+    Запрос либо отдается кэшем готовых ответов, либо доходит до локального уровня @cache
+    (промах кэша ответов - тоже), поэтому обращения - попадания кэша ответов и обращения к локальному уровню.
+    """
+    counters = ('response_hits', 'response_misses', 'local_hits', 'local_misses', 'redis_hits', 'redis_misses',
+                'coalesced', 'stale_hits')
+    delta = {name: after[name] - before[name] for name in counters}
+    requests = delta['response_hits'] + delta['local_hits'] + delta['local_misses']
+    hits = delta['response_hits'] + delta['local_hits'] + delta['redis_hits']
+    return {**delta, 'hit_ratio': round(hits / requests, 4) if requests else None}
+
+
+async def run(client: httpx.AsyncClient, catalog: Catalog, scenarios: list[tuple[str, int]], concurrency: int,
+              count_queries: bool) -> list[Sample]:
+    samples: list[Sample] = []
+    pending = iter(scenarios)
+
+    async def worker() -> None:
+        for name, seed in pending:
+            counter = [0]
+            current_queries.set(counter if count_queries else None)
+            started = time.perf_counter()
+            response = await SCENARIOS[name][1](client, random.Random(seed), catalog)
+            latency = time.perf_counter() - started
+            samples.append(Sample(name, latency, response.status_code, counter[0] if count_queries else None))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+async def main(arguments: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(arguments.random_seed)
+    if arguments.seed:
+        async with async_session_maker() as session:
+            await clear_catalog(session)
+            menus, submenus, dishes = arguments.seed
+            await seed_catalog(session, menus, submenus, dishes, seed=arguments.random_seed)
+            await analyze_catalog(session)
+    catalog = await load_catalog(rng)
+    init_cache()
+    if arguments.seed:
+        # каталог пересоздан в обход API
+        await invalidate_catalog()
+
+    transport = None
+    if not arguments.url:
+        start_invalidation_listener()
+        replicas.start()
+        transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+        for db_engine in all_engines():
+            event.listen(db_engine.sync_engine, 'before_cursor_execute', count_query)
+    async with httpx.AsyncClient(transport=transport, base_url=arguments.url or 'http://load-test',
+                                 timeout=60) as client:
+        await run(client, catalog, plan(rng, arguments.warmup, 0), arguments.concurrency, False)
+        cache_before = (await client.get('/api/v1/cache/stats')).json()
+        scenarios = plan(rng, arguments.requests, arguments.write_ratio)
+        started = time.perf_counter()
+        samples = await run(client, catalog, scenarios, arguments.concurrency, transport is not None)
+        elapsed = time.perf_counter() - started
+        cache_after = (await client.get('/api/v1/cache/stats')).json()
+        db_pool = (await client.get('/api/v1/db/stats')).json()
+
+    by_scenario: dict[str, list[Sample]] = {}
+    for sample in samples:
+        by_scenario.setdefault(sample.scenario, []).append(sample)
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'config': {'url': arguments.url, 'seed': arguments.seed, 'requests': arguments.requests,
+                   'concurrency': arguments.concurrency, 'write_ratio': arguments.write_ratio,
+                   'warmup': arguments.warmup, 'random_seed': arguments.random_seed},
+        'total': {**summarize(samples), 'elapsed_s': round(elapsed, 3),
+                  'throughput_rps': round(len(samples) / elapsed, 1)},
+        'scenarios': {name: summarize(by_scenario[name]) for name in SCENARIOS if name in by_scenario},
+        'cache': cache_delta(cache_before, cache_after),
+        'db_pool': db_pool,
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"{'scenario':<16} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>7}")
+    for name, row in {**report['scenarios'], 'total': report['total']}.items():
+        latency, queries = row['latency_ms'], row['queries_per_request']
+        print(f"{name:<16} {row['requests']:>8} {row['errors']:>6} {latency['p50']:>8} {latency['p95']:>8} "
+              f"{latency['p99']:>8} {'-' if queries is None else queries:>7}")
+    cache = report['cache']
+    print(f"throughput: {report['total']['throughput_rps']} req/s, cache hit ratio: {cache['hit_ratio']} "
+          f"(response cache: {cache['response_hits']} hits, {cache['response_misses']} misses)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load_test')
+    parser.add_argument('--url', help='адрес запущенного приложения; по умолчанию - в процессе через ASGI')
+    parser.add_argument('--seed', nargs=3, type=int, metavar=('MENUS', 'SUBMENUS', 'DISHES'),
+                        help='пересоздать каталог заданного размера перед прогоном')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='доля запросов на запись')
+    parser.add_argument('--warmup', type=int, default=200, help='запросов на чтение до замера')
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, help='сохранить результат в JSON')
+    arguments = parser.parse_args()
+    result = asyncio.run(main(arguments))
+    print_report(result)
+    if arguments.output:
+        arguments.output.write_text(json.dumps(result, indent=2))
@@ -0,0 +1,86 @@
+"""Задержка попадания в кэш: кэш готовых ответов перед роутером против @cache за зависимостями.
+
+    python -m benchmarks.response_cache --dishes 100 --requests 10000
+
+Засевается одно меню с одним субменю (в конце оно удаляется), приложение вызывается как ASGI
+напрямую, без HTTP-клиента. Каждый URL сначала прогревается, дальше все запросы - попадания;
+поколения тегов берутся из локальной копии, так что Redis в замер не входит.
+Режим 'response cache br' просит сжатый ответ: вариант сжат при сохранении, попадание только выбирает его.
+Режим '@cache' выключает кэш ответов: поиск в кэше идет после разбора параметров и зависимостей.
+"""
+import argparse
+import asyncio
+import time
+from typing import Any
+
+from benchmarks.catalog import seed_catalog
+from benchmarks.load_test import percentiles
+from src import response_cache
+from src.database import async_session_maker
+from src.main import app
+from src.services.cache_services import init_cache, invalidate_catalog
+from src.services.menu_services import MenuRepository
+
+
+async def get(path: str, query: str = '', accept_encoding: str = '') -> tuple[int, int]:
+    """ один GET через весь стек middleware приложения; статус ответа и размер тела """
+    headers = [(b'host', b'benchmark')] + ([(b'accept-encoding', accept_encoding.encode())] if accept_encoding else [])
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+             'query_string': query.encode(), 'headers': headers,
+             'client': ('127.0.0.1', 0), 'server': ('benchmark', 80)}
+    status = [0, 0]
+
+    async def receive() -> dict[str, Any]:
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message: dict[str, Any]) -> None:
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+        elif message['type'] == 'http.response.body':
+            status[1] += len(message.get('body', b''))
+
+    await app(scope, receive, send)  # type: ignore[arg-type]
+    return status[0], status[1]
+
+
+async def measure(name: str, path: str, query: str, accept_encoding: str, requests: int) -> dict[str, float]:
+    assert (await get(path, query, accept_encoding))[0] == 200
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        _, size = await get(path, query, accept_encoding)
+        latencies.append(time.perf_counter() - started)
+    result = {**percentiles(latencies), 'bytes': size}
+    print(f"{name:<20} {path + ('?' + query if query else ''):<56.56} {size:>8} {result['p50']:>8} {result['p99']:>8}")
+    return result
+
+
+async def main(dishes: int, requests: int) -> dict[str, dict[str, float]]:
+    async with async_session_maker() as session:
+        menu_id, = await seed_catalog(session, 1, 1, dishes)
+    init_cache()
+    await invalidate_catalog()
+    menu_path = f'/api/v1/menus/{menu_id}'
+    print(f"{'mode':<20} {'url':<56} {'bytes':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    results = {}
+    try:
+        for enabled, mode, accept_encoding in ((True, 'response cache', ''), (True, 'response cache br', 'br, gzip'),
+                                               (False, '@cache', '')):
+            response_cache.enabled = enabled
+            for path, query in ((menu_path, ''), ('/api/v1/menus', 'limit=100'), (menu_path, 'include=submenus,dishes')):
+                results[f'{mode} {path}?{query}'] = await measure(mode, path, query, accept_encoding, requests)
+    finally:
+        response_cache.enabled = True
+        async with async_session_maker() as session:
+            await MenuRepository().delete_menu(menu_id, session)
+        await invalidate_catalog()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.response_cache')
+    parser.add_argument('--dishes', type=int, default=100, help='блюд в субменю')
+    parser.add_argument('--requests', type=int, default=10000, help='запросов на URL и режим')
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.dishes, arguments.requests))
@@ -0,0 +1,81 @@
+"""CPU на сериализацию списка блюд: прежний путь ответа и кэша против одного TypeAdapter.dump_json.
+
+    python -m benchmarks.serialization --items 1000 --rounds 50
+
+БД не нужна: строки - несохраненные объекты models.Dish.
+Прежний путь промаха: jsonable_encoder + json.dumps в кэш, json.loads обратно и валидация
+response_model в FastAPI с повторным json.dumps в JSONResponse; попадания - все, кроме первого шага.
+Новый путь промаха: одна валидация и dump_json, попадание отдает сохраненные байты как есть.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from decimal import Decimal
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.restaurant import models, schemas
+from src.services.cache_services import CachedResponse, entry_encoder
+
+
+def make_dishes(items: int) -> list[models.Dish]:
+    submenu_id = uuid.uuid4()
+    return [models.Dish(id=uuid.uuid4(), submenu_id=submenu_id, title=f'Dish {number}',
+                        description=f'Dish description {number}', price=Decimal(f'{number % 100}.99'), version=1)
+            for number in range(items)]
+
+
+async def measure(call: Callable[[], Awaitable[Any]], rounds: int) -> float:
+    """ лучшее время одного вызова, секунды """
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await call()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def main(items: int, rounds: int) -> None:
+    dishes = make_dishes(items)
+    field = create_response_field('Response_Dishes', list[schemas.Dish])
+    encode_entry = entry_encoder(list[schemas.Dish])
+    cached_body = json.dumps(jsonable_encoder(dishes))
+    entry = encode_entry(dishes)
+
+    async def old_response(body: str) -> bytes:
+        content = await serialize_response(field=field, response_content=json.loads(body))
+        return JSONResponse(content).body
+
+    async def old_miss() -> bytes:
+        return await old_response(json.dumps(jsonable_encoder(dishes)))
+
+    async def old_hit() -> bytes:
+        return await old_response(cached_body)
+
+    async def new_miss() -> bytes:
+        return CachedResponse(encode_entry(dishes), 0).body
+
+    async def new_hit() -> bytes:
+        return CachedResponse(entry, 0).body
+
+    assert json.loads(await old_hit()) == json.loads(await new_hit())
+    print(f'{items} dishes, best of {rounds} rounds, per item:')
+    for name, call in (('before, miss', old_miss), ('before, hit', old_hit),
+                       ('after, miss', new_miss), ('after, hit', new_hit)):
+        seconds = await measure(call, rounds)
+        print(f'{name:>14}: {seconds / items * 1e6:8.2f} us/item  ({seconds * 1e3:.2f} ms total)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.serialization')
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=50)
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.items, arguments.rounds))
@@ -0,0 +1,3 @@
+#!/bin/sh
+# основная БД принимает потоковую репликацию (docker-compose-replica.yml)
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
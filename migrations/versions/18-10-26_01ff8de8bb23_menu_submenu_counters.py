@@ -0,0 +1,33 @@
+"""menu and submenu counters
+
+Revision ID: 01ff8de8bb23
+Revises: f19e21497948
+Create Date: 2026-10-18 10:02:41.318204
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '01ff8de8bb23'
+down_revision = 'f19e21497948'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('menu', sa.Column('submenus_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('menu', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('submenu', sa.Column('dishes_count', sa.Integer(), server_default='0', nullable=False))
+    # заполняем счетчики для существующих данных
+    op.execute('UPDATE submenu SET dishes_count = (SELECT count(*) FROM dish WHERE dish.submenu_id = submenu.id)')
+    op.execute('UPDATE menu SET '
+               'submenus_count = (SELECT count(*) FROM submenu WHERE submenu.menu_id = menu.id), '
+               'dishes_count = (SELECT count(*) FROM dish JOIN submenu ON submenu.id = dish.submenu_id '
+               'WHERE submenu.menu_id = menu.id)')
+
+
+def downgrade() -> None:
+    op.drop_column('submenu', 'dishes_count')
+    op.drop_column('menu', 'dishes_count')
+    op.drop_column('menu', 'submenus_count')
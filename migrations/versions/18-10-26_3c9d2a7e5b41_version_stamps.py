@@ -0,0 +1,31 @@
+"""version stamps
+
+Revision ID: 3c9d2a7e5b41
+Revises: be1654a720b9
+Create Date: 2026-10-18 14:05:32.417093
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3c9d2a7e5b41'
+down_revision = 'be1654a720b9'
+branch_labels = None
+depends_on = None
+
+TABLES = ('menu', 'submenu', 'dish')
+
+
+def upgrade() -> None:
+    # константный server_default: PostgreSQL добавляет колонку без перезаписи таблицы
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True),
+                                       server_default=sa.text('now()'), nullable=False))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,39 @@
+"""on delete cascade
+
+Revision ID: 6b2e8d4f1a93
+Revises: a4d7c3e91f52
+Create Date: 2026-10-18 19:03:47.551280
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6b2e8d4f1a93'
+down_revision = 'a4d7c3e91f52'
+branch_labels = None
+depends_on = None
+
+# (ограничение, таблица, колонка, родитель)
+FOREIGN_KEYS = (('submenu_menu_id_fkey', 'submenu', 'menu_id', 'menu'),
+                ('dish_submenu_id_fkey', 'dish', 'submenu_id', 'submenu'))
+
+
+def replace_foreign_keys(ondelete: str | None) -> None:
+    # NOT VALID: новое ограничение проверяет только новые строки, и замена в транзакции миграции держит
+    # блокировки таблиц недолго; существующие строки проверяет VALIDATE CONSTRAINT отдельной транзакцией,
+    # под SHARE UPDATE EXCLUSIVE - чтение и запись таблиц не ждут, как и в миграциях с CONCURRENTLY
+    for name, table, column, parent in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, parent, [column], ['id'], ondelete=ondelete, postgresql_not_valid=True)
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in FOREIGN_KEYS:
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}')
+
+
+def upgrade() -> None:
+    # дочерние строки удаляет сам PostgreSQL, ORM больше не загружает их перед DELETE
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade() -> None:
+    replace_foreign_keys(None)
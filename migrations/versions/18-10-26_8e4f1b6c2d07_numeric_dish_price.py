@@ -0,0 +1,32 @@
+"""numeric dish price
+
+Revision ID: 8e4f1b6c2d07
+Revises: 3c9d2a7e5b41
+Create Date: 2026-10-18 15:21:48.903526
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8e4f1b6c2d07'
+down_revision = '3c9d2a7e5b41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # цены хранились строками как ввели: '10.99', ' 12,5' - приводим к числу с округлением до копеек
+    op.alter_column('dish', 'price', type_=sa.Numeric(10, 2), existing_nullable=False,
+                    postgresql_using="round(replace(trim(price), ',', '.')::numeric, 2)")
+    # CONCURRENTLY нельзя выполнять внутри транзакции миграции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_dish_submenu_id_price', 'dish', ['submenu_id', 'price', 'id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_dish_submenu_id_price', table_name='dish', postgresql_concurrently=True)
+    op.alter_column('dish', 'price', type_=sa.String(255), existing_nullable=False,
+                    postgresql_using='price::text')
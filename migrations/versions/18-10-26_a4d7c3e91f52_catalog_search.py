@@ -0,0 +1,51 @@
+"""catalog search
+
+Revision ID: a4d7c3e91f52
+Revises: 8e4f1b6c2d07
+Create Date: 2026-10-18 17:42:11.208315
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7c3e91f52'
+down_revision = '8e4f1b6c2d07'
+branch_labels = None
+depends_on = None
+
+# конфигурация russian разбирает латиницу английским стеммером
+SEARCH_VECTOR = ("setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+                 "setweight(to_tsvector('russian', coalesce(description, '')), 'B')")
+TRIGRAM_INDEXES = (('ix_dish_title_trgm', 'dish', 'title'), ('ix_dish_description_trgm', 'dish', 'description'),
+                   ('ix_submenu_title_trgm', 'submenu', 'title'))
+
+
+def upgrade() -> None:
+    # сохраняемая генерируемая колонка: ADD COLUMN перезаписывает таблицу
+    for table in ('dish', 'submenu'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(),
+                                       sa.Computed(SEARCH_VECTOR, persisted=True), nullable=True))
+    # pg_trgm входит в contrib; без него поиск работает без исправления опечаток
+    trigram = op.get_bind().scalar(sa.text("SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+    if trigram:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for table in ('dish', 'submenu'):
+            op.create_index(f'ix_{table}_search_vector', table, ['search_vector'], postgresql_using='gin',
+                            postgresql_concurrently=True)
+        if trigram:
+            for name, table, column in TRIGRAM_INDEXES:
+                op.create_index(name, table, [column], postgresql_using='gin',
+                                postgresql_ops={column: 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in TRIGRAM_INDEXES:
+            # индексов нет, если при upgrade не было pg_trgm
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    for table in ('dish', 'submenu'):
+        # индекс по колонке удаляется вместе с ней
+        op.drop_column(table, 'search_vector')
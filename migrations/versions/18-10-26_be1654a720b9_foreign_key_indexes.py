@@ -0,0 +1,32 @@
+"""foreign key indexes
+
+Revision ID: be1654a720b9
+Revises: f0c545cb6dd3
+Create Date: 2026-10-18 12:40:17.552063
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'be1654a720b9'
+down_revision = 'f0c545cb6dd3'
+branch_labels = None
+depends_on = None
+
+TABLES = ('menu', 'submenu', 'dish')
+
+
+def upgrade() -> None:
+    # UniqueConstraint('id') дублирует первичный ключ. PostgreSQL обычно сворачивает его в PK еще при
+    # CREATE TABLE, поэтому удаляем через IF EXISTS - на базах, где индекс все же создан.
+    for table in TABLES:
+        op.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_id_key')
+    # dish.submenu_id уже покрыт ведущей колонкой ix_dish_submenu_id_id
+    with op.get_context().autocommit_block():
+        op.create_index('ix_submenu_menu_id', 'submenu', ['menu_id'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    # дублирующие уникальные индексы не восстанавливаем
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_submenu_menu_id', table_name='submenu', postgresql_concurrently=True)
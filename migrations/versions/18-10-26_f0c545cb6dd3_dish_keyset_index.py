@@ -0,0 +1,25 @@
+"""dish keyset index
+
+Revision ID: f0c545cb6dd3
+Revises: 01ff8de8bb23
+Create Date: 2026-10-18 11:27:05.904112
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f0c545cb6dd3'
+down_revision = '01ff8de8bb23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY нельзя выполнять внутри транзакции миграции
+    with op.get_context().autocommit_block():
+        op.create_index('ix_dish_submenu_id_id', 'dish', ['submenu_id', 'id'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_dish_submenu_id_id', table_name='dish', postgresql_concurrently=True)
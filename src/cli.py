@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+from src.database import async_session_maker
+from src.services.cache_services import init_cache, invalidate_menu
+from src.services.counter_services import CounterRepository
+from src.services.import_services import (
+    ImportRepository,
+    iterate,
+    parse_json,
+    parse_ndjson,
+)
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def check_counters(repair: bool) -> int:
+    """ проверить (и при --repair исправить) счетчики submenus_count/dishes_count """
+    counters = CounterRepository()
+    async with async_session_maker() as session:
+        if repair:
+            broken = await counters.repair_counters(session)
+        else:
+            broken = await counters.check_counters(session)
+    for table, ids in broken.items():
+        for broken_id in ids:
+            print(f'{table}: {broken_id}')
+    print(f"{'repaired' if repair else 'inconsistent'}: "
+          f"{len(broken['menus'])} menus, {len(broken['submenus'])} submenus")
+    return 1 if not repair and any(broken.values()) else 0
+
+
+async def read_chunks(path: Path) -> AsyncIterator[bytes]:
+    with path.open('rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def import_catalog(path: Path, ndjson: bool) -> int:
+    """ импорт каталога из JSON-файла (массив меню) или NDJSON (меню на строку) """
+    menus = parse_ndjson(read_chunks(path)) if ndjson else iterate(parse_json(path.read_bytes()))
+    async with async_session_maker() as session:
+        imported = await ImportRepository().import_catalog(menus, session)
+    init_cache()
+    await invalidate_menu()
+    print(f"imported: {imported['menus']} menus, {imported['submenus']} submenus, {imported['dishes']} dishes")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.cli')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    counters_parser = commands.add_parser('check-counters', help='проверить денормализованные счетчики')
+    counters_parser.add_argument('--repair', action='store_true', help='пересчитать расходящиеся счетчики')
+
+    import_parser = commands.add_parser('import-catalog', help='импортировать каталог из JSON/NDJSON')
+    import_parser.add_argument('path', type=Path)
+    import_parser.add_argument('--ndjson', action='store_true',
+                               help='меню на строку; по умолчанию для .ndjson/.jsonl')
+
+    args = parser.parse_args()
+    if args.command == 'check-counters':
+        return asyncio.run(check_counters(args.repair))
+    if args.command == 'import-catalog':
+        return asyncio.run(import_catalog(args.path, args.ndjson or args.path.suffix in ('.ndjson', '.jsonl')))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -10,6 +10,59 @@ DB_NAME = os.environ.get('DB_NAME')
 DB_USER = os.environ.get('DB_USER')
 DB_PASS = os.environ.get('DB_PASS')
 
+# пул соединений SQLAlchemy: воркер держит до DB_POOL_SIZE + DB_MAX_OVERFLOW соединений
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# сколько ждать свободное соединение, сек; recycle - пересоздавать соединения старше, сек
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+# кэши подготовленных запросов asyncpg и SQLAlchemy на соединение; за pgbouncer в режиме transaction - 0
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_PREPARED_STATEMENT_CACHE_SIZE', 100))
+
+# реплики для чтения через запятую, 'host:port'; пользователь, пароль и база - как у основной БД
+DB_REPLICAS = [replica.strip() for replica in os.environ.get('DB_REPLICAS', '').split(',') if replica.strip()]
+# реплика, отставшая больше чем на DB_REPLICA_MAX_LAG сек, обходится; отставание проверяется раз в интервал, сек
+DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 2))
+
+# Redis для кэша: пул соединений на воркер и таймауты сокета, сек
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost')
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 0.5))
+# после CACHE_BREAKER_FAILURES ошибок подряд кэш обходится CACHE_BREAKER_RESET сек, потом пробный запрос
+CACHE_BREAKER_FAILURES = int(os.environ.get('CACHE_BREAKER_FAILURES', 5))
+CACHE_BREAKER_RESET = float(os.environ.get('CACHE_BREAKER_RESET', 5))
+# время жизни кэша, сек. Инвалидация по записи позволяет держать его большим
+CACHE_EXPIRE = int(os.environ.get('CACHE_EXPIRE', 3600))
+# локальный (в памяти воркера) уровень кэша перед Redis
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 10000))
+LOCAL_CACHE_MAX_BYTES = int(os.environ.get('LOCAL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# кэш готовых ответов GET перед роутером: байты и заголовки, без зависимостей FastAPI на попадании
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'true').lower() in ('1', 'true', 'yes')
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', LOCAL_CACHE_MAX_ENTRIES))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', LOCAL_CACHE_MAX_BYTES))
+# ответы от RESPONSE_COMPRESS_MIN_SIZE байт сжимаются один раз при сохранении (gzip и brotli);
+# запись живет до первой инвалидации, поэтому уровни средние: максимальные дают на JSON проценты, а стоят в разы дольше
+RESPONSE_COMPRESS_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESS_MIN_SIZE', 512))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', 6))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 5))
+# сколько воркер верит локальной копии поколения, если сообщение pub/sub потерялось
+LOCAL_GENERATION_TTL = float(os.environ.get('LOCAL_GENERATION_TTL', 5))
+# блокировка пересчета промаха между воркерами: сколько она живет и сколько остальные ждут результата, сек
+CACHE_LOCK_TTL = float(os.environ.get('CACHE_LOCK_TTL', 5))
+CACHE_LOCK_WAIT = float(os.environ.get('CACHE_LOCK_WAIT', 1))
+# устаревшая копия значения, которую отдают вместо ожидания, сек
+CACHE_STALE_EXPIRE = int(os.environ.get('CACHE_STALE_EXPIRE', 2 * CACHE_EXPIRE))
+
+# профилирование SQL по запросам: заголовок Server-Timing, поиск N+1 и лог медленных запросов с планом
+SQL_PROFILE = os.environ.get('SQL_PROFILE', 'false').lower() in ('1', 'true', 'yes')
+# запрос одной формы больше стольких раз за HTTP-запрос считается N+1
+SQL_PROFILE_REPEAT_LIMIT = int(os.environ.get('SQL_PROFILE_REPEAT_LIMIT', 5))
+SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 100))
+
 # Тестовая БД
 # DB_HOST_TEST = os.environ.get("DB_HOST_TEST")
 # DB_PORT_TEST = os.environ.get("DB_PORT_TEST")
@@ -1,19 +1,291 @@
-from typing import AsyncGenerator
+import asyncio
+import itertools
+import logging
+import math
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator
 
 import sqlalchemy
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from fastapi import Request, Response
+from sqlalchemy import Engine, event, exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from src.config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from src.config import (
+    DB_HOST,
+    DB_MAX_OVERFLOW,
+    DB_NAME,
+    DB_PASS,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PORT,
+    DB_PREPARED_STATEMENT_CACHE_SIZE,
+    DB_REPLICA_CHECK_INTERVAL,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICAS,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_USER,
+)
+
+logger = logging.getLogger(__name__)
 
 Base = sqlalchemy.orm.declarative_base()
 
-DATABASE_URL = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
-engine = create_async_engine(DATABASE_URL)
+class PoolStats:
+    """ ожидание соединения из пула и его загрузка """
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.checked_out_max = 0
+
+    def observe(self, wait: float, checked_out: int) -> None:
+        self.checkouts += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.checked_out_max = max(self.checked_out_max, checked_out)
+
+
+class QueryStats:
+    """ число SQL-запросов и время в БД """
+
+    def __init__(self) -> None:
+        self.statements = 0
+        self.seconds = 0.0
+
+    def observe(self, seconds: float, statement: str, parameters: Any, db_engine: Engine) -> None:
+        self.statements += 1
+        self.seconds += seconds
+
+
+# все запросы процесса и запросы текущего HTTP-запроса (задает middleware метрик или профилировщика)
+query_totals = QueryStats()
+request_queries: ContextVar[QueryStats | None] = ContextVar('request_queries', default=None)
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """ пул, который считает время ожидания соединения """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self) -> Any:
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        self.stats.observe(time.perf_counter() - started, self.checkedout())
+        return connection
+
+    def capacity(self) -> int:
+        return self.size() + max(self._max_overflow, 0)
+
+    def stats_dict(self) -> dict[str, Any]:
+        stats = self.stats
+        return {
+            'pool_size': self.size(),
+            'max_overflow': self._max_overflow,
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': self.overflow(),
+            # доля занятых соединений от предела пула: 1.0 - новые запросы ждут
+            'saturation': round(self.checkedout() / self.capacity(), 4),
+            'saturation_max': round(stats.checked_out_max / self.capacity(), 4),
+            'checkouts': stats.checkouts,
+            'timeouts': stats.timeouts,
+            'wait_seconds_total': round(stats.wait_seconds_total, 6),
+            'wait_seconds_avg': round(stats.wait_seconds_total / stats.checkouts, 6) if stats.checkouts else None,
+            'wait_seconds_max': round(stats.wait_seconds_max, 6),
+        }
+
+
+def make_engine(host: str | None, port: str | None) -> AsyncEngine:
+    db_engine = create_async_engine(
+        f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{host}:{port}/{DB_NAME}',
+        poolclass=MeteredPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+                      'prepared_statement_cache_size': DB_PREPARED_STATEMENT_CACHE_SIZE},
+    )
+    event.listen(db_engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(db_engine.sync_engine, 'after_cursor_execute', after_cursor_execute)
+    return db_engine
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info.pop('query_started')
+    query_totals.observe(seconds, statement, parameters, conn.engine)
+    stats = request_queries.get()
+    if stats is not None:
+        stats.observe(seconds, statement, parameters, conn.engine)
+
+
+engine = make_engine(DB_HOST, DB_PORT)
+
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)  # type: ignore
 
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
+def pool_stats() -> dict[str, Any]:
+    return engine.pool.stats_dict()  # type: ignore
+
+
+# отставание реплики, сек; у сервера не в режиме восстановления (не реплика) отставания нет
+REPLICA_LAG = text('SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 '
+                   'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                   'ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END')
+
+
+# cookie писавшего клиента с unix-временем, до которого его чтения идут в основную БД
+PRIMARY_COOKIE = 'read_primary_until'
+# сессия текущего запроса открыта на реплике: см. ReplicaSet.fill_expire
+read_replica: ContextVar[bool] = ContextVar('read_replica', default=False)
+
+
+class Replica:
+    """ реплика для чтения: свой пул и результат последней проверки """
+
+    def __init__(self, name: str, replica_engine: AsyncEngine):
+        self.name = name
+        self.engine = replica_engine
+        self.session_maker = sessionmaker(replica_engine, class_=AsyncSession,  # type: ignore
+                                          expire_on_commit=False)
+        # до первой проверки реплика не используется
+        self.healthy = False
+        self.lag: float | None = None
+
+    async def measure_lag(self) -> float | None:
+        async with self.engine.connect() as connection:
+            lag = await connection.scalar(REPLICA_LAG)
+        return None if lag is None else float(lag)
+
+    async def check(self, max_lag: float, timeout: float) -> None:
+        try:
+            self.lag = await asyncio.wait_for(self.measure_lag(), timeout)
+        except Exception:
+            if self.healthy:
+                logger.warning('Read replica %s is unavailable, reading from primary', self.name, exc_info=True)
+            self.healthy, self.lag = False, None
+            return
+        # NULL - реплика еще не применила ни одной транзакции
+        healthy = self.lag is not None and self.lag <= max_lag
+        if self.healthy and not healthy:
+            logger.warning('Read replica %s lags %s s, reading from primary', self.name, self.lag)
+        elif healthy and not self.healthy:
+            logger.info('Read replica %s is in rotation', self.name)
+        self.healthy = healthy
+
+    def stats_dict(self) -> dict[str, Any]:
+        return {'name': self.name, 'healthy': self.healthy, 'lag_seconds': self.lag,
+                **self.engine.pool.stats_dict()}  # type: ignore
+
+
+class ReplicaSet:
+    """ чтение по кругу из исправных реплик; клиент сразу после своей записи читает из основной БД """
+
+    def __init__(self, replicas: list[Replica], max_lag: float, check_interval: float):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.turn = itertools.count()
+        # время (monotonic) последней инвалидации кэша: своей записи или сообщения другого воркера
+        self.invalidated_at = float('-inf')
+        self.task: asyncio.Task | None = None
+        self.sessions = {'primary': 0, **{replica.name: 0 for replica in replicas}}
+
+    @property
+    def window(self) -> float:
+        """ сколько реплики могут не видеть запись: отставание в ротации - до max_lag и еще интервал до проверки """
+        return self.max_lag + self.check_interval
+
+    def note_invalidation(self) -> None:
+        self.invalidated_at = time.monotonic()
+
+    def fill_expire(self, expire: int) -> int:
+        """ срок записи кэша, только что прочитанной из БД: прочитанное из реплики в окне после инвалидации
+        может не содержать записи, такое значение не кэшируется (0) """
+        if read_replica.get() and time.monotonic() < self.invalidated_at + self.window:
+            return 0
+        return expire
+
+    def choose(self) -> Replica | None:
+        if not self.replicas:
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        return healthy[next(self.turn) % len(healthy)] if healthy else None
+
+    async def check(self) -> None:
+        await asyncio.gather(*(replica.check(self.max_lag, self.check_interval) for replica in self.replicas))
+
+    async def monitor(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        if self.replicas and self.task is None:
+            self.task = asyncio.create_task(self.monitor())
+
+
+def parse_replica(replica: str) -> tuple[str, str]:
+    host, _, port = replica.partition(':')
+    return host, port or '5432'
+
+
+replicas = ReplicaSet([Replica(replica, make_engine(*parse_replica(replica))) for replica in DB_REPLICAS],
+                      DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL)
+
+
+def all_engines() -> list[AsyncEngine]:
+    return [engine, *(replica.engine for replica in replicas.replicas)]
+
+
+def replica_stats() -> list[dict[str, Any]]:
+    return [replica.stats_dict() for replica in replicas.replicas]
+
+
+def pinned_to_primary(request: Request) -> bool:
+    """ клиент недавно писал: cookie PRIMARY_COOKIE хранит unix-время, до которого он читает из основной БД """
+    try:
+        return float(request.cookies.get(PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def fresh_read(request: Request) -> bool:
+    """ no-cache или недавняя запись этого клиента: мимо кэша и мимо реплик """
+    return request.headers.get('Cache-Control') in ('no-cache', 'no-store') or pinned_to_primary(request)
+
+
+def reads_from_replica(request: Request) -> bool:
+    return request.method in ('GET', 'HEAD') and not fresh_read(request)
+
+
+async def get_async_session(request: Request, response: Response) -> AsyncGenerator[AsyncSession, None]:
+    """ GET - из реплики, если есть исправная; запись и чтение писавшего клиента сразу после записи - из основной БД """
+    replica = replicas.choose() if reads_from_replica(request) else None
+    if replicas.replicas and request.method not in ('GET', 'HEAD'):
+        # read-your-writes только для писавшего клиента: остальные продолжают читать из реплик
+        response.set_cookie(PRIMARY_COOKIE, f'{time.time() + replicas.window:.3f}',
+                            max_age=math.ceil(replicas.window), httponly=True)
+    read_replica.set(replica is not None)
+    replicas.sessions[replica.name if replica else 'primary'] += 1
+    async with (replica.session_maker if replica else async_session_maker)() as session:
         yield session
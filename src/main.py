@@ -1,7 +1,19 @@
 from fastapi import FastAPI
 
+from src.config import SQL_PROFILE
+from src.metrics import MetricsMiddleware
+from src.profiler import ProfilerMiddleware, enable_profiling
+from src.response_cache import ResponseCacheMiddleware
 from src.restaurant.endpoint import router
 
 app = FastAPI(title='Restaurant')
 
 app.include_router(router)
+# внутри метрик и профилировщика: попадания учитываются по своему маршруту
+app.add_middleware(ResponseCacheMiddleware)
+app.add_middleware(MetricsMiddleware)
+# снаружи метрик: EXPLAIN медленных запросов не засчитывается HTTP-запросу
+app.add_middleware(ProfilerMiddleware)
+
+if SQL_PROFILE:
+    enable_profiling()
@@ -0,0 +1,201 @@
+"""Метрики в текстовом формате Prometheus.
+
+Счетчики обновляются на горячем пути только сложением в словаре (гистограмма - плюс bisect
+по границам корзин), текст собирается при запросе /metrics.
+"""
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator, Mapping
+from typing import Any
+
+from src.database import QueryStats, pool_stats, query_totals, replicas, request_queries
+
+# charset добавляет PlainTextResponse
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+REGISTRY: list['Metric'] = []
+
+Labels = tuple[str, ...]
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: Labels, values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.kind}'
+        yield from self.samples()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f'{self.name}{format_labels(self.labels, labels)} {value}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Labels = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # по меткам: [число наблюдений в каждой корзине и в +Inf, сумма]
+        self.values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                bucket = format_labels(self.labels, labels, f'le="{bound}"')
+                yield f'{self.name}_bucket{bucket} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, labels)} {total[0]}'
+            yield f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}'
+
+
+class CallbackMetric(Metric):
+    """ значения читаются при сборе: callback -> {метки: значение} """
+
+    def __init__(self, name: str, documentation: str, kind: str, callback: Callable[[], dict[Labels, float]],
+                 labels: Labels = ()):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.callback().items():
+            yield f'{self.name}{format_labels(self.labels, labels)} {value}'
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+def route_label(scope: Mapping[str, Any]) -> str:
+    """ шаблон пути маршрута: id в пути не размножают серии метрик """
+    route = scope.get('route')
+    return getattr(route, 'path_format', None) or '<unmatched>'
+
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests', ('method', 'route', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'HTTP request latency', ('method', 'route'))
+IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being processed', ('method',))
+REQUEST_STATEMENTS = Histogram('http_request_db_statements', 'SQL statements per HTTP request',
+                               ('method', 'route'), STATEMENT_BUCKETS)
+REQUEST_DB_DURATION = Histogram('http_request_db_duration_seconds', 'Time in SQL statements per HTTP request',
+                                ('method', 'route'))
+
+CallbackMetric('db_statements_total', 'SQL statements executed', 'counter',
+               lambda: {(): query_totals.statements})
+CallbackMetric('db_statement_duration_seconds_total', 'Time in SQL statements', 'counter',
+               lambda: {(): round(query_totals.seconds, 6)})
+# метрика: (ключ pool_stats(), тип, описание)
+POOL_METRICS = {
+    'db_pool_size': ('pool_size', 'gauge', 'Connections kept in the pool'),
+    'db_pool_max_overflow': ('max_overflow', 'gauge', 'Connections allowed above pool_size'),
+    'db_pool_checked_out': ('checked_out', 'gauge', 'Connections in use'),
+    'db_pool_overflow': ('overflow', 'gauge', 'Connections opened above pool_size'),
+    'db_pool_checkouts_total': ('checkouts', 'counter', 'Connection checkouts'),
+    'db_pool_timeouts_total': ('timeouts', 'counter', 'Checkouts that timed out waiting for a connection'),
+    'db_pool_wait_seconds_total': ('wait_seconds_total', 'counter', 'Time spent waiting for a connection'),
+}
+
+
+def pool_stat(stat: str) -> Callable[[], dict[Labels, float]]:
+    return lambda: {(): pool_stats()[stat]}
+
+
+for metric_name, (stat, kind, documentation) in POOL_METRICS.items():
+    CallbackMetric(metric_name, documentation, kind, pool_stat(stat))
+
+
+CallbackMetric('db_replica_lag_seconds', 'Replication lag at the last check', 'gauge',
+               lambda: {(replica.name,): replica.lag for replica in replicas.replicas if replica.lag is not None},
+               ('replica',))
+CallbackMetric('db_replica_healthy', 'Replica is in the read rotation', 'gauge',
+               lambda: {(replica.name,): int(replica.healthy) for replica in replicas.replicas}, ('replica',))
+CallbackMetric('db_sessions_total', 'Request sessions by database', 'counter',
+               lambda: {(target,): count for target, count in replicas.sessions.items()}, ('target',))
+
+
+class MetricsMiddleware:
+    """ ASGI middleware: задержка, статус, запросы к БД и время в БД по маршрутам """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        method = scope['method']
+        status = ['500']
+
+        async def send_with_status(message: dict[str, Any]) -> None:
+            if message['type'] == 'http.response.start':
+                status[0] = str(message['status'])
+            await send(message)
+
+        # с профилированием запросы уже пишутся в профиль запроса (см. ProfilerMiddleware) - считаем по нему же
+        stats = request_queries.get() or QueryStats()
+        token = request_queries.set(stats)
+        IN_FLIGHT.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            IN_FLIGHT.dec(method)
+            request_queries.reset(token)
+            route = route_label(scope)
+            REQUESTS.inc(method, route, status[0])
+            REQUEST_DURATION.observe(duration, method, route)
+            REQUEST_STATEMENTS.observe(stats.statements, method, route)
+            REQUEST_DB_DURATION.observe(stats.seconds, method, route)
@@ -0,0 +1,134 @@
+"""Профилирование SQL по HTTP-запросам (SQL_PROFILE).
+
+Пока профилирование включено, каждый запрос к БД записывается в профиль текущего HTTP-запроса:
+профиль задается как статистика запросов (request_queries), ее заполняют слушатели src.database.
+По завершении запроса повторы одной формы запроса сверх SQL_PROFILE_REPEAT_LIMIT логируются
+как возможный N+1, а запросы дольше SQL_SLOW_QUERY_MS - с параметрами и планом (EXPLAIN на той же БД,
+основной или реплике). Отчет строится в фоне, после ответа: медленный запрос не ждет EXPLAIN.
+Ответ получает заголовок Server-Timing со временем в БД и числом запросов.
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import Counter
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from typing import Any
+
+from sqlalchemy import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import SQL_PROFILE_REPEAT_LIMIT, SQL_SLOW_QUERY_MS
+from src.database import QueryStats, all_engines, engine, request_queries
+from src.metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+# список плейсхолдеров IN (...) разной длины - одна форма запроса
+PLACEHOLDERS = re.compile(r'\$\d+(?:, \$\d+)*')
+
+
+class RequestProfile(QueryStats):
+    """ SQL-запросы одного HTTP-запроса: (текст, параметры, секунды, движок) """
+
+    def __init__(self, method: str) -> None:
+        super().__init__()
+        self.method = method
+        self.route = ''
+        self.queries: list[tuple[str, Any, float, Engine]] = []
+
+    def observe(self, seconds: float, statement: str, parameters: Any, db_engine: Engine) -> None:
+        super().observe(seconds, statement, parameters, db_engine)
+        self.queries.append((statement, parameters, seconds, db_engine))
+
+    def repeated(self, limit: int) -> dict[str, int]:
+        """ формы запросов, выполненные больше limit раз """
+        shapes = Counter(PLACEHOLDERS.sub('$?', statement) for statement, _, _, _ in self.queries)
+        return {shape: count for shape, count in shapes.items() if count > limit}
+
+    def slow(self, threshold_ms: float) -> list[tuple[str, Any, float, Engine]]:
+        return [query for query in self.queries if query[2] * 1000 >= threshold_ms]
+
+
+# профили завершенных запросов для проверок в тестах, см. record_profiles
+recorded: list[RequestProfile] | None = None
+# отчеты в фоне: ссылки держим, пока задача не завершится
+reports: set[asyncio.Task] = set()
+enabled = False
+
+
+def enable_profiling() -> None:
+    global enabled
+    enabled = True
+
+
+@contextmanager
+def record_profiles() -> Iterator[list[RequestProfile]]:
+    """ собрать профили HTTP-запросов, завершенных внутри блока """
+    global recorded
+    enable_profiling()
+    recorded = []
+    try:
+        yield recorded
+    finally:
+        recorded = None
+
+
+async def explain(statement: str, parameters: Any, db_engine: Engine) -> str:
+    # EXPLAIN - на той БД, где выполнялся запрос: план реплики может отличаться
+    target: AsyncEngine = next((candidate for candidate in all_engines() if candidate.sync_engine is db_engine), engine)
+    async with target.connect() as connection:
+        plan = await connection.exec_driver_sql(f'EXPLAIN {statement}', parameters)
+        return '\n'.join(plan.scalars())
+
+
+async def report(profile: RequestProfile) -> None:
+    for shape, count in profile.repeated(SQL_PROFILE_REPEAT_LIMIT).items():
+        logger.warning('Possible N+1: %s %s ran the same statement %s times: %s',
+                       profile.method, profile.route, count, shape)
+    for statement, parameters, seconds, db_engine in profile.slow(SQL_SLOW_QUERY_MS):
+        try:
+            plan = await explain(statement, parameters, db_engine) if isinstance(parameters, tuple) else ''
+        except Exception as error:
+            plan = f'EXPLAIN failed: {error}'
+        logger.warning('Slow query (%.1f ms) in %s %s: %s\nparameters: %r\n%s', seconds * 1000,
+                       profile.method, profile.route, statement, parameters, plan)
+
+
+def server_timing(profile: RequestProfile, started: float) -> str:
+    return (f'db;dur={profile.seconds * 1000:.1f};desc="statements: {profile.statements}", '
+            f'app;dur={(time.perf_counter() - started) * 1000:.1f}')
+
+
+class ProfilerMiddleware:
+    """ ASGI middleware профилирования; пока профилирование выключено, только проверяет флаг """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Mapping[str, Any], receive: Any, send: Any) -> None:
+        if not enabled or scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        profile = RequestProfile(scope['method'])
+        started = time.perf_counter()
+
+        async def send_with_timing(message: dict[str, Any]) -> None:
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', server_timing(profile, started).encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        token = request_queries.set(profile)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_queries.reset(token)
+            profile.route = route_label(scope)
+            if recorded is not None:
+                recorded.append(profile)
+            if profile.repeated(SQL_PROFILE_REPEAT_LIMIT) or profile.slow(SQL_SLOW_QUERY_MS):
+                task = asyncio.create_task(report(profile))
+                reports.add(task)
+                task.add_done_callback(reports.discard)
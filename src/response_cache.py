@@ -0,0 +1,252 @@
+"""Кэш готовых ответов GET перед роутером (RESPONSE_CACHE).
+
+До поиска в @cache FastAPI успевает проверить параметры, открыть сессию БД и создать репозитории.
+Middleware сам сопоставляет запрос с маршрутом, у которого есть @cache, и строит ключ из пути
+с каноническими UUID, объявленных маршрутом параметров запроса и поколений тех же тегов, что у @cache.
+На попадании сохраненные байты и заголовки уходят клиенту без роутера и зависимостей, на промахе
+ответ 200 с max-age перехватывается и сохраняется в памяти воркера на оставшийся срок записи @cache.
+Инвалидация общая с @cache: новое поколение тега - новый ключ, старые записи вытесняет LRU.
+Тело от RESPONSE_COMPRESS_MIN_SIZE байт сжимается gzip и brotli один раз при сохранении
+(одновременные промахи по ключу сжимают его один раз),
+попадание отдает готовый вариант по Accept-Encoding с Vary: Accept-Encoding.
+"""
+import asyncio
+import gzip
+import re
+from collections.abc import Awaitable, Callable, MutableMapping
+from functools import lru_cache
+from typing import Any
+from urllib.parse import parse_qsl, urlencode
+from uuid import UUID
+
+import brotli  # type: ignore[import]
+from fastapi.dependencies.utils import get_flat_dependant
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.routing import BaseRoute, Match
+
+from src.config import (
+    RESPONSE_BROTLI_QUALITY,
+    RESPONSE_CACHE,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_COMPRESS_MIN_SIZE,
+    RESPONSE_GZIP_LEVEL,
+)
+from src.database import fresh_read
+from src.metrics import CallbackMetric
+from src.services.cache_services import (
+    BYPASS,
+    CACHE_REQUESTS,
+    PREFIX,
+    etag_matches,
+    get_backend,
+    resolve_tags,
+    tags_version,
+)
+from src.services.local_cache_services import LocalCache, SingleFlight
+
+KEY_PREFIX = f'{PREFIX}:asgi'
+MAX_AGE = re.compile(rb'max-age=(\d+)')
+VARY = (b'vary', b'Accept-Encoding')
+# сжатия в порядке предпочтения при равном q
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {
+    'br': lambda body: brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY),
+    'gzip': lambda body: gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0),
+}
+
+RawHeaders = list[tuple[bytes, bytes]]
+
+responses = LocalCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+# сборка StoredResponse (со сжатием) по ключу
+builds = SingleFlight()
+enabled = RESPONSE_CACHE
+
+CallbackMetric('cache_response_bytes', 'Size of responses in the ASGI response cache', 'gauge',
+               lambda: {(): responses.size})
+
+
+@lru_cache(maxsize=256)
+def accepted_encodings(accept_encoding: str) -> tuple[str, ...]:
+    """ поддерживаемые сжатия из Accept-Encoding по убыванию q; при равном q brotli раньше gzip """
+    weights = {}
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        weights[coding.strip()] = quality
+    ranked = [(weights.get(coding, weights.get('*', 0.0)), coding) for coding in COMPRESSORS]
+    return tuple(coding for quality, coding in sorted(ranked, key=lambda item: -item[0]) if quality > 0)
+
+
+def compressible(headers: RawHeaders, body: bytes) -> bool:
+    content_type = next((value for name, value in headers if name.lower() == b'content-type'), b'')
+    if any(name.lower() == b'content-encoding' for name, _ in headers):
+        return False
+    return len(body) >= RESPONSE_COMPRESS_MIN_SIZE and content_type.startswith((b'application/json', b'text/'))
+
+
+class StoredResponse:
+    """ ответ 200 для повторной отправки: тело без сжатия и сжатые варианты с готовыми заголовками
+
+    Сжатие выполняется один раз при сохранении, попадание только выбирает вариант по Accept-Encoding.
+    ETag сжатого варианта слабый (W/): байты другие, а If-None-Match сравнивается слабо и совпадает
+    с любым вариантом. Cache-Control собирается заново из остатка срока записи.
+    """
+
+    def __init__(self, headers: RawHeaders, body: bytes):
+        etag = self.etag = next((value.decode() for name, value in headers if name.lower() == b'etag'), None)
+        headers = [*((name, value) for name, value in headers
+                     if name.lower() not in (b'cache-control', b'content-length', b'etag')), VARY]
+        self.variants = {'identity': self.variant(headers, body, etag)}
+        if compressible(headers, body):
+            for encoding, compress in COMPRESSORS.items():
+                encoded = compress(body)
+                if len(encoded) < len(body):
+                    self.variants[encoding] = self.variant(
+                        [*headers, (b'content-encoding', encoding.encode())], encoded, etag and f'W/{etag}')
+        self.size = sum(len(encoded) + sum(len(name) + len(value) for name, value in variant_headers)
+                        for variant_headers, encoded, _ in self.variants.values())
+
+    @staticmethod
+    def variant(headers: RawHeaders, body: bytes, etag: str | None) -> tuple[RawHeaders, bytes, bytes | None]:
+        headers = [*headers, (b'content-length', str(len(body)).encode())]
+        if etag is not None:
+            headers.append((b'etag', etag.encode()))
+        return headers, body, None if etag is None else etag.encode()
+
+    async def send(self, send: Callable[[dict[str, Any]], Awaitable[None]], ttl: int,
+                   if_none_match: str | None, accept_encoding: str | None) -> None:
+        encodings = accepted_encodings(accept_encoding) if accept_encoding else ()
+        encoding = next((encoding for encoding in encodings if encoding in self.variants), 'identity')
+        headers, body, etag = self.variants[encoding]
+        cache_control = (b'cache-control', f'max-age={ttl}'.encode())
+        if etag is not None and self.etag is not None and etag_matches(if_none_match, self.etag):
+            await send({'type': 'http.response.start', 'status': 304,
+                        'headers': [(b'etag', etag), VARY, cache_control]})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [*headers, cache_control]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class CachedRoute:
+    """ маршрут с @cache: теги ключа, параметры запроса, от которых зависит ответ, и UUID в пути """
+
+    def __init__(self, route: APIRoute):
+        dependant = get_flat_dependant(route.dependant)
+        self.route = route
+        self.tags = route.endpoint.cache_tags  # type: ignore[attr-defined]
+        self.query_names = frozenset(field.alias for field in dependant.query_params)
+        self.uuid_params = frozenset(field.alias for field in dependant.path_params if field.type_ is UUID)
+
+    async def key(self, scope: dict[str, Any], path_params: dict[str, str], headers: Headers) -> str | None:
+        """ ключ ответа; None - запрос идет мимо кэша (неверный UUID или поколения недоступны) """
+        params = dict(path_params)
+        for name in self.uuid_params:
+            try:
+                params[name] = str(UUID(params[name]))
+            except ValueError:
+                # ответит 422 сам обработчик
+                return None
+        # незнакомые обработчику параметры на ответ не влияют и ключ не размножают
+        pairs = parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+        query = sorted((name, value) for name, value in pairs if name in self.query_names)
+        version = await tags_version(resolve_tags(self.tags, {**dict(query), **params}))
+        if version == BYPASS:
+            return None
+        # хост и схема - в ключе: из них собирается ссылка Link на следующую страницу
+        return (f"{scope['scheme']}://{headers.get('host', '')}{self.route.path_format.format(**params)}"
+                f'?{urlencode(query)}:{version}')
+
+
+class ResponseCacheMiddleware:
+    """ ASGI middleware: ответы GET маршрутов с @cache из памяти воркера, до роутера и зависимостей """
+
+    def __init__(self, app: Any):
+        self.app = app
+        # id маршрута -> CachedRoute или None, если у маршрута нет @cache
+        self.routes: dict[int, CachedRoute | None] = {}
+
+    def match(self, scope: dict[str, Any]) -> tuple[CachedRoute, MutableMapping[str, Any]] | None:
+        """ первый полностью совпавший маршрут, как в роутере Starlette """
+        route: BaseRoute
+        for route in scope['app'].router.routes:
+            match, child_scope = route.matches(scope)
+            if match is not Match.FULL:
+                continue
+            if id(route) not in self.routes:
+                cacheable = isinstance(route, APIRoute) and getattr(route.endpoint, 'cache_tags', None) is not None
+                self.routes[id(route)] = CachedRoute(route) if cacheable else None  # type: ignore[arg-type]
+            cached_route = self.routes[id(route)]
+            return None if cached_route is None else (cached_route, child_scope)
+        return None
+
+    async def __call__(self, scope: dict[str, Any], receive: Any, send: Any) -> None:
+        if not enabled or scope['type'] != 'http' or scope['method'] != 'GET':
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        if fresh_read(Request(scope)):
+            return await self.app(scope, receive, send)
+        matched = self.match(scope)
+        if matched is None:
+            return await self.app(scope, receive, send)
+        cached_route, child_scope = matched
+        route = cached_route.route.path_format
+        key = await cached_route.key(scope, child_scope['path_params'], headers)
+        if key is None:
+            CACHE_REQUESTS.inc(route, KEY_PREFIX, 'bypass')
+            return await self.app(scope, receive, send)
+        ttl, stored = responses.get_with_ttl(key)
+        get_backend().stats.hit('response', stored is not None)
+        if stored is not None:
+            CACHE_REQUESTS.inc(route, KEY_PREFIX, 'hit')
+            # маршрут в scope - для меток метрик и профилировщика, роутер на попадании не вызывается
+            scope.update(child_scope)
+            return await stored.send(send, ttl, headers.get('if-none-match'), headers.get('accept-encoding'))
+        CACHE_REQUESTS.inc(route, KEY_PREFIX, 'miss')
+
+        start: dict[str, Any] = {}
+        chunks: list[bytes] = []
+        complete = [False]
+
+        async def capture(message: dict[str, Any]) -> None:
+            if message['type'] == 'http.response.start':
+                start.update(message)
+                if message['status'] in (200, 304):
+                    # промах уходит без сжатия, попадания - в сжатом варианте: ответ зависит от Accept-Encoding
+                    message = {**message, 'headers': [*message.get('headers', []), VARY]}
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+                complete[0] = not message.get('more_body', False)
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        if start.get('status') != 200 or not complete[0]:
+            return
+        response_headers: RawHeaders = list(start.get('headers', []))
+        cache_control = next((value for name, value in response_headers if name.lower() == b'cache-control'), b'')
+        max_age = MAX_AGE.search(cache_control)
+        # max-age=0 - ответ из БД в обход кэша или устаревшая копия: не сохраняем
+        if max_age is None or max_age.group(1) == b'0':
+            return
+        # одновременные промахи по ключу сохраняют ответ один раз: остальные уже отдали свой и выходят
+        if key in builds or responses.get_with_ttl(key)[1] is not None:
+            return
+        stored_key, body, expire = key, b''.join(chunks), int(max_age.group(1))
+        await builds.do(key, lambda: self.store(stored_key, response_headers, body, expire))
+
+    @staticmethod
+    async def store(key: str, headers: RawHeaders, body: bytes, max_age: int) -> None:
+        # сжатие - в потоке: клиент промаха уже получил ответ, цикл событий не ждет brotli
+        if compressible(headers, body):
+            stored = await asyncio.to_thread(StoredResponse, headers, body)
+        else:
+            stored = StoredResponse(headers, body)
+        responses.set(key, stored, max_age, stored.size)
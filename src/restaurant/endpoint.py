@@ -1,73 +1,187 @@
+from decimal import Decimal
+from typing import Any
 from uuid import UUID
 
-import aioredis
-from fastapi import APIRouter, Depends
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from fastapi_cache.decorator import cache
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from src.database import get_async_session
+from src.config import CACHE_EXPIRE
+from src.database import get_async_session, pool_stats, replica_stats, replicas
+from src.metrics import CONTENT_TYPE, render_metrics, route_label
+from src.response_cache import responses
 from src.restaurant import schemas
+from src.services.cache_services import (
+    CATALOG,
+    DISH,
+    DISHES,
+    MENU,
+    MENU_CONTENT,
+    MENU_TREE,
+    MENUS,
+    MENUS_TREE,
+    SUBMENU,
+    SUBMENU_TREE,
+    SUBMENUS,
+    batch_get,
+    batch_response,
+    cache,
+    dish_tags,
+    get_backend,
+    hierarchy_key_builder,
+    included,
+    init_cache,
+    invalidate_dish,
+    invalidate_menu,
+    invalidate_submenu,
+    start_invalidation_listener,
+    submenu_tags,
+)
 from src.services.dish_services import DishRepository
+from src.services.export_services import ExportRepository
+from src.services.import_services import (
+    ImportRepository,
+    iterate,
+    parse_json,
+    parse_ndjson,
+)
 from src.services.menu_services import MenuRepository
+from src.services.pagination_services import decode_cursor, link_next_page
+from src.services.search_services import SearchRepository, normalize_query
 from src.services.submenu_services import SubMenuRepository
 
 router = APIRouter()
 
-CACHE_TIME = 30
+CACHE_TIME = CACHE_EXPIRE
+MENU_INCLUDES = {'submenus', 'dishes'}
+SEARCH_MAX_LIMIT = 100
+
+dish_adapter = TypeAdapter(schemas.Dish)
+submenu_adapter = TypeAdapter(schemas.Submenu)
 
 
 @router.on_event('startup')
 async def startup_event():
     """ redis """
-    redis = aioredis.from_url('redis://localhost', encoding='utf8', decode_responses=True)
-    FastAPICache.init(RedisBackend(redis), prefix='fastapi-cache')
+    init_cache()
+    start_invalidation_listener()
+    replicas.start()
+
+
+@router.get('/api/v1/cache/stats')
+async def cache_stats_handler():
+    """ попадания в локальный и Redis уровни кэша """
+    backend = get_backend()
+    return {**backend.stats.as_dict(), 'local_entries': len(backend.local), 'local_bytes': backend.local.size,
+            'breaker_state': backend.breaker.state, 'breaker_opened': backend.breaker.opened,
+            'breaker_rejected': backend.breaker.rejected,
+            'response_entries': len(responses), 'response_bytes': responses.size}
+
+
+@router.get('/api/v1/db/stats')
+async def db_stats_handler():
+    """ загрузка пула соединений и время ожидания соединения; у реплик - еще отставание """
+    return {**pool_stats(), 'replicas': replica_stats(), 'sessions': replicas.sessions}
+
+
+@router.get('/metrics', include_in_schema=False)
+async def metrics_handler():
+    """ метрики для Prometheus """
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
 
 
 # Определяем CRUD операции для модели Menu
 @router.get('/api/v1/menus', response_model=list[schemas.Menu])
-@cache(expire=CACHE_TIME)
-async def read_menus_handler(skip: int = 0, limit: int = 100, menu: MenuRepository = Depends(),
+@link_next_page
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENUS), response_model=list[schemas.Menu])
+async def read_menus_handler(skip: int = 0, limit: int = 100, cursor: str | None = None,
+                             menu: MenuRepository = Depends(),
                              session: AsyncSession = Depends(get_async_session)):
-    """ получить меню """
-    return await menu.get_menus(skip, limit, session)
+    """ получить меню, следующая страница - по курсору из заголовка Link """
+    return await menu.get_menus(skip, limit, session, decode_cursor(cursor))
 
 
 @router.post('/api/v1/menus', response_model=schemas.Menu, status_code=status.HTTP_201_CREATED)
 async def create_menu_handler(menu_data: schemas.MenuCreate, menu: MenuRepository = Depends(),
                               session: AsyncSession = Depends(get_async_session)):
     """ создать меню """
-    return await menu.create_menu(menu_data, session)
+    db_menu = await menu.create_menu(menu_data, session)
+    await invalidate_menu()
+    return db_menu
 
 
-@router.get('/api/v1/menus/{menu_id}', response_model=schemas.Menu)
-@cache(expire=CACHE_TIME)
-async def read_menu_handler(menu_id: UUID, menu: MenuRepository = Depends(),
+@router.post('/api/v1/menus/import', status_code=status.HTTP_201_CREATED)
+async def import_catalog_handler(request: Request, catalog: ImportRepository = Depends(),
+                                 session: AsyncSession = Depends(get_async_session)):
+    """ импорт каталога: JSON-массив меню или application/x-ndjson, по меню на строку """
+    if request.headers.get('content-type', '').startswith('application/x-ndjson'):
+        menus = parse_ndjson(request.stream())
+    else:
+        menus = iterate(parse_json(await request.body()))
+    imported = await catalog.import_catalog(menus, session)
+    await invalidate_menu()
+    return imported
+
+
+@router.get('/api/v1/menus/export')
+async def export_catalog_handler(export_format: str = Query('ndjson', alias='format', pattern='^(ndjson|csv)$'),
+                                 catalog: ExportRepository = Depends()):
+    """ потоковая выгрузка всего каталога: строка на блюдо, NDJSON или CSV """
+    if export_format == 'csv':
+        return StreamingResponse(catalog.export_csv(), media_type='text/csv',
+                                 headers={'Content-Disposition': 'attachment; filename=catalog.csv'})
+    return StreamingResponse(catalog.export_ndjson(), media_type='application/x-ndjson')
+
+
+@router.get('/api/v1/menus/tree', response_model=list[schemas.MenuTree])
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENUS_TREE),
+       response_model=list[schemas.MenuTree])
+async def read_menus_tree_handler(menu: MenuRepository = Depends(),
+                                  session: AsyncSession = Depends(get_async_session)):
+    """ получить все меню с субменю и блюдами """
+    return await menu.get_menus_tree(session)
+
+
+@router.get('/api/v1/menus/{menu_id}', response_model=schemas.MenuTree, response_model_exclude_unset=True)
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENU, included('include', MENU_CONTENT)),
+       response_model=schemas.MenuTree, exclude_unset=True)
+async def read_menu_handler(menu_id: UUID, include: str | None = None, menu: MenuRepository = Depends(),
                             session: AsyncSession = Depends(get_async_session)):
-    """ получить меню по id """
-    return await menu.read_menu(menu_id, session)
+    """ получить меню по id, include=submenus,dishes добавляет вложенные субменю и блюда """
+    if not include:
+        return await menu.read_menu(menu_id, session)
+    includes = set(include.split(','))
+    if not includes <= MENU_INCLUDES:
+        raise HTTPException(status_code=422, detail=f'include must be a subset of {sorted(MENU_INCLUDES)}')
+    # без блюд у субменю нет поля dishes: response_model_exclude_unset и кэш отдают только заданные поля
+    return await menu.read_menu_tree(menu_id, 'dishes' in includes, session)
 
 
 @router.patch('/api/v1/menus/{menu_id}', response_model=schemas.Menu)
 async def update_menu_handler(menu_id: UUID, menu_data: schemas.MenuUpdate, menu: MenuRepository = Depends(),
                               session: AsyncSession = Depends(get_async_session)):
     """ изменить меню """
-    return await menu.update_menu(menu_id, menu_data, session)
+    db_menu = await menu.update_menu(menu_id, menu_data, session)
+    await invalidate_menu(menu_id)
+    return db_menu
 
 
 @router.delete('/api/v1/menus/{menu_id}')
 async def delete_menu_handler(menu_id: UUID, menu: MenuRepository = Depends(),
                               session: AsyncSession = Depends(get_async_session)):
     """ удалить меню """
-    return await menu.delete_menu(menu_id, session)
+    result = await menu.delete_menu(menu_id, session)
+    await invalidate_menu(menu_id, deleted=True)
+    return result
 
 
 # Определяем CRUD операции для модели Submenu
 
 @router.get('/api/v1/menus/{menu_id}/submenus', response_model=list[schemas.Menu])
-@cache(expire=CACHE_TIME)
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENU_TREE, SUBMENUS),
+       response_model=list[schemas.Menu])
 async def get_submenus_handler(menu_id: UUID, submenu: SubMenuRepository = Depends(),
                                session: AsyncSession = Depends(get_async_session)):
     """ получить субменю """
@@ -79,11 +193,13 @@ async def create_submenu_handler(menu_id: UUID, submenu_data: schemas.SubmenuBas
                                  submenu: SubMenuRepository = Depends(),
                                  session: AsyncSession = Depends(get_async_session)):
     """ создать субменю """
-    return await submenu.create_submenu(menu_id, submenu_data, session)
+    db_submenu = await submenu.create_submenu(menu_id, submenu_data, session)
+    await invalidate_submenu(menu_id)
+    return db_submenu
 
 
 @router.get('/api/v1/menus/{menu_id}/submenus/{submenu_id}', response_model=schemas.Submenu)
-@cache(expire=CACHE_TIME)
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENU_TREE, SUBMENU), response_model=schemas.Submenu)
 async def read_submenu_handler(menu_id: UUID, submenu_id: UUID, submenu: SubMenuRepository = Depends(),
                                session: AsyncSession = Depends(get_async_session)):
     """ прочитать субменю по id"""
@@ -95,53 +211,113 @@ async def update_submenu_handler(menu_id: UUID, submenu_id: UUID, submenu_data:
                                  submenu: SubMenuRepository = Depends(),
                                  session: AsyncSession = Depends(get_async_session)):
     """ изменить субменю """
-    return await submenu.update_submenu(menu_id, submenu_id, submenu_data, session)
+    db_submenu = await submenu.update_submenu(menu_id, submenu_id, submenu_data, session)
+    await invalidate_submenu(menu_id, submenu_id, counts=False)
+    return db_submenu
 
 
 @router.delete('/api/v1/menus/{menu_id}/submenus/{submenu_id}')
 async def delete_submenu_handler(menu_id: UUID, submenu_id: UUID, submenu: SubMenuRepository = Depends(),
                                  session: AsyncSession = Depends(get_async_session)):
     """ удалить субменю """
-    return await submenu.delete_submenu(menu_id, submenu_id, session)
+    result = await submenu.delete_submenu(menu_id, submenu_id, session)
+    await invalidate_submenu(menu_id, submenu_id, deleted=True)
+    return result
 
 
 # # Определяем CRUD операции для модели Dish
 @router.get('/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes', response_model=list[schemas.Dish])
-@cache(expire=CACHE_TIME)
-async def get_dishes_handler(submenu_id: UUID, skip: int = 0, limit: int = 100,
-                             dish: DishRepository = Depends(),
-                             session: AsyncSession = Depends(get_async_session)):
-    """ получить блюдо """
-    return await dish.get_dishes(submenu_id, session, skip, limit)
+@link_next_page
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENU_TREE, SUBMENU_TREE, DISHES),
+       response_model=list[schemas.Dish])
+async def get_dishes_handler(menu_id: UUID, submenu_id: UUID, skip: int = 0, limit: int = 100,
+                             cursor: str | None = None, min_price: Decimal | None = None,
+                             max_price: Decimal | None = None, order_by: str = Query('id', pattern='^(id|price)$'),
+                             dish: DishRepository = Depends(), session: AsyncSession = Depends(get_async_session)):
+    """ получить блюда с фильтром по цене, следующая страница - по курсору из заголовка Link """
+    return await dish.get_dishes(menu_id, submenu_id, session, skip, limit, decode_cursor(cursor),
+                                 min_price, max_price, order_by)
 
 
 @router.post('/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes', response_model=schemas.Dish,
              status_code=status.HTTP_201_CREATED)
-async def create_dish_handler(submenu_id: UUID, dish_data: schemas.DishCreate,
+async def create_dish_handler(menu_id: UUID, submenu_id: UUID, dish_data: schemas.DishCreate,
                               dish: DishRepository = Depends(),
                               session: AsyncSession = Depends(get_async_session)):
     """ создать блюдо """
-    return await dish.create_dish(submenu_id, dish_data, session)
+    db_dish = await dish.create_dish(menu_id, submenu_id, dish_data, session)
+    await invalidate_dish(menu_id, submenu_id)
+    return db_dish
 
 
 @router.get('/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}', response_model=schemas.Dish)
-@cache(expire=CACHE_TIME)
-async def read_dish_handler(dish_id: UUID, dish: DishRepository = Depends(),
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENU_TREE, SUBMENU_TREE, DISH),
+       response_model=schemas.Dish)
+async def read_dish_handler(menu_id: UUID, submenu_id: UUID, dish_id: UUID, dish: DishRepository = Depends(),
                             session: AsyncSession = Depends(get_async_session)):
     """ получить блюдо по id """
-    return await dish.read_dish(dish_id, session)
+    return await dish.read_dish(menu_id, submenu_id, dish_id, session)
 
 
 @router.patch('/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}', response_model=schemas.Dish)
-async def update_dish_handler(dish_id: UUID, dish_data: schemas.DishUpdate,
+async def update_dish_handler(menu_id: UUID, submenu_id: UUID, dish_id: UUID, dish_data: schemas.DishUpdate,
                               dish: DishRepository = Depends(),
                               session: AsyncSession = Depends(get_async_session)):
     """ изменить блюдо """
-    return await dish.update_dish(dish_id, dish_data, session)
+    db_dish = await dish.update_dish(menu_id, submenu_id, dish_id, dish_data, session)
+    await invalidate_dish(menu_id, submenu_id, dish_id, counts=False)
+    return db_dish
 
 
 @router.delete('/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}')
-async def delete_dish_handler(dish_id: UUID, dish: DishRepository = Depends(),
+async def delete_dish_handler(menu_id: UUID, submenu_id: UUID, dish_id: UUID, dish: DishRepository = Depends(),
                               session: AsyncSession = Depends(get_async_session)):
     """ удалить блюдо """
-    return await dish.delete_dish(dish_id, session)
+    result = await dish.delete_dish(menu_id, submenu_id, dish_id, session)
+    await invalidate_dish(menu_id, submenu_id, dish_id)
+    return result
+
+
+# Пакетное чтение по списку id
+@router.post('/api/v1/dishes:batchGet', response_model=schemas.DishBatch)
+async def batch_get_dishes_handler(batch: schemas.BatchGet, request: Request, dish: DishRepository = Depends(),
+                                   session: AsyncSession = Depends(get_async_session)):
+    """ блюда по списку id в порядке запроса, ненайденные id - в not_found """
+    async def load(dish_ids: list[UUID]) -> dict[UUID, tuple[list[str], Any]]:
+        rows = await dish.get_dishes_by_ids(dish_ids, session)
+        return {db_dish.id: (dish_tags(menu_id, db_dish.submenu_id, db_dish.id), db_dish)  # type: ignore
+                for db_dish, menu_id in rows}
+
+    found = await batch_get('dish', batch.ids, lambda dish_id: [CATALOG, DISH.format(dish_id=dish_id)], load,
+                            dish_adapter, CACHE_TIME, route_label(request.scope))
+    return batch_response('dishes', batch.ids, found)
+
+
+@router.post('/api/v1/submenus:batchGet', response_model=schemas.SubmenuBatch)
+async def batch_get_submenus_handler(batch: schemas.BatchGet, request: Request,
+                                     submenu: SubMenuRepository = Depends(),
+                                     session: AsyncSession = Depends(get_async_session)):
+    """ субменю по списку id в порядке запроса, ненайденные id - в not_found """
+    async def load(submenu_ids: list[UUID]) -> dict[UUID, tuple[list[str], Any]]:
+        rows = await submenu.get_submenus_by_ids(submenu_ids, session)
+        return {db_submenu.id: (submenu_tags(db_submenu.menu_id, db_submenu.id), db_submenu)  # type: ignore
+                for db_submenu in rows}
+
+    found = await batch_get('submenu', batch.ids, lambda submenu_id: [CATALOG, SUBMENU.format(submenu_id=submenu_id)],
+                            load, submenu_adapter, CACHE_TIME, route_label(request.scope))
+    return batch_response('submenus', batch.ids, found)
+
+
+def search_query(q: str = Query(min_length=1, max_length=255)) -> str:
+    return normalize_query(q)
+
+
+# Поиск по каталогу. Результат зависит от всех блюд и субменю, поэтому ключ - по поколению всего дерева:
+# любая запись блюда или субменю сдвигает MENUS_TREE. Частые запросы живут в кэше, редкие истекают.
+@router.get('/api/v1/search', response_model=list[schemas.SearchResult])
+@cache(expire=CACHE_TIME, key_builder=hierarchy_key_builder(MENUS_TREE), response_model=list[schemas.SearchResult])
+async def search_handler(q: str = Depends(search_query), menu_id: UUID | None = None, skip: int = Query(0, ge=0),
+                         limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT), search: SearchRepository = Depends(),
+                         session: AsyncSession = Depends(get_async_session)):
+    """ блюда и субменю по названию и описанию, по убыванию релевантности """
+    return await search.search(q, menu_id, skip, limit, session)
@@ -1,35 +1,103 @@
 import uuid
+from typing import Any
 
-from sqlalchemy import Column, ForeignKey, MetaData, String
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    BindParameter,
+    Column,
+    Computed,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    Numeric,
+    String,
+    bindparam,
+    func,
+    literal_column,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, UUID
 from sqlalchemy.orm import relationship
 
 from src.database import Base
 
 metadata = MetaData()
 
+# полнотекстовый поиск: заголовок весомее описания; конфигурация russian разбирает латиницу английским стеммером
+SEARCH_CONFIG = 'russian'
+SEARCH_VECTOR = (f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+                 f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')")
+SEARCH_EXCLUDED = {'exclude_properties': ['search_vector']}
+
+
+def version_column() -> Column:
+    # увеличивается любым UPDATE строки, в том числе сдвигом счетчиков; из версий строятся ETag
+    return Column(Integer, nullable=False, default=1, server_default='1', onupdate=literal_column('version') + 1)
+
+
+def updated_at_column() -> Column:
+    return Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+
+def search_vector_column() -> Column:
+    # заполняет PostgreSQL; колонка есть в таблице, но не в маппинге (SEARCH_EXCLUDED),
+    # иначе ORM читал бы tsvector в каждом SELECT и RETURNING при вставке
+    return Column(TSVECTOR, Computed(SEARCH_VECTOR, persisted=True))
+
+
+def search_vector(model: Any) -> Column:
+    return model.__table__.c.search_vector
+
+
+def id_array(ids: list[uuid.UUID]) -> BindParameter:
+    # один параметр uuid[] для = ANY(...): в отличие от IN ($1, $2, ...) текст запроса не зависит от числа id
+    return bindparam('ids', ids, type_=ARRAY(UUID(as_uuid=True)))
+
 
 class Menu(Base):
     __tablename__ = 'menu'
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     title = Column(String(255), nullable=False)
     description = Column(String(255), nullable=True)
-    submenus = relationship('Submenu', cascade='all, delete-orphan')
+    # счетчики поддерживаются репозиториями в той же транзакции, что и запись субменю/блюда
+    submenus_count = Column(Integer, nullable=False, default=0, server_default='0')
+    dishes_count = Column(Integer, nullable=False, default=0, server_default='0')
+    version = version_column()
+    updated_at = updated_at_column()
+    # дочерние строки удаляет ON DELETE CASCADE в БД, ORM их не загружает
+    submenus = relationship('Submenu', cascade='all, delete-orphan', passive_deletes=True)
 
 
 class Submenu(Base):
     __tablename__ = 'submenu'
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     title = Column(String(255), nullable=False)
     description = Column(String(255), nullable=True)
-    menu_id = Column(UUID(as_uuid=True), ForeignKey('menu.id'), nullable=False)
-    dishes = relationship('Dish', cascade='all, delete-orphan')
+    menu_id = Column(UUID(as_uuid=True), ForeignKey('menu.id', ondelete='CASCADE'), nullable=False, index=True)
+    dishes_count = Column(Integer, nullable=False, default=0, server_default='0')
+    version = version_column()
+    updated_at = updated_at_column()
+    search_vector = search_vector_column()
+    dishes = relationship('Dish', cascade='all, delete-orphan', passive_deletes=True)
+
+    __mapper_args__ = SEARCH_EXCLUDED
 
 
 class Dish(Base):
     __tablename__ = 'dish'
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
     title = Column(String(255), nullable=False)
     description = Column(String(255), nullable=True)
-    price = Column(String(255), nullable=False)
-    submenu_id = Column(UUID(as_uuid=True), ForeignKey('submenu.id'), nullable=False)
+    price = Column(Numeric(10, 2), nullable=False)
+    submenu_id = Column(UUID(as_uuid=True), ForeignKey('submenu.id', ondelete='CASCADE'), nullable=False)
+    version = version_column()
+    updated_at = updated_at_column()
+    search_vector = search_vector_column()
+
+    __table_args__ = (
+        # keyset-пагинация блюд субменю; ведущая колонка заодно индексирует внешний ключ submenu_id
+        Index('ix_dish_submenu_id_id', 'submenu_id', 'id'),
+        # фильтр и сортировка по цене внутри субменю; id - для keyset-пагинации при order_by=price
+        Index('ix_dish_submenu_id_price', 'submenu_id', 'price', 'id'),
+    )
+    __mapper_args__ = SEARCH_EXCLUDED
@@ -1,6 +1,18 @@
+from decimal import Decimal, InvalidOperation
+from typing import Any
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+
+# NUMERIC(10, 2)
+MAX_PRICE = Decimal('99999999.99')
+# id в одном запросе пакетного чтения
+BATCH_GET_LIMIT = 500
+
+
+def price_string(price: Any) -> str:
+    # цена из NUMERIC(10, 2) в прежнем публичном формате: '10.99', '12.5', '12.0'
+    return str(float(round(Decimal(str(price)), 2)))
 
 
 # Схема для модели Menu
@@ -21,6 +33,8 @@ class MenuUpdate(MenuBase):
 
 class Menu(MenuBase):
     id: UUID
+    # версия строки: только для ETag, в ответ не попадает
+    version: int | None = Field(default=None, exclude=True)
 
     class Config:
         from_attributes = True
@@ -43,6 +57,7 @@ class SubmenuUpdate(SubmenuBase):
 
 class Submenu(SubmenuBase):
     id: UUID
+    version: int | None = Field(default=None, exclude=True)
 
     class Config:
         from_attributes = True
@@ -54,11 +69,20 @@ class DishBase(BaseModel):
     description: str | None = None
     price: str
 
+    @field_validator('price')
+    @classmethod
+    def check_price(cls, price: str) -> str:
+        try:
+            value = round(Decimal(price), 2)
+        except (InvalidOperation, ValueError):
+            raise ValueError('price must be a number')
+        if not value.is_finite() or abs(value) > MAX_PRICE:
+            raise ValueError(f'price must not exceed {MAX_PRICE}')
+        return price
 
-class DishCreate(BaseModel):
-    title: str
-    description: str | None = None
-    price: str
+
+class DishCreate(DishBase):
+    pass
 
 
 class DishUpdate(DishBase):
@@ -67,6 +91,84 @@ class DishUpdate(DishBase):
 
 class Dish(DishBase):
     id: UUID
+    version: int | None = Field(default=None, exclude=True)
 
     class Config:
         from_attributes = True
+
+    @field_validator('price', mode='before')
+    @classmethod
+    def format_price(cls, price: Any) -> str:
+        return price_string(price)
+
+
+# Схемы для дерева меню
+class SubmenuTree(Submenu):
+    dishes: list[Dish] | None = None
+
+
+class MenuTree(Menu):
+    submenus: list[SubmenuTree] | None = None
+
+
+# Схемы пакетного чтения по списку id
+class BatchGet(BaseModel):
+    ids: list[UUID] = Field(min_length=1, max_length=BATCH_GET_LIMIT)
+
+
+class DishBatch(BaseModel):
+    dishes: list[Dish]
+    not_found: list[UUID]
+
+
+class SubmenuBatch(BaseModel):
+    submenus: list[Submenu]
+    not_found: list[UUID]
+
+
+# Результат поиска: блюдо или субменю
+class SearchResult(BaseModel):
+    type: str
+    id: UUID
+    title: str
+    description: str | None = None
+    price: str | None = None
+    submenu_id: UUID | None = None
+    menu_id: UUID
+    rank: float
+
+    class Config:
+        from_attributes = True
+
+    @field_validator('price', mode='before')
+    @classmethod
+    def format_price(cls, price: Any) -> str | None:
+        return None if price is None else price_string(price)
+
+
+# Строка выгрузки каталога: блюдо с субменю и меню; у пустых субменю и меню поля блюда (и субменю) - None
+class CatalogExportRow(BaseModel):
+    menu_id: UUID
+    menu_title: str
+    menu_description: str | None = None
+    submenu_id: UUID | None = None
+    submenu_title: str | None = None
+    submenu_description: str | None = None
+    dish_id: UUID | None = None
+    dish_title: str | None = None
+    dish_description: str | None = None
+    dish_price: str | None = None
+
+    @field_validator('dish_price', mode='before')
+    @classmethod
+    def format_price(cls, price: Any) -> str | None:
+        return None if price is None else price_string(price)
+
+
+# Схемы для импорта каталога
+class SubmenuImport(SubmenuCreate):
+    dishes: list[DishCreate] = []
+
+
+class MenuImport(MenuCreate):
+    submenus: list[SubmenuImport] = []
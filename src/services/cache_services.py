@@ -0,0 +1,485 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import sys
+from collections.abc import Awaitable, Callable, Iterator
+from decimal import Decimal
+from functools import wraps
+from typing import Any
+from uuid import UUID
+
+import aioredis
+from fastapi import Request, Response
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from pydantic import BaseModel, TypeAdapter
+
+from src.config import (
+    CACHE_BREAKER_FAILURES,
+    CACHE_BREAKER_RESET,
+    CACHE_LOCK_TTL,
+    CACHE_LOCK_WAIT,
+    CACHE_STALE_EXPIRE,
+    LOCAL_CACHE_MAX_BYTES,
+    LOCAL_CACHE_MAX_ENTRIES,
+    LOCAL_GENERATION_TTL,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_SOCKET_CONNECT_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+    REDIS_URL,
+)
+from src.database import fresh_read, replicas
+from src.metrics import CallbackMetric, Counter, Labels, route_label
+from src.services.local_cache_services import (
+    CacheUnavailable,
+    CircuitBreaker,
+    LocalCache,
+    TwoTierBackend,
+)
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'fastapi-cache'
+background_tasks: set[asyncio.Task] = set()
+
+# Теги иерархии Menu -> Submenu -> Dish. Ключ кэша содержит текущие поколения своих тегов,
+# поэтому инвалидация - это INCR нескольких счетчиков, без SCAN/KEYS/FLUSHDB.
+CATALOG = 'catalog'
+MENUS_TREE = 'menus:tree'
+MENUS = 'menus'
+MENU = 'menu:{menu_id}'
+MENU_TREE = 'menu:{menu_id}:tree'
+MENU_CONTENT = 'menu:{menu_id}:content'
+SUBMENUS = 'submenus:{menu_id}'
+SUBMENU = 'submenu:{submenu_id}'
+SUBMENU_TREE = 'submenu:{submenu_id}:tree'
+DISHES = 'dishes:{submenu_id}'
+DISH = 'dish:{dish_id}'
+
+KEY_PARAM_TYPES = (str, int, float, bool, Decimal, UUID)
+# запись кэша - строка 'ETag\tчисло элементов\tid последнего' и JSON тела; смена формата меняет ключи
+ENTRY_FORMAT = 'v2'
+# версия ключа, когда поколения недоступны: ответ считается из БД и не кэшируется
+BYPASS = 'bypass'
+
+
+def init_cache() -> None:
+    redis = aioredis.from_url(REDIS_URL, encoding='utf8', decode_responses=True,
+                              max_connections=REDIS_MAX_CONNECTIONS, socket_timeout=REDIS_SOCKET_TIMEOUT,
+                              socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT)
+    backend = TwoTierBackend(RedisBackend(redis),
+                             local=LocalCache(LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_MAX_BYTES),
+                             generations=LocalCache(LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_MAX_BYTES),
+                             generation_ttl=LOCAL_GENERATION_TTL, channel=f'{PREFIX}:invalidate',
+                             breaker=CircuitBreaker(CACHE_BREAKER_FAILURES, CACHE_BREAKER_RESET),
+                             reset_key=f'{PREFIX}:generation:{CATALOG}',
+                             pubsub_redis=aioredis.from_url(REDIS_URL, encoding='utf8', decode_responses=True,
+                                                            socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT),
+                             # прочитанное из реплики сразу после инвалидации не кэшируется: см. fill_expire
+                             on_invalidation=replicas.note_invalidation)
+    FastAPICache.init(backend, prefix=PREFIX)
+
+
+def log_cache_error(message: str, *args: Any) -> None:
+    # при разомкнутом автомате ошибка ожидаема и повторяется на каждом запросе
+    if isinstance(sys.exc_info()[1], CacheUnavailable):
+        logger.debug(message, *args)
+    else:
+        logger.warning(message, *args, exc_info=True)
+
+
+def get_backend() -> TwoTierBackend:
+    return FastAPICache.get_backend()  # type: ignore
+
+
+def backend_stats(collect: Callable[[TwoTierBackend], dict[Labels, float]]) -> Callable[[], dict[Labels, float]]:
+    """ значения метрики из статистики бэкенда; до init_cache метрика пустая """
+    def callback() -> dict[Labels, float]:
+        backend = FastAPICache._backend
+        return collect(backend) if isinstance(backend, TwoTierBackend) else {}
+
+    return callback
+
+
+CACHE_REQUESTS = Counter('cache_requests_total', 'Response cache lookups', ('route', 'prefix', 'result'))
+CallbackMetric('cache_tier_requests_total', 'Lookups in the local and Redis cache tiers', 'counter',
+               backend_stats(lambda backend: {
+                   (tier, result): backend.stats.counters[f'{tier}_{counter}']
+                   for tier in ('local', 'redis') for result, counter in (('hit', 'hits'), ('miss', 'misses'))}),
+               ('tier', 'result'))
+CallbackMetric('cache_events_total', 'Coalesced misses, lock waits and stale responses', 'counter',
+               backend_stats(lambda backend: {
+                   (event,): backend.stats.counters[event] for event in ('coalesced', 'lock_waits', 'stale_hits')}),
+               ('event',))
+CallbackMetric('cache_breaker_open', 'Redis circuit breaker is open or half-open', 'gauge',
+               backend_stats(lambda backend: {(): int(backend.breaker.state != 'closed')}))
+CallbackMetric('cache_breaker_rejected_total', 'Cache calls skipped by the open circuit breaker', 'counter',
+               backend_stats(lambda backend: {(): backend.breaker.rejected}))
+CallbackMetric('cache_local_bytes', 'Size of values in the local cache tier', 'gauge',
+               backend_stats(lambda backend: {(): backend.local.size}))
+
+
+def start_invalidation_listener() -> None:
+    """ слушать инвалидации других воркеров """
+    # держим ссылку на задачу, иначе ее может собрать GC
+    background_tasks.add(asyncio.create_task(get_backend().listen_invalidations()))
+
+
+def generation_key(tag: str) -> str:
+    return f'{FastAPICache.get_prefix()}:generation:{tag}'
+
+
+def included(param: str, tag: str) -> Callable[[dict[str, Any]], str | None]:
+    """ тег учитывается в ключе, только если в запросе передан параметр param """
+    return lambda params: tag.format(**params) if params.get(param) else None
+
+
+Tag = str | Callable[[dict[str, Any]], str | None]
+
+
+def resolve_tags(tags: tuple[Tag, ...], params: dict[str, Any]) -> list[str]:
+    """ теги ключа для значений параметров запроса; CATALOG - всегда первым """
+    resolved = [CATALOG]
+    for tag in tags:
+        resolved_tag = tag.format(**params) if isinstance(tag, str) else tag(params)
+        if resolved_tag is not None:
+            resolved.append(resolved_tag)
+    return resolved
+
+
+async def tags_version(tags: list[str]) -> str:
+    """ текущие поколения тегов одной строкой; BYPASS, если поколения не прочитать """
+    try:
+        generations = await get_backend().get_generations([generation_key(tag) for tag in tags])
+    except Exception:
+        log_cache_error('Error reading cache generations, bypassing cache')
+        return BYPASS
+    return '.'.join(str(generation or 0) for generation in generations)
+
+
+def hierarchy_key_builder(*tags: Tag) -> Callable[..., Awaitable[str]]:
+    """ key_builder для @cache: ключ зависит от параметров запроса и поколений тегов """
+
+    async def key_builder(func: Callable[..., Any], namespace: str = '', request: Any = None,
+                          response: Any = None, args: tuple | None = None, kwargs: dict | None = None) -> str:
+        params = {name: value for name, value in (kwargs or {}).items() if isinstance(value, KEY_PARAM_TYPES)}
+        version = await tags_version(resolve_tags(tags, params))
+        query = '&'.join(f'{name}={value}' for name, value in sorted(params.items()))
+        return f'{FastAPICache.get_prefix()}:{namespace}:{func.__name__}:{query}:{version}'
+
+    # по тегам кэш ответов перед роутером (src.response_cache) строит ключ без вызова обработчика
+    key_builder.tags = tags  # type: ignore[attr-defined]
+    return key_builder
+
+
+def stale_key(key: str) -> str:
+    """ ключ устаревшей копии: тот же запрос без версии поколений """
+    return f"{key.rsplit(':', 1)[0]}:stale"
+
+
+def lock_key(key: str) -> str:
+    return f'{key}:lock'
+
+
+def version_stamps(value: Any) -> Iterator[str]:
+    """ id:version строк ответа; у дерева - вместе с вложенными субменю и блюдами """
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from version_stamps(item)
+    elif isinstance(value, BaseModel):
+        yield f"{getattr(value, 'id', None)}:{getattr(value, 'version', None)}"
+        for field in ('submenus', 'dishes'):
+            yield from version_stamps(getattr(value, field, None) or [])
+
+
+def make_etag(value: Any, body: str) -> str:
+    """ сильный ETag из версий строк; без версий - из самого тела """
+    stamps = list(version_stamps(value))
+    source = body if any(stamp.endswith(':None') for stamp in stamps) else '|'.join(stamps)
+    return f'"{hashlib.blake2b(source.encode(), digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+class CachedResponse(Response):
+    """ готовое JSON-тело записи кэша; count/last_id - для ссылки на следующую страницу списка """
+
+    media_type = 'application/json'
+
+    def __init__(self, entry: str, ttl: int):
+        self.etag, self.count, self.last_id, body = parse_entry(entry)
+        super().__init__(body, headers={'ETag': self.etag, 'Cache-Control': f'max-age={ttl}'})
+
+
+def entry_encoder(response_model: Any, exclude_unset: bool = False) -> Callable[[Any], str]:
+    """ строки или схемы -> запись кэша: одна валидация и одна сериализация в JSON на стороне pydantic-core """
+    adapter: TypeAdapter = TypeAdapter(response_model)
+
+    def encode_entry(result: Any) -> str:
+        value = adapter.validate_python(result, from_attributes=True)
+        body = adapter.dump_json(value, exclude_unset=exclude_unset).decode()
+        count, last_id = (len(value), value[-1].id if value else '') if isinstance(value, list) else ('', '')
+        return f'{make_etag(value, body)}\t{count}\t{last_id}\n{body}'
+
+    return encode_entry
+
+
+def parse_entry(entry: str) -> tuple[str, int | None, str | None, str]:
+    head, _, body = entry.partition('\n')
+    etag, count, last_id = head.split('\t')
+    return etag, int(count) if count else None, last_id or None, body
+
+
+async def recompute(key: str, compute: Callable[[], Awaitable[str]], expire: int) -> tuple[int, str]:
+    """ пересчет промаха: один воркер под блокировкой Redis, остальные берут устаревшую копию или ждут его """
+    backend = get_backend()
+    token = None
+    try:
+        token = await backend.acquire_lock(lock_key(key), CACHE_LOCK_TTL)
+        if token is None:
+            entry = await backend.get_raw(stale_key(key))
+            if entry is not None:
+                backend.stats.incr('stale_hits')
+                return 0, entry
+            backend.stats.incr('lock_waits')
+            entry = await backend.wait_for(key, CACHE_LOCK_WAIT)
+            if entry is not None:
+                return expire, entry
+            # держатель блокировки не успел - считаем сами
+    except Exception:
+        log_cache_error('Error locking cache key %s, computing without lock', key)
+    try:
+        entry = await compute()
+        expire = replicas.fill_expire(expire)
+        try:
+            if expire:
+                await backend.set_with_stale(key, stale_key(key), entry, expire, CACHE_STALE_EXPIRE)
+        except Exception:
+            log_cache_error('Error setting cache key %s', key)
+        return expire, entry
+    finally:
+        if token is not None:
+            try:
+                await backend.release_lock(lock_key(key), token)
+            except Exception:
+                log_cache_error('Error releasing cache lock %s', key)
+
+
+def cache(expire: int, key_builder: Callable[..., Awaitable[str]], response_model: Any,
+          exclude_unset: bool = False) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """ @cache из fastapi_cache с защитой от stampede и готовым телом ответа
+
+    Одновременные промахи по одному ключу в воркере ждут одно вычисление (SingleFlight),
+    между воркерами пересчитывает только держатель короткой блокировки в Redis.
+    Результат один раз сериализуется по response_model, эти же байты лежат в кэше и уходят
+    клиентом как есть (CachedResponse) - FastAPI не валидирует и не кодирует ответ повторно.
+    ETag хранится рядом с телом, поэтому 304 отдается без БД и без разбора JSON.
+    """
+    encode_entry = entry_encoder(response_model, exclude_unset)
+
+    def wrapper(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        signature = inspect.signature(func)
+        parameters = list(signature.parameters.values())
+        # request/response нужны для заголовков; передаем их в func, только если она их объявила
+        for name, annotation in (('request', Request), ('response', Response)):
+            if name not in signature.parameters:
+                parameters.append(inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, annotation=annotation))
+        func.__signature__ = signature.replace(parameters=parameters)  # type: ignore
+        key_prefix = f'{PREFIX}:{ENTRY_FORMAT}:{func.__name__}'
+
+        @wraps(func)
+        async def inner(*args: Any, **kwargs: Any) -> Any:
+            params = {name: value for name, value in kwargs.items() if name not in ('request', 'response')}
+            call_kwargs = {name: value for name, value in kwargs.items() if name in signature.parameters}
+            request: Request | None = kwargs.get('request')
+            if request is None:
+                return await func(*args, **call_kwargs)
+
+            async def compute_entry() -> str:
+                return encode_entry(await func(*args, **call_kwargs))
+
+            if fresh_read(request):
+                ttl, entry = 0, await compute_entry()
+            else:
+                ttl, entry = await cached_entry(func, params, request, kwargs.get('response'), compute_entry)
+            etag = parse_entry(entry)[0]
+            if etag_matches(request.headers.get('if-none-match'), etag):
+                return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': f'max-age={ttl}'})
+            return CachedResponse(entry, ttl)
+
+        async def cached_entry(func: Callable[..., Any], params: dict[str, Any], request: Request,
+                               response: Response | None, compute_entry: Callable[[], Awaitable[str]]
+                               ) -> tuple[int, str]:
+            key = await key_builder(func, ENTRY_FORMAT, request=request, response=response, kwargs=params)
+            backend = get_backend()
+            route = route_label(request.scope)
+            if key in backend.flights:
+                backend.stats.incr('coalesced')
+            if key.endswith(f':{BYPASS}'):
+                CACHE_REQUESTS.inc(route, key_prefix, 'bypass')
+
+                # Redis недоступен: отвечаем из БД, но одновременные запросы все равно ждут одно вычисление
+                async def uncached() -> tuple[int, str]:
+                    return 0, await compute_entry()
+
+                return await backend.flights.do(key, uncached)
+            try:
+                ttl, entry = await backend.get_with_ttl(key)
+            except Exception:
+                log_cache_error('Error retrieving cache key %s', key)
+                CACHE_REQUESTS.inc(route, key_prefix, 'error')
+                ttl, entry = 0, None
+            else:
+                CACHE_REQUESTS.inc(route, key_prefix, 'miss' if entry is None else 'hit')
+            if entry is not None:
+                return ttl, entry
+            return await backend.flights.do(key, lambda: recompute(key, compute_entry, expire))
+
+        inner.cache_tags = getattr(key_builder, 'tags', None)  # type: ignore[attr-defined]
+        return inner
+
+    return wrapper
+
+
+def dish_tags(menu_id: UUID, submenu_id: UUID, dish_id: UUID) -> list[str]:
+    """ теги, от которых зависит блюдо: те же, что в ключе read_dish_handler """
+    return [CATALOG, MENU_TREE.format(menu_id=menu_id), SUBMENU_TREE.format(submenu_id=submenu_id),
+            DISH.format(dish_id=dish_id)]
+
+
+def submenu_tags(menu_id: UUID, submenu_id: UUID) -> list[str]:
+    return [CATALOG, MENU_TREE.format(menu_id=menu_id), SUBMENU.format(submenu_id=submenu_id)]
+
+
+def batch_key(name: str, item_id: UUID) -> str:
+    return f'{FastAPICache.get_prefix()}:{ENTRY_FORMAT}:batch:{name}:{item_id}'
+
+
+def generation_stamp(tags: list[str], generations: dict[str, str | None]) -> str:
+    return '.'.join(str(generations[tag] or 0) for tag in tags)
+
+
+async def tag_generations(tags: set[str]) -> dict[str, str | None]:
+    ordered = sorted(tags)
+    return dict(zip(ordered, await get_backend().get_generations([generation_key(tag) for tag in ordered])))
+
+
+async def batch_get(name: str, ids: list[UUID], own_tags: Callable[[UUID], list[str]],
+                    load: Callable[[list[UUID]], Awaitable[dict[UUID, tuple[list[str], Any]]]],
+                    adapter: TypeAdapter, expire: int, route: str) -> dict[UUID, str]:
+    """ JSON найденных элементов по списку id: кэш одним MGET, промахи - одним load, запись - одним pipeline
+
+    Запись кэша хранит теги элемента и их поколения на момент чтения из БД ('теги\tпоколения\nJSON'):
+    ключ не зависит от поколений, потому что родители элемента до чтения неизвестны. own_tags - теги,
+    известные по одному id; load возвращает все теги найденного элемента.
+    """
+    backend = get_backend()
+    key_prefix = f'{PREFIX}:{ENTRY_FORMAT}:batch:{name}'
+    unique = list(dict.fromkeys(ids))
+    found: dict[UUID, str] = {}
+    try:
+        entries = await backend.get_many([batch_key(name, item_id) for item_id in unique])
+        cached = {}
+        for item_id, entry in zip(unique, entries):
+            if entry is not None:
+                head, _, body = entry.partition('\n')
+                tags, stamp = head.split('\t')
+                cached[item_id] = (tags.split(' '), stamp, body)
+        generations = await tag_generations({tag for tags, _, _ in cached.values() for tag in tags})
+        found = {item_id: body for item_id, (tags, stamp, body) in cached.items()
+                 if generation_stamp(tags, generations) == stamp}
+    except Exception:
+        log_cache_error('Error retrieving batch cache entries %s', key_prefix)
+        CACHE_REQUESTS.inc(route, key_prefix, 'error')
+    CACHE_REQUESTS.inc(route, key_prefix, 'hit', amount=len(found))
+    misses = [item_id for item_id in unique if item_id not in found]
+    if not misses:
+        return found
+    CACHE_REQUESTS.inc(route, key_prefix, 'miss', amount=len(misses))
+
+    try:
+        # как в key_builder: поколения читаются до БД, и запись, прочитанная до инвалидации, не совпадет
+        before: dict[str, str | None] | None = await tag_generations(
+            {tag for item_id in misses for tag in own_tags(item_id)})
+    except Exception:
+        log_cache_error('Error reading cache generations, bypassing batch cache')
+        before = None
+    loaded = await load(misses)
+    bodies = {item_id: adapter.dump_json(adapter.validate_python(item, from_attributes=True)).decode()
+              for item_id, (_, item) in loaded.items()}
+    found.update(bodies)
+    expire = replicas.fill_expire(expire)
+    if before is None or not expire:
+        return found
+    try:
+        # теги родителей известны только после БД: удаление родителя между чтением и этой строкой
+        # оставит запись элемента до expire
+        generations = {**await tag_generations({tag for tags, _ in loaded.values() for tag in tags}), **before}
+        await backend.set_many({batch_key(name, item_id): f"{' '.join(tags)}\t{generation_stamp(tags, generations)}"
+                                                          f'\n{bodies[item_id]}'
+                                for item_id, (tags, _) in loaded.items()}, expire)
+    except Exception:
+        log_cache_error('Error storing batch cache entries %s', key_prefix)
+    return found
+
+
+def batch_response(field: str, ids: list[UUID], found: dict[UUID, str]) -> Response:
+    """ ответ пакетного чтения из готового JSON элементов, в порядке запроса и без повторов """
+    unique = list(dict.fromkeys(ids))
+    items = ','.join(found[item_id] for item_id in unique if item_id in found)
+    not_found = ','.join(f'"{item_id}"' for item_id in unique if item_id not in found)
+    return Response(f'{{"{field}":[{items}],"not_found":[{not_found}]}}', media_type='application/json')
+
+
+async def invalidate(*tags: str) -> None:
+    """ сдвигаем поколения тегов одним pipeline и оповещаем остальные воркеры """
+    try:
+        await get_backend().incr_generations([generation_key(tag) for tag in tags])
+    except Exception:
+        log_cache_error('Error invalidating cache tags %s', tags)
+
+
+async def invalidate_catalog() -> None:
+    """ инвалидировать весь кэш каталога """
+    await invalidate(CATALOG)
+
+
+async def invalidate_menu(menu_id: UUID | None = None, deleted: bool = False) -> None:
+    """ создание, изменение или удаление меню """
+    tags = [MENUS_TREE, MENUS]
+    if menu_id is not None:
+        tags.append(MENU.format(menu_id=menu_id))
+    if deleted:
+        tags += [SUBMENUS.format(menu_id=menu_id), MENU_TREE.format(menu_id=menu_id)]
+    await invalidate(*tags)
+
+
+async def invalidate_submenu(menu_id: UUID, submenu_id: UUID | None = None, deleted: bool = False,
+                             counts: bool = True) -> None:
+    """ субменю меняет список субменю и, при создании/удалении, счетчики родительского меню """
+    tags = [MENUS_TREE, MENU_CONTENT.format(menu_id=menu_id), SUBMENUS.format(menu_id=menu_id)]
+    if submenu_id is not None:
+        tags.append(SUBMENU.format(submenu_id=submenu_id))
+    if counts:
+        tags += [MENUS, MENU.format(menu_id=menu_id)]
+    if deleted:
+        tags += [DISHES.format(submenu_id=submenu_id), SUBMENU_TREE.format(submenu_id=submenu_id)]
+    await invalidate(*tags)
+
+
+async def invalidate_dish(menu_id: UUID, submenu_id: UUID, dish_id: UUID | None = None,
+                          counts: bool = True) -> None:
+    """ блюдо меняет свой список, а при создании/удалении - счетчики субменю и меню """
+    tags = [MENUS_TREE, MENU_CONTENT.format(menu_id=menu_id), DISHES.format(submenu_id=submenu_id)]
+    if dish_id is not None:
+        tags.append(DISH.format(dish_id=dish_id))
+    if counts:
+        tags += [SUBMENU.format(submenu_id=submenu_id), SUBMENUS.format(menu_id=menu_id),
+                 MENU.format(menu_id=menu_id), MENUS]
+    await invalidate(*tags)
@@ -0,0 +1,75 @@
+from typing import Any
+from uuid import UUID
+
+from fastapi import Depends
+from sqlalchemy import ColumnElement, ScalarSelect, Update, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import get_async_session
+from src.restaurant import models
+
+
+def submenus_count_query() -> ScalarSelect[int]:
+    return (select(func.count(models.Submenu.id))
+            .where(models.Submenu.menu_id == models.Menu.id)
+            .correlate(models.Menu).scalar_subquery())
+
+
+def menu_dishes_count_query() -> ScalarSelect[int]:
+    return (select(func.count(models.Dish.id)).join(models.Submenu)
+            .where(models.Submenu.menu_id == models.Menu.id)
+            .correlate(models.Menu).scalar_subquery())
+
+
+def submenu_dishes_count_query() -> ScalarSelect[int]:
+    return (select(func.count(models.Dish.id))
+            .where(models.Dish.submenu_id == models.Submenu.id)
+            .correlate(models.Submenu).scalar_subquery())
+
+
+def menu_counters_update(menu_id: UUID | ColumnElement[Any], submenus: Any = 0, dishes: Any = 0) -> Update:
+    """ атомарный сдвиг счетчиков меню; menu_id, submenus/dishes - значение или SQL-выражение """
+    return (update(models.Menu).where(models.Menu.id == menu_id)
+            .values(submenus_count=models.Menu.submenus_count + submenus,
+                    dishes_count=models.Menu.dishes_count + dishes)
+            .execution_options(synchronize_session=False))
+
+
+def submenu_counters_update(submenu_id: UUID | ColumnElement[Any], dishes: Any) -> Update:
+    """ атомарный сдвиг счетчика блюд субменю; submenu_id - значение или SQL-выражение """
+    return (update(models.Submenu).where(models.Submenu.id == submenu_id)
+            .values(dishes_count=models.Submenu.dishes_count + dishes)
+            .execution_options(synchronize_session=False))
+
+
+class CounterRepository:
+    """ проверка и пересчет денормализованных счетчиков submenus_count/dishes_count """
+
+    def __init__(self, session: AsyncSession = Depends(get_async_session)):
+        self.session: AsyncSession = session
+
+    async def check_counters(self, session: AsyncSession) -> dict[str, list[UUID]]:
+        """ id меню и субменю, у которых сохраненные счетчики расходятся с данными """
+        menus = await session.scalars(select(models.Menu.id).where(or_(
+            models.Menu.submenus_count != submenus_count_query(),
+            models.Menu.dishes_count != menu_dishes_count_query())))
+        submenus = await session.scalars(select(models.Submenu.id).where(
+            models.Submenu.dishes_count != submenu_dishes_count_query()))
+        return {'menus': list(menus), 'submenus': list(submenus)}
+
+    async def repair_counters(self, session: AsyncSession) -> dict[str, list[UUID]]:
+        """ пересчитать расходящиеся счетчики, вернуть исправленные id """
+        broken = await self.check_counters(session)
+        if broken['submenus']:
+            await session.execute(update(models.Submenu)
+                                  .where(models.Submenu.id.in_(broken['submenus']))
+                                  .values(dishes_count=submenu_dishes_count_query())
+                                  .execution_options(synchronize_session=False))
+        if broken['menus']:
+            await session.execute(update(models.Menu)
+                                  .where(models.Menu.id.in_(broken['menus']))
+                                  .values(submenus_count=submenus_count_query(),
+                                          dishes_count=menu_dishes_count_query())
+                                  .execution_options(synchronize_session=False))
+        await session.commit()
+        return broken
@@ -1,12 +1,36 @@
+import uuid
+from decimal import Decimal
 from uuid import UUID
 
 from fastapi import Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import (
+    ColumnElement,
+    any_,
+    delete,
+    insert,
+    literal,
+    select,
+    tuple_,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from src.database import get_async_session
 from src.restaurant import models, schemas
 from src.restaurant.models import Dish
+from src.services.counter_services import menu_counters_update, submenu_counters_update
+
+
+def dishes_in_path(menu_id: UUID, submenu_id: UUID) -> ColumnElement[bool]:
+    """ блюда субменю, только если оно в меню из пути: ключи и сброс кэша строятся из тегов пути """
+    return models.Dish.submenu_id == select(models.Submenu.id).where(
+        models.Submenu.id == submenu_id, models.Submenu.menu_id == menu_id).scalar_subquery()
+
+
+def dish_in_path(menu_id: UUID, submenu_id: UUID, dish_id: UUID) -> tuple[ColumnElement[bool], ...]:
+    """ блюдо по id, только если оно в субменю и меню из пути: иначе сбросился бы кэш чужого субменю """
+    return models.Dish.id == dish_id, dishes_in_path(menu_id, submenu_id)
 
 
 class DishRepository:
@@ -14,26 +38,66 @@ class DishRepository:
         self.session: AsyncSession = session
         self.model = Dish
 
-    async def get_dishes(self, submenu_id: UUID, session: AsyncSession,
-                         skip: int = 0, limit: int = 100) -> list[schemas.Dish]:
-        db_dishes = await session.execute(
-            select(models.Dish).filter(models.Dish.submenu_id == submenu_id).offset(skip).limit(limit))
-        return db_dishes.scalars().all()  # type: ignore
+    async def get_dishes(self, menu_id: UUID, submenu_id: UUID, session: AsyncSession,
+                         skip: int = 0, limit: int = 100, cursor: UUID | None = None,
+                         min_price: Decimal | None = None, max_price: Decimal | None = None,
+                         order_by: str = 'id') -> list[schemas.Dish]:
+        # порядок совпадает с индексом (submenu_id, id) или (submenu_id, price, id)
+        query = select(models.Dish).filter(dishes_in_path(menu_id, submenu_id)).limit(limit)
+        if min_price is not None:
+            query = query.where(models.Dish.price >= min_price)
+        if max_price is not None:
+            query = query.where(models.Dish.price <= max_price)
+        if order_by == 'price':
+            query = query.order_by(models.Dish.price, models.Dish.id)
+            if cursor:
+                # курсор - id последнего блюда страницы, его цену берем подзапросом
+                last = aliased(models.Dish)
+                query = query.where(tuple_(models.Dish.price, models.Dish.id) > select(last.price, last.id)
+                                    .where(last.id == cursor).scalar_subquery())
+            else:
+                query = query.offset(skip)
+        else:
+            query = query.order_by(models.Dish.id)
+            query = query.where(models.Dish.id > cursor) if cursor else query.offset(skip)
+        db_dishes = (await session.execute(query)).scalars().all()
+        if not db_dishes and cursor and order_by == 'price' and await session.get(models.Dish, cursor) is None:
+            # блюдо курсора удалено: сравнение с NULL ложно, и пустая страница выглядела бы как конец списка
+            raise HTTPException(status_code=422, detail='cursor dish no longer exists')
+        return db_dishes  # type: ignore
+
+    async def get_dishes_by_ids(self, dish_ids: list[UUID], session: AsyncSession) -> list[tuple[Dish, UUID]]:
+        """ блюда по списку id одним запросом, вместе с id меню """
+        rows = await session.execute(select(models.Dish, models.Submenu.menu_id).join(models.Submenu)
+                                     .where(models.Dish.id == any_(models.id_array(dish_ids))))
+        return rows.all()  # type: ignore
 
-    async def create_dish(self, submenu_id: UUID, dish: schemas.DishCreate, session: AsyncSession) -> schemas.Dish:
-        db_dish = models.Dish(title=dish.title, description=dish.description, price=str(dish.price),
-                              submenu_id=submenu_id)
-        session.add(db_dish)
+    async def create_dish(self, menu_id: UUID, submenu_id: UUID, dish: schemas.DishCreate,
+                          session: AsyncSession) -> schemas.Dish:
+        # одна команда: счетчики субменю и меню сдвигаются в CTE (в прежнем порядке блокировок),
+        # блюдо вставляется из их RETURNING - нет субменю в меню из пути, нет и строки
+        submenu = (submenu_counters_update(submenu_id, 1).where(models.Submenu.menu_id == menu_id)
+                   .returning(models.Submenu.menu_id).cte('submenu_counters'))
+        menu = (menu_counters_update(submenu.c.menu_id, dishes=1).returning(models.Menu.id)
+                .add_cte(submenu).cte('menu_counters'))
+        db_dish = await session.scalar(insert(models.Dish).from_select(
+            ['id', 'title', 'description', 'price', 'submenu_id'],
+            select(literal(uuid.uuid4(), models.Dish.id.type), literal(dish.title, models.Dish.title.type),
+                   literal(dish.description, models.Dish.description.type),
+                   literal(Decimal(dish.price), models.Dish.price.type),
+                   literal(submenu_id, models.Dish.submenu_id.type)).select_from(menu),
+            include_defaults=False).returning(models.Dish))
+        if db_dish is None:
+            raise HTTPException(status_code=404, detail='submenu not found')
         await session.commit()
-        await session.refresh(db_dish)
         return schemas.Dish(id=db_dish.id,  # type: ignore
                             title=db_dish.title,  # type: ignore
                             description=db_dish.description,  # type: ignore
-                            price=str(float(round(float(db_dish.price), 2))),
+                            price=db_dish.price,  # type: ignore
                             submenu_id=db_dish.submenu_id)  # type: ignore
 
-    async def read_dish(self, dish_id: UUID, session: AsyncSession) -> schemas.Dish:
-        db_dish = await session.execute(select(models.Dish).where(models.Dish.id == dish_id))
+    async def read_dish(self, menu_id: UUID, submenu_id: UUID, dish_id: UUID, session: AsyncSession) -> schemas.Dish:
+        db_dish = await session.execute(select(models.Dish).where(*dish_in_path(menu_id, submenu_id, dish_id)))
         db_dish_row = db_dish.fetchone()
         if db_dish_row is None:
             raise HTTPException(status_code=404, detail='dish not found')
@@ -42,28 +106,47 @@ class DishRepository:
         return schemas.Dish(id=db_dish.id,  # type: ignore
                             title=db_dish.title,  # type: ignore
                             description=db_dish.description,  # type: ignore
-                            price=str(float(round(float(db_dish.price), 2))),  # type: ignore
-                            submenu_id=db_dish.submenu_id)  # type: ignore
+                            price=db_dish.price,  # type: ignore
+                            submenu_id=db_dish.submenu_id,  # type: ignore
+                            version=db_dish.version)  # type: ignore
 
-    async def update_dish(self, dish_id: UUID, dish: schemas.DishUpdate, session: AsyncSession) -> schemas.Dish:
-        db_dish = await session.get(models.Dish, dish_id)
+    async def update_dish(self, menu_id: UUID, submenu_id: UUID, dish_id: UUID, dish: schemas.DishUpdate,
+                          session: AsyncSession) -> schemas.Dish:
+        update_data = dish.dict(exclude_unset=True)
+        if 'price' in update_data:
+            update_data['price'] = Decimal(update_data['price'])
+        db_dish = (await session.execute(
+            update(models.Dish).where(*dish_in_path(menu_id, submenu_id, dish_id)).values(**update_data)
+            .returning(models.Dish.id, models.Dish.title, models.Dish.description, models.Dish.price,
+                       models.Dish.submenu_id)
+            .execution_options(synchronize_session=False))).one_or_none()
         if db_dish is None:
             raise HTTPException(status_code=404, detail='dish not found')
-        update_data = dish.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_dish, field, value)
         await session.commit()
-        await session.refresh(db_dish)
         return schemas.Dish(id=db_dish.id,  # type: ignore
                             title=db_dish.title,  # type: ignore
                             description=db_dish.description,  # type: ignore
-                            price=str(float(round(float(db_dish.price), 2))),
+                            price=db_dish.price,  # type: ignore
                             submenu_id=db_dish.submenu_id)
 
-    async def delete_dish(self, dish_id: UUID, session: AsyncSession) -> dict[str, str]:
-        db_dish = await session.get(models.Dish, dish_id)
-        if db_dish is None:
+    async def delete_dish(self, menu_id: UUID, submenu_id: UUID, dish_id: UUID,
+                          session: AsyncSession) -> dict[str, str]:
+        # блокировки в порядке create_dish и delete_submenu: сначала субменю, потом блюдо и меню,
+        # иначе одновременное удаление блюда и его субменю заканчивалось бы deadlock
+        locked_submenu_id = await session.scalar(
+            select(models.Submenu.id).where(models.Submenu.id == submenu_id, models.Submenu.menu_id == menu_id)
+            .with_for_update())
+        if locked_submenu_id is None:
+            raise HTTPException(status_code=404, detail='dish not found')
+        # снимок команды берется после блокировки, счетчики сдвигаются из RETURNING удаления:
+        # повторный DELETE того же блюда строку уже не найдет и счетчики не тронет
+        deleted = (delete(models.Dish).where(models.Dish.id == dish_id, models.Dish.submenu_id == submenu_id)
+                   .returning(models.Dish.submenu_id).cte('deleted_dish'))
+        submenu = (submenu_counters_update(deleted.c.submenu_id, -1).returning(models.Submenu.menu_id)
+                   .add_cte(deleted).cte('submenu_counters'))
+        deleted_menu_id = await session.scalar(
+            menu_counters_update(submenu.c.menu_id, dishes=-1).returning(models.Menu.id).add_cte(submenu))
+        if deleted_menu_id is None:
             raise HTTPException(status_code=404, detail='dish not found')
-        await session.delete(db_dish)
         await session.commit()
         return {'message': 'Dish deleted successfully'}
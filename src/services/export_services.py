@@ -0,0 +1,50 @@
+import csv
+import io
+from collections.abc import AsyncIterator
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from src.database import async_session_maker
+from src.restaurant import models, schemas
+
+# колонки - в порядке полей схемы и столбцов catalog_query
+EXPORT_COLUMNS = tuple(schemas.CatalogExportRow.model_fields)
+YIELD_PER = 1000
+# значения - через ту же схему, что и в API: цена '10.5', а не '10.50' из NUMERIC
+rows_adapter = TypeAdapter(list[schemas.CatalogExportRow])
+
+catalog_query = (
+    select(models.Menu.id, models.Menu.title, models.Menu.description,
+           models.Submenu.id, models.Submenu.title, models.Submenu.description,
+           models.Dish.id, models.Dish.title, models.Dish.description, models.Dish.price)
+    .select_from(models.Menu)
+    .outerjoin(models.Submenu, models.Submenu.menu_id == models.Menu.id)
+    .outerjoin(models.Dish, models.Dish.submenu_id == models.Submenu.id)
+)
+
+
+class ExportRepository:
+    """ выгрузка каталога; сессию открывает сам генератор, поэтому зависимости от сессии запроса нет """
+
+    async def export_partitions(self) -> AsyncIterator[list[schemas.CatalogExportRow]]:
+        """ строки каталога пачками через серверный курсор: в памяти не больше YIELD_PER строк """
+        # своя сессия: генератор дочитывается уже после выхода из обработчика и закрытия зависимостей
+        async with async_session_maker() as session:
+            result = await session.stream(catalog_query.execution_options(yield_per=YIELD_PER))
+            async for partition in result.partitions():
+                yield rows_adapter.validate_python([dict(zip(EXPORT_COLUMNS, row)) for row in partition])
+
+    async def export_ndjson(self) -> AsyncIterator[bytes]:
+        async for partition in self.export_partitions():
+            yield b''.join(row.model_dump_json().encode() + b'\n' for row in partition)
+
+    async def export_csv(self) -> AsyncIterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        async for partition in self.export_partitions():
+            writer.writerows(row.model_dump(mode='json').values() for row in partition)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
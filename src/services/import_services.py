@@ -0,0 +1,94 @@
+import uuid
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from decimal import Decimal
+from typing import Any
+
+from fastapi import Depends
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import get_async_session
+from src.restaurant import models, schemas
+
+BATCH_SIZE = 5000
+
+menus_adapter = TypeAdapter(list[schemas.MenuImport])
+
+
+async def insert_rows(session: AsyncSession, model: Any, rows: list[dict[str, Any]]) -> None:
+    """ вставка пачками: один executemany на BATCH_SIZE строк """
+    for start in range(0, len(rows), BATCH_SIZE):
+        await session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def parse_json(body: bytes) -> list[schemas.MenuImport]:
+    try:
+        return menus_adapter.validate_json(body)
+    except ValidationError as error:
+        raise RequestValidationError(error.errors())
+
+
+async def parse_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[schemas.MenuImport]:
+    """ NDJSON: одно меню с вложенными субменю и блюдами на строку, читаем потоком """
+    line_number, tail = 0, b''
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield _parse_ndjson_line(line, line_number)
+    if tail.strip():
+        yield _parse_ndjson_line(tail, line_number + 1)
+
+
+def _parse_ndjson_line(line: bytes, line_number: int) -> schemas.MenuImport:
+    try:
+        return schemas.MenuImport.model_validate_json(line)
+    except ValidationError as error:
+        raise RequestValidationError([{**item, 'loc': ('body', line_number, *item['loc'])}
+                                      for item in error.errors()])
+
+
+async def iterate(menus: Iterable[schemas.MenuImport]) -> AsyncIterator[schemas.MenuImport]:
+    for menu in menus:
+        yield menu
+
+
+class ImportRepository:
+    def __init__(self, session: AsyncSession = Depends(get_async_session)):
+        self.session: AsyncSession = session
+
+    async def import_catalog(self, menus: AsyncIterable[schemas.MenuImport],
+                             session: AsyncSession) -> dict[str, int]:
+        """ импорт дерева каталога одной транзакцией, строки уходят в БД пачками по мере чтения """
+        rows: dict[Any, list[dict[str, Any]]] = {models.Menu: [], models.Submenu: [], models.Dish: []}
+        imported = {'menus': 0, 'submenus': 0, 'dishes': 0}
+        async for menu in menus:
+            menu_id = uuid.uuid4()
+            rows[models.Menu].append({'id': menu_id, 'title': menu.title, 'description': menu.description,
+                                      'submenus_count': len(menu.submenus),
+                                      'dishes_count': sum(len(submenu.dishes) for submenu in menu.submenus)})
+            for submenu in menu.submenus:
+                submenu_id = uuid.uuid4()
+                rows[models.Submenu].append({'id': submenu_id, 'menu_id': menu_id, 'title': submenu.title,
+                                             'description': submenu.description,
+                                             'dishes_count': len(submenu.dishes)})
+                rows[models.Dish] += [{'id': uuid.uuid4(), 'submenu_id': submenu_id, 'title': dish.title,
+                                       'description': dish.description, 'price': Decimal(dish.price)}
+                                      for dish in submenu.dishes]
+            if sum(len(model_rows) for model_rows in rows.values()) >= BATCH_SIZE:
+                await self._flush(rows, imported, session)
+        await self._flush(rows, imported, session)
+        await session.commit()
+        return imported
+
+    async def _flush(self, rows: dict[Any, list[dict[str, Any]]], imported: dict[str, int],
+                     session: AsyncSession) -> None:
+        # родители раньше детей, чтобы внешние ключи уже существовали
+        for model, key in ((models.Menu, 'menus'), (models.Submenu, 'submenus'), (models.Dish, 'dishes')):
+            await insert_rows(session, model, rows[model])
+            imported[key] += len(rows[model])
+            rows[model].clear()
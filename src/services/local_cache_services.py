@@ -0,0 +1,346 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+from aioredis.exceptions import RedisError
+from fastapi_cache.backends import Backend
+from fastapi_cache.backends.redis import RedisBackend
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class LocalCache:
+    """ LRU в памяти процесса с TTL, ограниченный числом записей и суммарным размером значений """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        # номер последней инвалидации: значение, прочитанное из Redis до нее, в кэш не кладем
+        self.epoch = 0
+        self._entries: OrderedDict[str, tuple[float, Any, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_with_ttl(self, key: str) -> tuple[int, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0, None
+        expires_at, value, _ = entry
+        ttl = expires_at - time.monotonic()
+        if ttl <= 0:
+            self._pop(key)
+            return 0, None
+        self._entries.move_to_end(key)
+        return int(ttl), value
+
+    def get(self, key: str) -> Any:
+        return self.get_with_ttl(key)[1]
+
+    def set(self, key: str, value: Any, expire: float, size: int | None = None) -> None:
+        if size is None:
+            size = len(value) if isinstance(value, (str, bytes)) else 64
+        if expire <= 0 or size > self.max_bytes:
+            return
+        self._pop(key)
+        self._entries[key] = (time.monotonic() + expire, value, size)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._pop(next(iter(self._entries)))
+
+    def delete(self, *keys: str) -> None:
+        self.epoch += 1
+        for key in keys:
+            self._pop(key)
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self._entries.clear()
+        self.size = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+
+class SingleFlight:
+    """ конкурентные вызовы с одним ключом в пределах воркера ждут одно общее вычисление """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, asyncio.Future] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        while (future := self._calls.get(key)) is not None:
+            try:
+                # shield: отмена одного ожидающего не отменяет вычисление для остальных
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # отменили ведущий запрос (клиент отключился) - пробуем стать ведущим сами
+        future = asyncio.get_running_loop().create_future()
+        # исключение без ожидающих не должно попадать в лог как "never retrieved"
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+class CacheUnavailable(Exception):
+    """ Redis обходится: автомат разомкнут """
+
+
+class CircuitBreaker:
+    """ после failures ошибок подряд Redis обходится reset_timeout секунд, затем пропускается один пробный запрос """
+
+    def __init__(self, failures: int, reset_timeout: float):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.failed = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self.probing and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def success(self) -> None:
+        self.failed = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self) -> None:
+        self.failed += 1
+        self.probing = False
+        if self.failed >= self.failures:
+            if self.opened_at is None:
+                logger.warning('Redis failed %s times in a row, bypassing cache for %ss', self.failed,
+                               self.reset_timeout)
+            self.opened += 1
+            self.opened_at = time.monotonic()
+
+
+class CacheStats:
+    """ счетчики попаданий по уровням кэша; response - кэш готовых ответов перед роутером """
+
+    def __init__(self) -> None:
+        self.counters = {'response_hits': 0, 'response_misses': 0, 'local_hits': 0, 'local_misses': 0,
+                         'redis_hits': 0, 'redis_misses': 0, 'coalesced': 0, 'lock_waits': 0, 'stale_hits': 0}
+
+    def incr(self, counter: str) -> None:
+        self.counters[counter] += 1
+
+    def hit(self, tier: str, hit: bool) -> None:
+        self.counters[f"{tier}_{'hits' if hit else 'misses'}"] += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        stats: dict[str, Any] = dict(self.counters)
+        for tier in ('response', 'local', 'redis'):
+            total = self.counters[f'{tier}_hits'] + self.counters[f'{tier}_misses']
+            stats[f'{tier}_hit_ratio'] = round(self.counters[f'{tier}_hits'] / total, 4) if total else None
+        return stats
+
+
+class TwoTierBackend(Backend):
+    """ локальный LRU перед Redis; поколения тегов тоже кэшируются локально
+
+    Инвалидация поколений рассылается воркерам через Redis pub/sub (channel), поэтому
+    локальные копии поколений живут не дольше generation_ttl даже при потере сообщения.
+    """
+
+    def __init__(self, redis_backend: RedisBackend, local: LocalCache, generations: LocalCache,
+                 generation_ttl: float, channel: str, breaker: CircuitBreaker, reset_key: str,
+                 pubsub_redis: Any = None, on_invalidation: Callable[[], None] | None = None):
+        self.redis_backend = redis_backend
+        self.redis: Any = redis_backend.redis
+        self.local = local
+        self.generations = generations
+        self.generation_ttl = generation_ttl
+        self.channel = channel
+        self.stats = CacheStats()
+        self.flights = SingleFlight()
+        self.breaker = breaker
+        # поколение, сдвиг которого сбрасывает весь кэш: им восстанавливаем потерянные инвалидации
+        self.reset_key = reset_key
+        self.lost_invalidations = False
+        # подписка ждет сообщений дольше socket_timeout основного клиента
+        self.pubsub_redis = pubsub_redis or self.redis
+        # вызывается при каждой инвалидации, своей и чужой (записи каталога в любом воркере)
+        self.on_invalidation = on_invalidation
+
+    async def call(self, operation: Callable[[], Awaitable[T]]) -> T:
+        """ запрос к Redis через автомат: при разомкнутом автомате - сразу CacheUnavailable """
+        if not self.breaker.allow():
+            raise CacheUnavailable()
+        try:
+            result = await operation()
+        except (RedisError, OSError, asyncio.TimeoutError):
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return result
+
+    async def get_with_ttl(self, key: str) -> tuple[int, str | None]:
+        ttl, value = self.local.get_with_ttl(key)
+        self.stats.hit('local', value is not None)
+        if value is not None:
+            return ttl, value
+        ttl, value = await self.call(lambda: self.redis_backend.get_with_ttl(key))
+        self.stats.hit('redis', value is not None)
+        if value is not None and ttl > 0:
+            self.local.set(key, value, ttl)
+        return ttl, value
+
+    async def get(self, key: str) -> str | None:
+        return (await self.get_with_ttl(key))[1]
+
+    async def set(self, key: str, value: str, expire: int | None = None) -> None:
+        await self.call(lambda: self.redis_backend.set(key, value, expire))
+        if expire:
+            self.local.set(key, value, expire)
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        self.local.clear()
+        return await self.call(lambda: self.redis_backend.clear(namespace, key))
+
+    async def set_with_stale(self, key: str, stale_key: str, value: str, expire: int, stale_expire: int) -> None:
+        """ значение плюс его устаревшая копия, которую отдают, пока другой воркер пересчитывает ключ """
+        async def execute() -> None:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(key, value, ex=expire)
+                pipe.set(stale_key, value, ex=stale_expire)
+                await pipe.execute()
+
+        await self.call(execute)
+        self.local.set(key, value, expire)
+
+    async def acquire_lock(self, key: str, ttl: float) -> str | None:
+        """ короткая блокировка пересчета ключа между воркерами; None - она уже занята """
+        token = uuid.uuid4().hex
+        return token if await self.call(lambda: self.redis.set(key, token, nx=True, px=int(ttl * 1000))) else None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        # снимаем только свою блокировку; если она успела истечь и ее взял другой - не трогаем
+        if await self.call(lambda: self.redis.get(key)) == token:
+            await self.call(lambda: self.redis.delete(key))
+
+    async def wait_for(self, key: str, timeout: float, interval: float = 0.05) -> str | None:
+        """ ждать, пока значение положит держатель блокировки """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            value = await self.get_raw(key)
+            if value is not None:
+                return value
+        return None
+
+    async def get_raw(self, key: str) -> str | None:
+        """ значение только из Redis, мимо локального уровня и счетчиков попаданий """
+        return await self.call(lambda: self.redis.get(key))
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        """ значения одним MGET, мимо локального уровня """
+        return await self.call(lambda: self.redis.mget(keys))
+
+    async def set_many(self, values: dict[str, str], expire: int) -> None:
+        """ запись нескольких значений одним pipeline """
+        async def execute() -> None:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, value in values.items():
+                    pipe.set(key, value, ex=expire)
+                await pipe.execute()
+
+        await self.call(execute)
+
+    async def get_generations(self, keys: list[str]) -> list[str | None]:
+        if self.lost_invalidations:
+            await self.incr_generations([self.reset_key])
+            self.lost_invalidations = False
+        values = {key: self.generations.get(key) for key in keys}
+        missing = [key for key, value in values.items() if value is None]
+        if missing:
+            epoch = self.generations.epoch
+            fetched = await self.call(lambda: self.redis.mget(missing))
+            for key, value in zip(missing, fetched):
+                values[key] = value or '0'
+                if self.generations.epoch == epoch:
+                    self.generations.set(key, values[key], self.generation_ttl)
+        return [values[key] for key in keys]
+
+    async def incr_generations(self, keys: list[str]) -> None:
+        self.notify_invalidation()
+
+        async def execute() -> None:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.incr(key)
+                pipe.publish(self.channel, json.dumps(keys))
+                await pipe.execute()
+
+        try:
+            await self.call(execute)
+        except Exception:
+            # запись уже в БД, а старые значения в Redis остались: после восстановления сбросим весь кэш
+            self.lost_invalidations = True
+            raise
+        finally:
+            # после INCR: чтение, начатое раньше, уже не попадет в локальный кэш (epoch сдвинут)
+            self.generations.delete(*keys)
+
+    def notify_invalidation(self) -> None:
+        if self.on_invalidation is not None:
+            self.on_invalidation()
+
+    async def listen_invalidations(self) -> None:
+        """ подписка на инвалидации других воркеров, переподключается при ошибках """
+        while True:
+            try:
+                pubsub = self.pubsub_redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                # сообщения могли потеряться, пока подписки не было
+                self.generations.clear()
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.generations.delete(*json.loads(message['data']))
+                        self.notify_invalidation()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning('Cache invalidation listener failed, reconnecting', exc_info=True)
+                await asyncio.sleep(1)
@@ -1,57 +1,110 @@
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Any
 from uuid import UUID
 
 from fastapi import Depends, HTTPException
-from sqlalchemy import func, select
+from sqlalchemy import delete, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database import get_async_session
 from src.restaurant import models, schemas
 from src.restaurant.models import Menu
 
+COUNTERS = {'submenus_count', 'dishes_count'}
+
+
+def group_by(rows: Iterable[Any], attribute: str) -> dict[UUID, list[Any]]:
+    groups: dict[UUID, list[Any]] = defaultdict(list)
+    for row in rows:
+        groups[getattr(row, attribute)].append(row)
+    return groups
+
+
+def menu_tree(db_menu: models.Menu, submenus: dict[UUID, list[models.Submenu]],
+              dishes: dict[UUID, list[models.Dish]] | None) -> schemas.MenuTree:
+    """ собрать дерево меню из субменю и блюд, сгруппированных по родителю """
+    tree_submenus = []
+    for db_submenu in submenus.get(db_menu.id, []):  # type: ignore
+        submenu = schemas.SubmenuTree(id=db_submenu.id, title=db_submenu.title,  # type: ignore
+                                      description=db_submenu.description,  # type: ignore
+                                      dishes_count=db_submenu.dishes_count,  # type: ignore
+                                      version=db_submenu.version)  # type: ignore
+        if dishes is not None:
+            submenu.dishes = [schemas.Dish.model_validate(db_dish)
+                              for db_dish in dishes.get(db_submenu.id, [])]  # type: ignore
+        tree_submenus.append(submenu)
+    return schemas.MenuTree(id=db_menu.id, title=db_menu.title,  # type: ignore
+                            description=db_menu.description,  # type: ignore
+                            submenus_count=db_menu.submenus_count,  # type: ignore
+                            dishes_count=db_menu.dishes_count, version=db_menu.version,  # type: ignore
+                            submenus=tree_submenus)
+
 
 class MenuRepository:
     def __init__(self, session: AsyncSession = Depends(get_async_session)):
         self.session: AsyncSession = session
         self.model = Menu
 
-    async def get_menus(self, skip: int, limit: int, session: AsyncSession) -> list[schemas.Menu]:
-        menus = await session.execute(select(models.Menu).offset(skip).limit(limit))
+    async def get_menus(self, skip: int, limit: int, session: AsyncSession,
+                        cursor: UUID | None = None) -> list[schemas.Menu]:
+        query = select(models.Menu).order_by(models.Menu.id).limit(limit)
+        # с курсором страница начинается сразу за ним по индексу, без пропуска строк через offset
+        query = query.where(models.Menu.id > cursor) if cursor else query.offset(skip)
+        menus = await session.execute(query)
         return menus.scalars().all()  # type: ignore
 
     async def create_menu(self, menu: schemas.MenuCreate, session: AsyncSession) -> schemas.Menu:
-        db_menu = models.Menu(title=menu.title, description=menu.description)
-        session.add(db_menu)
+        # INSERT ... RETURNING: строка со значениями по умолчанию без повторного SELECT
+        db_menu = await session.scalar(insert(models.Menu).values(title=menu.title, description=menu.description)
+                                       .returning(models.Menu))
         await session.commit()
-        await session.refresh(db_menu)
-        return db_menu
+        return db_menu  # type: ignore
 
     async def read_menu(self, menu_id: UUID, session: AsyncSession) -> schemas.Menu:
+        # счетчики хранятся в самой строке меню
         db_menu = await session.get(models.Menu, menu_id)
         if db_menu is None:
             raise HTTPException(status_code=404, detail='menu not found')
 
-        submenus_count = await session.scalar(
-            select(func.count(models.Submenu.id)).join(models.Menu).where(models.Menu.id == menu_id))
-
-        dishes_count = await session.scalar(
-            select(func.count(models.Dish.id)).join(models.Submenu).join(models.Menu).where(models.Menu.id == menu_id))
-
         return schemas.Menu(
             id=str(db_menu.id),  # type: ignore
             title=db_menu.title,  # type: ignore
             description=db_menu.description,  # type: ignore
-            submenus_count=submenus_count,  # type: ignore
-            dishes_count=dishes_count  # type: ignore
+            submenus_count=db_menu.submenus_count,  # type: ignore
+            dishes_count=db_menu.dishes_count,  # type: ignore
+            version=db_menu.version  # type: ignore
         )
 
-    async def update_menu(self, menu_id: UUID, menu: schemas.MenuUpdate, session: AsyncSession) -> schemas.Menu:
+    async def get_menus_tree(self, session: AsyncSession) -> list[schemas.MenuTree]:
+        # три запроса без списков IN(...) переменной длины: текст запросов не меняется,
+        # и подготовленные запросы asyncpg переиспользуются
+        db_menus = (await session.scalars(select(models.Menu))).all()
+        submenus = group_by(await session.scalars(select(models.Submenu)), 'menu_id')
+        dishes = group_by(await session.scalars(select(models.Dish)), 'submenu_id')
+        return [menu_tree(db_menu, submenus, dishes) for db_menu in db_menus]
+
+    async def read_menu_tree(self, menu_id: UUID, include_dishes: bool, session: AsyncSession) -> schemas.MenuTree:
         db_menu = await session.get(models.Menu, menu_id)
         if db_menu is None:
             raise HTTPException(status_code=404, detail='menu not found')
-        for field, value in menu.dict(exclude_unset=True).items():
-            setattr(db_menu, field, value)
+        submenus = group_by(await session.scalars(
+            select(models.Submenu).where(models.Submenu.menu_id == menu_id)), 'menu_id')
+        dishes = None
+        if include_dishes:
+            dishes = group_by(await session.scalars(
+                select(models.Dish).join(models.Submenu).where(models.Submenu.menu_id == menu_id)), 'submenu_id')
+        return menu_tree(db_menu, submenus, dishes)
+
+    async def update_menu(self, menu_id: UUID, menu: schemas.MenuUpdate, session: AsyncSession) -> schemas.Menu:
+        db_menu = (await session.execute(
+            update(models.Menu).where(models.Menu.id == menu_id)
+            .values(**menu.dict(exclude_unset=True, exclude=COUNTERS))
+            .returning(models.Menu.id, models.Menu.title, models.Menu.description)
+            .execution_options(synchronize_session=False))).one_or_none()
+        if db_menu is None:
+            raise HTTPException(status_code=404, detail='menu not found')
         await session.commit()
-        await session.refresh(db_menu)
         return schemas.Menu(
             id=str(db_menu.id),  # type: ignore
             title=db_menu.title,  # type: ignore
@@ -59,9 +112,9 @@ class MenuRepository:
         )
 
     async def delete_menu(self, menu_id: UUID, session: AsyncSession) -> dict[str, str]:
-        db_menu = await session.get(models.Menu, menu_id)
-        if db_menu is None:
+        # субменю и блюда удаляет ON DELETE CASCADE одним запросом, без загрузки в сессию
+        deleted = await session.scalar(delete(models.Menu).where(models.Menu.id == menu_id).returning(models.Menu.id))
+        if deleted is None:
             raise HTTPException(status_code=404, detail='menu not found')
-        await session.delete(db_menu)
         await session.commit()
         return {'message': 'menu deleted successfully'}
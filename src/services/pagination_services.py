@@ -0,0 +1,44 @@
+import base64
+import binascii
+from collections.abc import Awaitable, Callable
+from functools import wraps
+from typing import Any
+from uuid import UUID
+
+from fastapi import HTTPException
+
+from src.services.cache_services import CachedResponse
+
+
+def encode_cursor(last_id: UUID | str) -> str:
+    """ непрозрачный курсор - id последнего элемента страницы """
+    return base64.urlsafe_b64encode(UUID(str(last_id)).bytes).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str | None) -> UUID | None:
+    if not cursor:
+        return None
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=422, detail='invalid cursor')
+
+
+def link_next_page(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """ добавляет заголовок Link rel="next", если страница заполнена до limit
+
+    Ставится над @cache: число элементов и id последнего берутся из записи кэша, без разбора тела.
+    """
+
+    @wraps(func)
+    async def inner(*args: Any, **kwargs: Any) -> Any:
+        page = await func(*args, **kwargs)
+        request = kwargs.get('request')
+        if isinstance(page, CachedResponse) and request is not None and page.last_id and \
+                page.count is not None and page.count >= kwargs['limit']:
+            next_url = request.url.remove_query_params('skip').include_query_params(
+                cursor=encode_cursor(page.last_id))
+            page.headers['Link'] = f'<{next_url}>; rel="next"'
+        return page
+
+    return inner
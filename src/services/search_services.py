@@ -0,0 +1,78 @@
+import re
+from uuid import UUID
+
+from fastapi import Depends
+from sqlalchemy import (
+    ColumnElement,
+    func,
+    literal,
+    literal_column,
+    null,
+    or_,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import get_async_session
+from src.restaurant import models, schemas
+
+WORD = re.compile(r'\w+')
+# pg_trgm ставится миграцией, если расширение есть на сервере; проверяется при первом поиске
+trigram: bool | None = None
+
+
+def normalize_query(query: str) -> str:
+    """ слова запроса в нижнем регистре через пробел: одинаковые по смыслу запросы - один ключ кэша """
+    return ' '.join(WORD.findall(query.lower()))
+
+
+def prefix_tsquery(query: str) -> str:
+    # каждое слово - префикс: 'марг пиц' находит 'Маргарита' и 'пицца'; \w+ не содержит операторов tsquery
+    return ' & '.join(f'{word}:*' for word in query.split())
+
+
+class SearchRepository:
+    def __init__(self, session: AsyncSession = Depends(get_async_session)):
+        self.session: AsyncSession = session
+
+    async def has_trigram(self, session: AsyncSession) -> bool:
+        global trigram
+        if trigram is None:
+            trigram = bool(await session.scalar(text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'")))
+        return trigram
+
+    async def search(self, query: str, menu_id: UUID | None, skip: int, limit: int,
+                     session: AsyncSession) -> list[schemas.SearchResult]:
+        """ блюда и субменю по релевантности: полнотекстовый поиск по префиксам слов, с pg_trgm - и с опечатками """
+        if not query:
+            return []
+        tsquery = func.to_tsquery(literal_column(f"'{models.SEARCH_CONFIG}'"), prefix_tsquery(query))
+        use_trigram = await self.has_trigram(session)
+
+        def ranked(model: type[models.Dish] | type[models.Submenu], fuzzy: list) -> tuple[ColumnElement, ColumnElement]:
+            vector = models.search_vector(model)
+            match = vector.bool_op('@@')(tsquery)
+            rank = func.ts_rank_cd(vector, tsquery)
+            if not use_trigram:
+                return match, rank
+            # <% - оператор word_similarity, его поддерживают GIN-индексы gin_trgm_ops
+            return (or_(match, *(literal(query).op('<%')(column) for column in fuzzy)),
+                    rank + func.word_similarity(query, model.title))
+
+        dish_match, dish_rank = ranked(models.Dish, [models.Dish.title, models.Dish.description])
+        dishes = (select(literal('dish').label('type'), models.Dish.id, models.Dish.title, models.Dish.description,
+                         models.Dish.price, models.Dish.submenu_id, models.Submenu.menu_id,
+                         dish_rank.label('rank'))
+                  .join(models.Submenu).where(dish_match))
+        submenu_match, submenu_rank = ranked(models.Submenu, [models.Submenu.title])
+        submenus = select(literal('submenu'), models.Submenu.id, models.Submenu.title, models.Submenu.description,
+                          null(), null(), models.Submenu.menu_id,
+                          submenu_rank).where(submenu_match)
+        if menu_id is not None:
+            dishes = dishes.where(models.Submenu.menu_id == menu_id)
+            submenus = submenus.where(models.Submenu.menu_id == menu_id)
+        found = dishes.union_all(submenus).subquery()
+        results = await session.execute(select(found).order_by(found.c.rank.desc(), found.c.id)
+                                        .offset(skip).limit(limit))
+        return results.all()  # type: ignore
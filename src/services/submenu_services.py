@@ -1,12 +1,14 @@
+import uuid
 from uuid import UUID
 
 from fastapi import Depends, HTTPException
-from sqlalchemy import func, select
+from sqlalchemy import any_, delete, insert, literal, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database import get_async_session
 from src.restaurant import models, schemas
 from src.restaurant.models import Submenu
+from src.services.counter_services import menu_counters_update
 
 
 class SubMenuRepository:
@@ -18,37 +20,49 @@ class SubMenuRepository:
         db_submenus = await session.execute(select(models.Submenu).filter(models.Submenu.menu_id == menu_id))
         return db_submenus.scalars().all()  # type: ignore
 
+    async def get_submenus_by_ids(self, submenu_ids: list[UUID], session: AsyncSession) -> list[Submenu]:
+        """ субменю по списку id одним запросом """
+        db_submenus = await session.execute(select(models.Submenu)
+                                            .where(models.Submenu.id == any_(models.id_array(submenu_ids))))
+        return db_submenus.scalars().all()  # type: ignore
+
     async def create_submenu(self, menu_id: UUID, submenu: schemas.SubmenuBase,
                              session: AsyncSession) -> models.Submenu:
-        db_submenu = models.Submenu(title=submenu.title, description=submenu.description, menu_id=menu_id)
-        session.add(db_submenu)
+        # одна команда: сдвиг счетчика меню в CTE и вставка из его RETURNING - нет меню, нет и строки
+        menu = menu_counters_update(menu_id, submenus=1).returning(models.Menu.id).cte('menu_counters')
+        db_submenu = await session.scalar(insert(models.Submenu).from_select(
+            ['id', 'title', 'description', 'menu_id'],
+            select(literal(uuid.uuid4(), models.Submenu.id.type), literal(submenu.title, models.Submenu.title.type),
+                   literal(submenu.description, models.Submenu.description.type), menu.c.id),
+            include_defaults=False).returning(models.Submenu))
+        if db_submenu is None:
+            raise HTTPException(status_code=404, detail='menu not found')
         await session.commit()
-        await session.refresh(db_submenu)
         return db_submenu
 
     async def read_submenu(self, menu_id: UUID, submenu_id: UUID, session: AsyncSession) -> schemas.Submenu:
         db_submenu = await session.get(models.Submenu, submenu_id)
         if db_submenu is None or db_submenu.menu_id != menu_id:
             raise HTTPException(status_code=404, detail='submenu not found')
-        dishes_count = await session.scalar(
-            select(func.count(models.Dish.id)).join(models.Submenu).where(models.Submenu.id == submenu_id))
         return schemas.Submenu(
             id=str(db_submenu.id),  # type: ignore
             title=db_submenu.title,  # type: ignore
             description=db_submenu.description,  # type: ignore
             menu_id=menu_id,
-            dishes_count=dishes_count
+            dishes_count=db_submenu.dishes_count,  # type: ignore
+            version=db_submenu.version  # type: ignore
         )
 
     async def update_submenu(self, menu_id: UUID, submenu_id: UUID, submenu: schemas.SubmenuUpdate,
                              session: AsyncSession) -> schemas.Submenu:
-        db_submenu = await session.get(models.Submenu, submenu_id)
-        if db_submenu is None or db_submenu.menu_id != menu_id:
+        db_submenu = (await session.execute(
+            update(models.Submenu).where(models.Submenu.id == submenu_id, models.Submenu.menu_id == menu_id)
+            .values(**submenu.dict(exclude_unset=True, exclude={'dishes_count'}))
+            .returning(models.Submenu.id, models.Submenu.title, models.Submenu.description)
+            .execution_options(synchronize_session=False))).one_or_none()
+        if db_submenu is None:
             raise HTTPException(status_code=404, detail='submenu not found')
-        for field, value in submenu.dict(exclude_unset=True).items():
-            setattr(db_submenu, field, value)
         await session.commit()
-        await session.refresh(db_submenu)
         return schemas.Submenu(
             id=str(db_submenu.id),  # type: ignore
             title=db_submenu.title,  # type: ignore
@@ -57,10 +71,13 @@ class SubMenuRepository:
         )
 
     async def delete_submenu(self, menu_id: UUID, submenu_id: UUID, session: AsyncSession) -> dict[str, str]:
-        db_submenu = await session.get(models.Submenu, submenu_id)
-        if db_submenu is None or db_submenu.menu_id != menu_id:
+        # блюда удаляет ON DELETE CASCADE; число блюд для счетчиков меню - из удаленной (заблокированной) строки
+        dishes_count = await session.scalar(
+            delete(models.Submenu).where(models.Submenu.id == submenu_id, models.Submenu.menu_id == menu_id)
+            .returning(models.Submenu.dishes_count))
+        if dishes_count is None:
             raise HTTPException(status_code=404, detail='submenu not found')
-        await session.delete(db_submenu)
+        await session.execute(menu_counters_update(menu_id, submenus=-1, dishes=-dishes_count))
         await session.commit()
 
         return {'message': 'Submenu and all associated dishes deleted successfully'}
@@ -1,7 +1,3 @@
-import aioredis
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
+from src.services.cache_services import init_cache
 
-redis = aioredis.from_url('redis://localhost', encoding='utf8', decode_responses=True)
-FastAPICache.init(RedisBackend(redis), prefix='fastapi-cache')
-redis.flushdb()  # type: ignore
+init_cache()
@@ -1,13 +1,16 @@
 import asyncio
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Generator
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database import async_session_maker, engine, get_async_session
 from src.main import app
+from src.profiler import RequestProfile, record_profiles
 from src.restaurant.models import metadata
+from src.services.cache_services import invalidate_catalog
 
 # DATABASE
 metadata.bind = engine  # type: ignore
@@ -35,6 +38,34 @@ async def async_client() -> AsyncGenerator[AsyncClient, None]:
         yield async_clients
 
 
+# тесты чистят таблицы напрямую через SQL, поэтому сбрасываем кэш каталога на границах модулей
+@pytest.fixture(autouse=True, scope='module')
+async def reset_cache() -> AsyncGenerator[None, None]:
+    await invalidate_catalog()
+    yield
+    await invalidate_catalog()
+
+
+# список SQL-запросов, выполненных во время теста
+@pytest.fixture
+def statements() -> Generator[list[str], None, None]:
+    executed: list[str] = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    yield executed
+    event.remove(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+
+
+# профили SQL HTTP-запросов, завершенных во время теста
+@pytest.fixture
+def sql_profiles() -> Generator[list[RequestProfile], None, None]:
+    with record_profiles() as profiles:
+        yield profiles
+
+
 # Тестовая БД
 # @pytest.fixture(autouse=True, scope='session')
 # async def prepare_database():
@@ -0,0 +1,109 @@
+import uuid
+
+from sqlalchemy import text
+
+from tests.conftest import async_session_maker
+
+DISHES_URL = '/api/v1/dishes:batchGet'
+SUBMENUS_URL = '/api/v1/submenus:batchGet'
+
+
+# удаляем все в начале
+async def test_start_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
+
+
+# Блюда по списку id: порядок запроса, not_found, повторный запрос из кэша
+async def test_batch_get_dishes(async_client, statements):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Menu', 'description': 'Menu'})
+    menu_id = response_menu.json()['id']
+    response_submenu = await async_client.post(f'/api/v1/menus/{menu_id}/submenus',
+                                               json={'title': 'Submenu', 'description': 'Submenu'})
+    submenu_id = response_submenu.json()['id']
+    dishes_url = f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes'
+    dish_ids = []
+    for number in range(3):
+        response_dish = await async_client.post(dishes_url, json={'title': f'Dish {number}',
+                                                                  'description': f'Dish {number}', 'price': '1.50'})
+        dish_ids.append(response_dish.json()['id'])
+    missing_id = str(uuid.uuid4())
+    ids = [dish_ids[2], missing_id, dish_ids[0], dish_ids[2]]
+
+    statements.clear()
+    response = await async_client.post(DISHES_URL, json={'ids': ids})
+    assert response.status_code == 200
+    assert [dish['id'] for dish in response.json()['dishes']] == [dish_ids[2], dish_ids[0]]
+    assert response.json()['dishes'][0] == {'id': dish_ids[2], 'title': 'Dish 2', 'description': 'Dish 2',
+                                            'price': '1.5'}
+    assert response.json()['not_found'] == [missing_id]
+    # один запрос на весь список
+    assert len(statements) == 1
+    assert '= ANY' in statements[0]
+
+    statements.clear()
+    response = await async_client.post(DISHES_URL, json={'ids': ids})
+    assert [dish['id'] for dish in response.json()['dishes']] == [dish_ids[2], dish_ids[0]]
+    # ненайденные id не кэшируются
+    assert len(statements) == 1
+
+    statements.clear()
+    response = await async_client.post(DISHES_URL, json={'ids': [dish_ids[0], dish_ids[2]]})
+    assert len(response.json()['dishes']) == 2
+    assert statements == []
+
+    # изменение блюда сбрасывает его запись
+    update_dish = {'title': 'Updated', 'description': 'Updated', 'price': '2.00'}
+    await async_client.patch(f'{dishes_url}/{dish_ids[0]}', json=update_dish)
+    response = await async_client.post(DISHES_URL, json={'ids': dish_ids[:2]})
+    assert [dish['title'] for dish in response.json()['dishes']] == ['Updated', 'Dish 1']
+
+    # удаление субменю сбрасывает записи его блюд
+    await async_client.delete(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}')
+    response = await async_client.post(DISHES_URL, json={'ids': dish_ids[:2]})
+    assert response.json() == {'dishes': [], 'not_found': dish_ids[:2]}
+
+
+# Субменю по списку id
+async def test_batch_get_submenus(async_client, statements):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Menu 2', 'description': 'Menu 2'})
+    menu_id = response_menu.json()['id']
+    response_submenu = await async_client.post(f'/api/v1/menus/{menu_id}/submenus',
+                                               json={'title': 'Submenu 2', 'description': 'Submenu 2'})
+    submenu_id = response_submenu.json()['id']
+    await async_client.post(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes',
+                            json={'title': 'Dish', 'description': 'Dish', 'price': '1.00'})
+
+    response = await async_client.post(SUBMENUS_URL, json={'ids': [submenu_id]})
+    assert response.status_code == 200
+    assert response.json() == {'submenus': [{'id': submenu_id, 'title': 'Submenu 2', 'description': 'Submenu 2',
+                                             'dishes_count': 1}], 'not_found': []}
+
+    statements.clear()
+    await async_client.post(SUBMENUS_URL, json={'ids': [submenu_id]})
+    assert statements == []
+
+    # новое блюдо меняет счетчик субменю
+    await async_client.post(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes',
+                            json={'title': 'Dish 2', 'description': 'Dish 2', 'price': '1.00'})
+    response = await async_client.post(SUBMENUS_URL, json={'ids': [submenu_id]})
+    assert response.json()['submenus'][0]['dishes_count'] == 2
+
+
+# Пустой и слишком длинный список отклоняются
+async def test_batch_get_limits(async_client):
+    assert (await async_client.post(DISHES_URL, json={'ids': []})).status_code == 422
+    ids = [str(uuid.uuid4()) for _ in range(501)]
+    assert (await async_client.post(SUBMENUS_URL, json={'ids': ids})).status_code == 422
+
+
+# удаляем все в конце
+async def test_end_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
@@ -0,0 +1,72 @@
+import random
+
+from sqlalchemy import event
+
+from benchmarks import delete_menu, response_cache
+from benchmarks.catalog import clear_catalog, seed_catalog
+from benchmarks.load_test import (
+    SCENARIOS,
+    count_query,
+    load_catalog,
+    plan,
+    run,
+    summarize,
+)
+from src.database import engine
+from src.services.cache_services import invalidate_catalog
+from tests.conftest import async_session_maker
+
+
+# удаляем все в начале и засеиваем маленький каталог
+async def test_start_seed_catalog():
+    async with async_session_maker() as session:
+        await clear_catalog(session)
+        menu_ids = await seed_catalog(session, 2, 2, 3, seed=1)
+        await clear_catalog(session)
+        assert await seed_catalog(session, 2, 2, 3, seed=1) == menu_ids
+    await invalidate_catalog()
+
+
+# Каждый сценарий нагрузочного прогона проходит без ошибок, SQL-запросы считаются по запросам
+async def test_load_test_scenarios(async_client):
+    rng = random.Random(0)
+    catalog = await load_catalog(rng)
+    scenarios = [(name, seed) for name in SCENARIOS for seed in range(2)] + plan(rng, 40, 0.5)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', count_query)
+    try:
+        samples = await run(async_client, catalog, scenarios, 4, True)
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', count_query)
+
+    assert len(samples) == len(scenarios)
+    assert [sample for sample in samples if sample.status >= 400] == []
+    summary = summarize(samples)
+    assert summary['requests'] == len(scenarios)
+    assert summary['queries_per_request'] > 0
+    assert summary['latency_ms']['p50'] <= summary['latency_ms']['p99']
+    # запись всегда идет в БД
+    assert all(sample.queries for sample in samples if sample.scenario.startswith('create'))
+
+
+# Бенчмарк удаления меню: каскад в БД - один запрос, каскад ORM - по запросу на уровень и на DELETE
+async def test_delete_menu_benchmark(capsys):
+    await delete_menu.main(2, 3, 1, orm=True)
+    output = capsys.readouterr().out
+    assert 'cascade' in output and '1 statement(s)' in output
+    assert 'orm' in output
+
+
+# Бенчмарк попаданий: оба режима отвечают, меню бенчмарка удаляется
+async def test_response_cache_benchmark(capsys):
+    results = await response_cache.main(3, 20)
+    output = capsys.readouterr().out
+    assert 'response cache' in output and '@cache' in output
+    assert len(results) == 9
+    assert all(result['p50'] <= result['p99'] for result in results.values())
+
+
+# удаляем все в конце
+async def test_end_clean_catalog():
+    async with async_session_maker() as session:
+        await clear_catalog(session)
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+import pytest
+from sqlalchemy import text
+
+from src.database import get_async_session
+from src.main import app
+from src.services.counter_services import CounterRepository
+from tests.conftest import async_session_maker
+
+CATALOG = [
+    {'title': 'Import menu 1', 'description': 'Import menu 1', 'submenus': [
+        {'title': 'Import submenu 1', 'description': 'Import submenu 1', 'dishes': [
+            {'title': 'Import dish 1', 'description': 'Import dish 1', 'price': '10.50'},
+            {'title': 'Import dish 2', 'description': 'Import dish 2', 'price': '11.00'},
+        ]},
+        {'title': 'Import submenu 2', 'description': 'Import submenu 2'},
+    ]},
+    {'title': 'Import menu 2', 'description': 'Import menu 2'},
+]
+
+
+# удаляем все в начале
+async def test_start_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
+
+
+# Импорт каталога JSON-массивом
+async def test_import_json(async_client):
+    response_menus = await async_client.get('/api/v1/menus')
+    assert response_menus.json() == []
+
+    response_import = await async_client.post('/api/v1/menus/import', json=CATALOG)
+    assert response_import.status_code == 201
+    assert response_import.json() == {'menus': 2, 'submenus': 2, 'dishes': 2}
+
+    # список меню из кэша инвалидирован
+    response_menus = await async_client.get('/api/v1/menus')
+    menus = {menu['title']: menu for menu in response_menus.json()}
+    assert menus['Import menu 1']['submenus_count'] == 2
+    assert menus['Import menu 1']['dishes_count'] == 2
+    async with async_session_maker() as session:
+        assert await CounterRepository().check_counters(session) == {'menus': [], 'submenus': []}
+
+
+# Импорт каталога NDJSON, ошибка в любой строке откатывает весь импорт
+async def test_import_ndjson(async_client):
+    body = '\n'.join(json.dumps(menu) for menu in CATALOG)
+    response_import = await async_client.post('/api/v1/menus/import', content=body,
+                                              headers={'Content-Type': 'application/x-ndjson'})
+    assert response_import.status_code == 201
+    assert response_import.json() == {'menus': 2, 'submenus': 2, 'dishes': 2}
+
+    body += '\n' + json.dumps({'description': 'no title'})
+    response_import = await async_client.post('/api/v1/menus/import', content=body,
+                                              headers={'Content-Type': 'application/x-ndjson'})
+    assert response_import.status_code == 422
+    assert response_import.json()['detail'][0]['loc'][:2] == ['body', 3]
+
+    response_menus = await async_client.get('/api/v1/menus')
+    assert len(response_menus.json()) == 4
+
+
+# Потоковая выгрузка каталога: строка на блюдо, пустые субменю и меню - строкой без блюда
+async def test_export(async_client, monkeypatch):
+    # выгрузка читает своей сессией, сессия запроса не открывается
+    monkeypatch.setitem(app.dependency_overrides, get_async_session, lambda: pytest.fail('request session opened'))
+    response_export = await async_client.get('/api/v1/menus/export')
+    assert response_export.status_code == 200
+    assert response_export.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response_export.text.splitlines()]
+    assert len(rows) == 8
+    # цена - в формате API
+    assert sorted(row['dish_price'] for row in rows if row['dish_id']) == ['10.5', '10.5', '11.0', '11.0']
+
+    response_export = await async_client.get('/api/v1/menus/export?format=csv')
+    assert response_export.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response_export.text)))
+    assert len(rows) == 8
+    assert {row['menu_title'] for row in rows} == {'Import menu 1', 'Import menu 2'}
+    assert sorted(row['dish_price'] for row in rows if row['dish_id']) == ['10.5', '10.5', '11.0', '11.0']
+
+
+# удаляем все в конце
+async def test_end_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
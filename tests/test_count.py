@@ -3,6 +3,7 @@ import uuid
 from sqlalchemy import text
 
 from src.restaurant import schemas
+from src.services.counter_services import CounterRepository
 from tests.conftest import async_session_maker
 
 
@@ -91,6 +92,60 @@ async def test_create_dish(async_client):
     assert dish_counts_submenu.dishes_count == 2
 
 
+# Проверка и пересчет сохраненных счетчиков
+async def test_repair_counters():
+    counters = CounterRepository()
+    async with async_session_maker() as session:
+        assert await counters.check_counters(session) == {'menus': [], 'submenus': []}
+        await session.execute(text('UPDATE menu SET dishes_count = dishes_count + 5'))
+        await session.execute(text('UPDATE submenu SET dishes_count = 0'))
+        await session.commit()
+
+        broken = await counters.check_counters(session)
+        assert len(broken['menus']) == 1
+        assert len(broken['submenus']) == 1
+
+        await counters.repair_counters(session)
+        assert await counters.check_counters(session) == {'menus': [], 'submenus': []}
+
+
+# Кэш счетчиков инвалидируется при записи блюда
+async def test_counts_cache_invalidation(async_client):
+    response_menu = await async_client.get('/api/v1/menus')
+    assert response_menu.status_code == 200
+    menu_id = response_menu.json()[0]['id']
+
+    response_submenu = await async_client.get(f'/api/v1/menus/{menu_id}/submenus')
+    assert response_submenu.status_code == 200
+    submenu_id = response_submenu.json()[0]['id']
+
+    # прогреваем кэш
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}')
+    assert response_menu.json()['dishes_count'] == 2
+    response_dishes = await async_client.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes')
+    assert len(response_dishes.json()) == 2
+
+    new_dish = {'title': 'New dish 3', 'description': 'New dish description 3', 'price': '5.50'}
+    response_dish = await async_client.post(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes', json=new_dish)
+    assert response_dish.status_code == 201
+    dish_id = response_dish.json()['id']
+
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}')
+    assert response_menu.json()['dishes_count'] == 3
+    response_submenu = await async_client.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}')
+    assert response_submenu.json()['dishes_count'] == 3
+    response_dishes = await async_client.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes')
+    assert len(response_dishes.json()) == 3
+
+    # удаление меню инвалидирует все поддерево
+    response_dish = await async_client.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}')
+    assert response_dish.status_code == 200
+    response_delete = await async_client.delete(f'/api/v1/menus/{menu_id}')
+    assert response_delete.status_code == 200
+    response_dish = await async_client.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}')
+    assert response_dish.status_code == 404
+
+
 # удаляем все в конце
 async def test_end_clean_dish_table():
     async with async_session_maker() as session:
@@ -152,6 +152,33 @@ async def test_update_dish(async_client):
     assert updated_dish_data.description == update_dish['description']
 
 
+# Блюдо по пути чужого субменю или меню не читается, не создается, не меняется и не удаляется
+async def test_dish_wrong_path(async_client):
+    menu_id = (await async_client.get('/api/v1/menus')).json()[0]['id']
+    submenu_id = (await async_client.get(f'/api/v1/menus/{menu_id}/submenus')).json()[0]['id']
+    dishes_url = f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes'
+    dish = (await async_client.get(dishes_url)).json()[0]
+    response_submenu = await async_client.post(f'/api/v1/menus/{menu_id}/submenus',
+                                               json={'title': 'Other submenu', 'description': 'Other'})
+    other_submenu_id = response_submenu.json()['id']
+
+    for url in (f"/api/v1/menus/{menu_id}/submenus/{other_submenu_id}/dishes/{dish['id']}",
+                f"/api/v1/menus/{uuid.uuid4()}/submenus/{submenu_id}/dishes/{dish['id']}"):
+        response = await async_client.patch(url, json={'title': 'Moved', 'description': 'Moved', 'price': '1.00'})
+        assert response.status_code == 404
+        assert (await async_client.delete(url)).status_code == 404
+        assert (await async_client.get(url)).status_code == 404
+        assert (await async_client.get(url.rsplit('/', 1)[0])).json() == []
+    assert (await async_client.get(f"{dishes_url}/{dish['id']}")).json() == dish
+
+    dishes_count = (await async_client.get(f'/api/v1/menus/{menu_id}')).json()['dishes_count']
+    response = await async_client.post(f'/api/v1/menus/{uuid.uuid4()}/submenus/{submenu_id}/dishes',
+                                       json={'title': 'Lost', 'description': 'Lost', 'price': '1.00'})
+    assert response.status_code == 404
+    assert (await async_client.get(f'/api/v1/menus/{menu_id}')).json()['dishes_count'] == dishes_count
+    await async_client.delete(f'/api/v1/menus/{menu_id}/submenus/{other_submenu_id}')
+
+
 # Тест на удаление dish
 async def test_delete_single_dish(async_client):
     # Получаем ID существующего menu
@@ -181,6 +208,42 @@ async def test_delete_single_dish(async_client):
     assert response_delete_dish.status_code == 404
 
 
+# Фильтр по цене, сортировка по цене и следующая страница по курсору
+async def test_dishes_price_filter(async_client):
+    response_menu = await async_client.get('/api/v1/menus')
+    menu_id = response_menu.json()[0]['id']
+    response_submenu = await async_client.get(f'/api/v1/menus/{menu_id}/submenus')
+    submenu_id = response_submenu.json()[0]['id']
+    dishes_url = f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes'
+
+    for title, price in (('Dish 30', '30.00'), ('Dish 5', '5.5'), ('Dish 20', '20.25'), ('Dish 20 bis', '20.25')):
+        response_dish = await async_client.post(dishes_url, json={'title': title, 'price': price})
+        assert response_dish.status_code == 201
+    response_dish = await async_client.post(dishes_url, json={'title': 'Dish', 'price': 'free'})
+    assert response_dish.status_code == 422
+
+    response_dishes = await async_client.get(f'{dishes_url}?order_by=price')
+    assert [dish['price'] for dish in response_dishes.json()] == ['5.5', '20.25', '20.25', '30.0']
+
+    response_dishes = await async_client.get(f'{dishes_url}?min_price=10&max_price=25&order_by=price')
+    assert sorted(dish['title'] for dish in response_dishes.json()) == ['Dish 20', 'Dish 20 bis']
+
+    # одинаковые цены не теряются на границе страниц
+    response_dishes = await async_client.get(f'{dishes_url}?order_by=price&limit=2')
+    first_page = response_dishes.json()
+    next_url = response_dishes.headers['Link'].split(';')[0].strip('<>')
+    response_dishes = await async_client.get(next_url)
+    assert [dish['price'] for dish in first_page + response_dishes.json()] == ['5.5', '20.25', '20.25', '30.0']
+
+    # блюдо курсора удалено: ошибка, а не пустая страница, похожая на конец списка
+    await async_client.delete(f"{dishes_url}/{first_page[-1]['id']}")
+    response_dishes = await async_client.get(next_url)
+    assert response_dishes.status_code == 422
+
+    response_dishes = await async_client.get(f'{dishes_url}?order_by=title')
+    assert response_dishes.status_code == 422
+
+
 # удаляем все в конце
 async def test_end_clean_dish_table():
     async with async_session_maker() as session:
@@ -1,8 +1,14 @@
 import uuid
 
+import aioredis
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
 from sqlalchemy import text
 
+from src.response_cache import responses
 from src.restaurant import schemas
+from src.services.cache_services import PREFIX, get_backend
+from src.services.local_cache_services import CircuitBreaker, LocalCache, TwoTierBackend
 from tests.conftest import async_session_maker
 
 
@@ -49,6 +55,63 @@ async def test_read_menu(async_client):
     assert menu.description == 'My menu description 1'
 
 
+# Повторное чтение menu обслуживается локальным уровнем кэша (кэш готовых ответов перед ним сброшен)
+async def test_read_menu_local_cache(async_client):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Cached menu'})
+    menu_id = response_menu.json()['id']
+    await async_client.get(f'/api/v1/menus/{menu_id}')
+    responses.clear()
+    local_hits = (await async_client.get('/api/v1/cache/stats')).json()['local_hits']
+
+    response = await async_client.get(f'/api/v1/menus/{menu_id}')
+    assert response.status_code == 200
+    assert response.json()['title'] == 'Cached menu'
+    stats = (await async_client.get('/api/v1/cache/stats')).json()
+    assert stats['local_hits'] == local_hits + 1
+    assert stats['local_entries'] > 0
+
+
+# Redis недоступен: после нескольких ошибок кэш обходится, меню отдается из БД
+async def test_read_menu_redis_down(async_client):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Menu without cache'})
+    menu_id = response_menu.json()['id']
+
+    backend = get_backend()
+    # на порту 1 никто не слушает
+    redis = aioredis.from_url('redis://127.0.0.1:1', decode_responses=True, socket_connect_timeout=0.1)
+    broken = TwoTierBackend(RedisBackend(redis), local=LocalCache(100, 1024 * 1024),
+                            generations=LocalCache(100, 1024 * 1024), generation_ttl=5,
+                            channel=backend.channel, breaker=CircuitBreaker(2, 60), reset_key=backend.reset_key)
+    FastAPICache.reset()
+    FastAPICache.init(broken, prefix=PREFIX)
+    try:
+        for _ in range(3):
+            response = await async_client.get(f'/api/v1/menus/{menu_id}')
+            assert response.status_code == 200
+            assert response.json()['title'] == 'Menu without cache'
+            assert 'ETag' in response.headers
+        assert broken.breaker.state == 'open'
+        assert broken.breaker.rejected > 0
+
+        # инвалидация теряется, пока Redis недоступен
+        response = await async_client.patch(f'/api/v1/menus/{menu_id}', json={'title': 'Updated without cache'})
+        assert response.status_code == 200
+        assert broken.lost_invalidations
+
+        # Redis вернулся: пробный запрос замыкает автомат и сбрасывает весь кэш
+        broken.redis_backend, broken.redis = backend.redis_backend, backend.redis
+        broken.breaker.reset_timeout = 0
+        generation = int(await backend.redis.get(backend.reset_key) or 0)
+        response = await async_client.get(f'/api/v1/menus/{menu_id}')
+        assert response.json()['title'] == 'Updated without cache'
+        assert broken.breaker.state == 'closed'
+        assert not broken.lost_invalidations
+        assert int(await backend.redis.get(backend.reset_key)) == generation + 1
+    finally:
+        FastAPICache.reset()
+        FastAPICache.init(backend, prefix=PREFIX)
+
+
 # Тест на обновление menu
 async def test_update_menu(async_client):
     # Создаем новое меню
@@ -84,6 +147,27 @@ async def test_delete_menu(async_client):
     assert response_menu.json()['detail'] == 'menu not found'
 
 
+# Тест на постраничное чтение menu по курсору
+async def test_read_menus_cursor(async_client):
+    for number in range(3):
+        response_menu = await async_client.post('/api/v1/menus', json={'title': f'Page menu {number}'})
+        assert response_menu.status_code == 201
+    response_all = await async_client.get('/api/v1/menus')
+    all_ids = [menu['id'] for menu in response_all.json()]
+
+    page_ids = []
+    url = '/api/v1/menus?limit=2'
+    while url:
+        response_page = await async_client.get(url)
+        assert response_page.status_code == 200
+        page_ids += [menu['id'] for menu in response_page.json()]
+        url = response_page.links.get('next', {}).get('url')
+    assert page_ids == all_ids
+
+    response_page = await async_client.get('/api/v1/menus?cursor=not-a-cursor')
+    assert response_page.status_code == 422
+
+
 # удаляем все в конце
 async def test_end_clean_menu_table():
     async with async_session_maker() as session:
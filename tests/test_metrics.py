@@ -0,0 +1,68 @@
+from sqlalchemy import text
+
+from tests.conftest import async_session_maker
+
+
+async def test_start_clean_menu_table():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
+
+
+async def scrape(async_client) -> dict[str, float]:
+    response = await async_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+# Метрики маршрутов, запросов к БД, пула и кэша
+async def test_metrics(async_client):
+    response = await async_client.post('/api/v1/menus', json={'title': 'Menu', 'description': 'Description'})
+    menu_id = response.json()['id']
+    route = 'route="/api/v1/menus/{menu_id}"'
+    before = await scrape(async_client)
+
+    assert (await async_client.get(f'/api/v1/menus/{menu_id}')).status_code == 200
+    assert (await async_client.get(f'/api/v1/menus/{menu_id}')).status_code == 200
+    assert (await async_client.get('/api/v1/unknown')).status_code == 404
+    after = await scrape(async_client)
+
+    def delta(sample: str) -> float:
+        return after.get(sample, 0) - before.get(sample, 0)
+
+    # в пути - шаблон маршрута, а не id
+    assert delta(f'http_requests_total{{method="GET",{route},status="200"}}') == 2
+    assert delta('http_requests_total{method="GET",route="<unmatched>",status="404"}') == 1
+    assert delta(f'http_request_duration_seconds_count{{method="GET",{route}}}') == 2
+    assert delta(f'http_request_duration_seconds_bucket{{method="GET",{route},le="+Inf"}}') == 2
+    # промах читает меню из БД, попадание - нет
+    assert delta(f'http_request_db_statements_sum{{method="GET",{route}}}') >= 1
+    assert delta(f'http_request_db_statements_bucket{{method="GET",{route},le="0"}}') == 1
+    assert delta('db_statements_total') >= 1
+    assert after['db_pool_size'] > 0
+    prefix = 'prefix="fastapi-cache:v2:read_menu_handler"'
+    assert delta(f'cache_requests_total{{{route},{prefix},result="miss"}}') == 1
+    # повторный запрос отдан кэшем готовых ответов, до @cache он не дошел
+    assert delta(f'cache_requests_total{{{route},{prefix},result="hit"}}') == 0
+    asgi_prefix = 'prefix="fastapi-cache:asgi"'
+    assert delta(f'cache_requests_total{{{route},{asgi_prefix},result="miss"}}') == 1
+    assert delta(f'cache_requests_total{{{route},{asgi_prefix},result="hit"}}') == 1
+    assert after['cache_response_bytes'] > 0
+    # запрос самого /metrics еще выполняется
+    assert after['http_requests_in_flight{method="GET"}'] == 1
+
+
+async def test_end_clean_menu_table():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
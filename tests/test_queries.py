@@ -0,0 +1,425 @@
+import asyncio
+import logging
+import re
+import uuid
+
+from sqlalchemy import func, select, text
+
+from src import profiler
+from src.database import engine
+from src.restaurant import models
+from src.services.cache_services import (
+    get_backend,
+    invalidate_menu,
+    lock_key,
+    recompute,
+    stale_key,
+)
+from src.services.dish_services import DishRepository
+from src.services.menu_services import MenuRepository
+from tests.conftest import async_session_maker
+
+# запрос мимо кэша, чтобы каждый раз доходить до БД
+NO_CACHE = {'Cache-Control': 'no-cache'}
+
+
+# удаляем все в начале
+async def test_start_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
+
+
+# Меню и субменю со счетчиками читаются одним запросом
+async def test_read_with_counts_single_statement(async_client, statements):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Menu', 'description': 'Menu'})
+    menu_id = response_menu.json()['id']
+    response_submenu = await async_client.post(f'/api/v1/menus/{menu_id}/submenus',
+                                               json={'title': 'Submenu', 'description': 'Submenu'})
+    submenu_id = response_submenu.json()['id']
+    for price in ('10.50', '12.00'):
+        response_dish = await async_client.post(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes',
+                                                json={'title': 'Dish', 'description': 'Dish', 'price': price})
+        assert response_dish.status_code == 201
+
+    statements.clear()
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}', headers=NO_CACHE)
+    assert response_menu.status_code == 200
+    assert response_menu.json()['submenus_count'] == 1
+    assert response_menu.json()['dishes_count'] == 2
+    assert len(statements) == 1
+
+    statements.clear()
+    response_submenu = await async_client.get(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}', headers=NO_CACHE)
+    assert response_submenu.status_code == 200
+    assert response_submenu.json()['dishes_count'] == 2
+    assert len(statements) == 1
+
+
+# Дерево каталога строится фиксированным числом запросов
+async def test_menus_tree_constant_statements(async_client, statements):
+    response_menu = await async_client.get('/api/v1/menus')
+    menu_id = response_menu.json()[0]['id']
+    response_submenu = await async_client.post(f'/api/v1/menus/{menu_id}/submenus',
+                                               json={'title': 'Submenu 2', 'description': 'Submenu 2'})
+    submenu_id = response_submenu.json()['id']
+    await async_client.post(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes',
+                            json={'title': 'Dish 3', 'description': 'Dish 3', 'price': '1.00'})
+
+    statements.clear()
+    response_tree = await async_client.get('/api/v1/menus/tree', headers=NO_CACHE)
+    assert response_tree.status_code == 200
+    tree = response_tree.json()
+    assert len(statements) == 3
+    assert tree[0]['submenus_count'] == 2
+    assert tree[0]['dishes_count'] == 3
+    assert sorted(len(submenu['dishes']) for submenu in tree[0]['submenus']) == [1, 2]
+
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}?include=submenus,dishes')
+    assert response_menu.status_code == 200
+    assert response_menu.json()['dishes_count'] == 3
+    assert len(response_menu.json()['submenus']) == 2
+
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}?include=submenus')
+    assert response_menu.status_code == 200
+    assert all('dishes' not in submenu for submenu in response_menu.json()['submenus'])
+
+    # изменение блюда инвалидирует закэшированное дерево
+    await async_client.post(f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes',
+                            json={'title': 'Dish 4', 'description': 'Dish 4', 'price': '2.00'})
+    response_tree = await async_client.get('/api/v1/menus/tree')
+    assert response_tree.json()[0]['dishes_count'] == 4
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}?include=submenus,dishes')
+    assert response_menu.json()['dishes_count'] == 4
+
+
+# Одновременные промахи по горячему ключу выполняют один запрос к БД
+async def test_concurrent_misses_single_flight(async_client, statements):
+    response_menu = await async_client.get('/api/v1/menus')
+    menu_id = response_menu.json()[0]['id']
+    await invalidate_menu(menu_id)
+
+    statements.clear()
+    responses = await asyncio.gather(*(async_client.get(f'/api/v1/menus/{menu_id}') for _ in range(10)))
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.text for response in responses}) == 1
+    assert len(statements) == 1
+
+
+# Пока пересчет держит другой воркер, отдаем устаревшую копию вместо запроса к БД
+async def test_locked_key_returns_stale():
+    backend = get_backend()
+    key = 'fastapi-cache:test:single_flight:id=1:2'
+    await backend.redis.set(stale_key(key), '{"title": "stale"}', ex=60)
+    token = await backend.acquire_lock(lock_key(key), 5)
+    assert token is not None
+
+    async def compute():
+        raise AssertionError('computed under foreign lock')
+
+    try:
+        assert await recompute(key, compute, 60) == (0, '{"title": "stale"}')
+    finally:
+        await backend.release_lock(lock_key(key), token)
+        await backend.redis.delete(stale_key(key))
+
+    ttl, entry = await recompute(key, lambda: asyncio.sleep(0, '"etag"\t\t\n{"title": "fresh"}'), 60)
+    assert ttl == 60
+    assert entry == '"etag"\t\t\n{"title": "fresh"}'
+    assert await backend.redis.get(stale_key(key)) == entry
+    await backend.redis.delete(key, stale_key(key))
+
+
+# Повторный опрос с If-None-Match получает 304 без запросов к БД, запись меняет ETag
+async def test_conditional_get(async_client, statements):
+    response_menu = await async_client.get('/api/v1/menus')
+    menu_id = response_menu.json()[0]['id']
+    response_submenu = await async_client.get(f'/api/v1/menus/{menu_id}/submenus')
+    submenu_id = response_submenu.json()[0]['id']
+    dishes_url = f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes'
+
+    response_dishes = await async_client.get(dishes_url)
+    etag = response_dishes.headers['ETag']
+    assert etag.startswith('"')
+    assert 'version' not in response_dishes.json()[0]
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}')
+    menu_etag = response_menu.headers['ETag']
+
+    statements.clear()
+    response_dishes = await async_client.get(dishes_url, headers={'If-None-Match': etag})
+    assert response_dishes.status_code == 304
+    assert response_dishes.headers['ETag'] == etag
+    assert response_dishes.content == b''
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}', headers={'If-None-Match': f'W/{menu_etag}'})
+    assert response_menu.status_code == 304
+    assert statements == []
+
+    # после инвалидации кэша данные те же: ETag из версий строк не меняется
+    await invalidate_menu(menu_id)
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}', headers={'If-None-Match': menu_etag})
+    assert response_menu.status_code == 304
+
+    # новое блюдо меняет список блюд и счетчики (а значит и версию) меню
+    response_dish = await async_client.post(dishes_url, json={'title': 'Dish 5', 'description': 'Dish 5',
+                                                              'price': '3.00'})
+    dish_id = response_dish.json()['id']
+    response_dishes = await async_client.get(dishes_url, headers={'If-None-Match': etag})
+    assert response_dishes.status_code == 200
+    assert response_dishes.headers['ETag'] != etag
+    response_menu = await async_client.get(f'/api/v1/menus/{menu_id}', headers={'If-None-Match': menu_etag})
+    assert response_menu.status_code == 200
+    assert response_menu.headers['ETag'] != menu_etag
+
+    # изменение блюда меняет его ETag
+    dish_url = f'{dishes_url}/{dish_id}'
+    dish_etag = (await async_client.get(dish_url)).headers['ETag']
+    await async_client.patch(dish_url, json={'title': 'Dish 5 updated', 'description': 'Dish 5', 'price': '3.00'})
+    response_dish = await async_client.get(dish_url, headers={'If-None-Match': dish_etag})
+    assert response_dish.status_code == 200
+    assert response_dish.json()['title'] == 'Dish 5 updated'
+
+
+# Повторные чтения с другими id не готовят новых запросов на соединении
+async def test_prepared_statements_reused():
+    async with async_session_maker() as session:
+        dishes = (await session.execute(select(models.Submenu.menu_id, models.Dish.submenu_id, models.Dish.id)
+                                        .join(models.Submenu))).all()
+        menu_ids = (await session.scalars(select(models.Menu.id))).all()
+        assert len(dishes) > 1
+
+        async def prepared_statements() -> set[str]:
+            return set((await session.scalars(text('SELECT statement FROM pg_prepared_statements'))).all())
+
+        await DishRepository(session).read_dish(*dishes[0], session)
+        await MenuRepository(session).read_menu_tree(menu_ids[0], True, session)
+        prepared = await prepared_statements()
+        for dish in dishes[1:]:
+            await DishRepository(session).read_dish(*dish, session)
+        for menu_id in menu_ids:
+            await MenuRepository(session).read_menu_tree(menu_id, True, session)
+        assert await prepared_statements() == prepared
+
+
+# Загрузка пула соединений
+async def test_db_stats(async_client):
+    response_stats = await async_client.get('/api/v1/db/stats')
+    assert response_stats.status_code == 200
+    stats = response_stats.json()
+    assert stats['checkouts'] > 0
+    assert 0 <= stats['saturation'] <= 1
+    assert stats['wait_seconds_max'] >= 0
+
+
+# Удаление меню - один DELETE, субменю и блюда удаляет ON DELETE CASCADE
+async def test_delete_menu_cascade(async_client, statements):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Cascade', 'description': 'Cascade'})
+    menu_id = response_menu.json()['id']
+    for number in range(2):
+        response_submenu = await async_client.post(f'/api/v1/menus/{menu_id}/submenus',
+                                                   json={'title': f'Submenu {number}', 'description': 'Submenu'})
+        submenu_url = f"/api/v1/menus/{menu_id}/submenus/{response_submenu.json()['id']}"
+        for price in ('1.00', '2.00'):
+            await async_client.post(f'{submenu_url}/dishes', json={'title': 'Dish', 'description': 'Dish',
+                                                                   'price': price})
+    assert (await async_client.get(f'{submenu_url}/dishes')).json() != []
+
+    statements.clear()
+    response = await async_client.delete(f'/api/v1/menus/{menu_id}')
+    assert response.status_code == 200
+    assert [statement.split()[0] for statement in statements] == ['DELETE']
+    # кэш поддерева сброшен
+    assert (await async_client.get(f'{submenu_url}/dishes')).json() == []
+    assert (await async_client.get(f'{submenu_url}')).status_code == 404
+    async with async_session_maker() as session:
+        assert await session.scalar(select(func.count()).select_from(models.Submenu)
+                                    .where(models.Submenu.menu_id == menu_id)) == 0
+        assert await session.scalar(select(func.count()).select_from(models.Dish).join(models.Submenu, isouter=True)
+                                    .where(models.Submenu.id.is_(None))) == 0
+    assert (await async_client.delete(f'/api/v1/menus/{menu_id}')).status_code == 404
+
+
+# Создание и изменение - одна команда (INSERT/UPDATE ... RETURNING, счетчики - в CTE), 404 без лишних запросов
+async def test_single_statement_writes(async_client, statements):
+    missing_id = uuid.uuid4()
+    statements.clear()
+    response = await async_client.post('/api/v1/menus', json={'title': 'Single', 'description': 'Single'})
+    assert response.status_code == 201
+    assert [statement.split()[0] for statement in statements] == ['INSERT']
+    menu_url = f"/api/v1/menus/{response.json()['id']}"
+
+    statements.clear()
+    response = await async_client.post(f'{menu_url}/submenus', json={'title': 'Single', 'description': 'Single'})
+    assert response.status_code == 201
+    assert len(statements) == 1 and statements[0].startswith('WITH')
+    submenu_url = f"{menu_url}/submenus/{response.json()['id']}"
+
+    statements.clear()
+    dish = {'title': 'Single', 'description': 'Single', 'price': '3.50'}
+    response = await async_client.post(f'{submenu_url}/dishes', json=dish)
+    assert response.status_code == 201
+    assert response.json()['price'] == '3.5'
+    assert len(statements) == 1 and statements[0].startswith('WITH')
+    dish_url = f"{submenu_url}/dishes/{response.json()['id']}"
+
+    for url, body in ((menu_url, {'title': 'Single 2'}), (submenu_url, {'title': 'Single 2'}),
+                      (dish_url, {**dish, 'title': 'Single 2'})):
+        statements.clear()
+        response = await async_client.patch(url, json=body)
+        assert response.status_code == 200
+        assert response.json()['title'] == 'Single 2'
+        assert [statement.split()[0] for statement in statements] == ['UPDATE']
+
+    response = await async_client.get(menu_url, headers=NO_CACHE)
+    assert (response.json()['submenus_count'], response.json()['dishes_count']) == (1, 1)
+    assert (await async_client.get(submenu_url, headers=NO_CACHE)).json()['dishes_count'] == 1
+
+    for url, body in ((f'/api/v1/menus/{missing_id}/submenus', {'title': 'Lost', 'description': 'Lost'}),
+                      (f'{menu_url}/submenus/{missing_id}/dishes', dish)):
+        statements.clear()
+        assert (await async_client.post(url, json=body)).status_code == 404
+        assert len(statements) == 1
+    for url, body in ((f'/api/v1/menus/{missing_id}', {'title': 'Lost'}),
+                      (f'/api/v1/menus/{missing_id}/submenus/{submenu_url.rsplit("/", 1)[1]}', {'title': 'Lost'}),
+                      (f'{submenu_url}/dishes/{missing_id}', dish)):
+        assert (await async_client.patch(url, json=body)).status_code == 404
+    # неудачные вставки не сдвинули счетчики
+    response = await async_client.get(menu_url, headers=NO_CACHE)
+    assert (response.json()['submenus_count'], response.json()['dishes_count']) == (1, 1)
+
+
+# Одновременные удаления одного блюда: строку удаляет один DELETE, только он сдвигает счетчики
+async def test_delete_dish_counts_once(async_client, statements):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Counts', 'description': 'Counts'})
+    menu_url = f"/api/v1/menus/{response_menu.json()['id']}"
+    response_submenu = await async_client.post(f'{menu_url}/submenus', json={'title': 'Counts', 'description': 'Counts'})
+    submenu_url = f"{menu_url}/submenus/{response_submenu.json()['id']}"
+    dish_urls = []
+    for number in range(2):
+        response_dish = await async_client.post(f'{submenu_url}/dishes', json={'title': f'Dish {number}',
+                                                                               'description': 'Dish', 'price': '1.00'})
+        dish_urls.append(f"{submenu_url}/dishes/{response_dish.json()['id']}")
+
+    statements.clear()
+    responses = await asyncio.gather(*(async_client.delete(dish_urls[0]) for _ in range(3)))
+    assert sorted(response.status_code for response in responses) == [200, 404, 404]
+    assert sorted(statement.split()[0] for statement in statements) == ['SELECT'] * 3 + ['WITH'] * 3
+    assert (await async_client.get(submenu_url, headers=NO_CACHE)).json()['dishes_count'] == 1
+    assert (await async_client.get(menu_url, headers=NO_CACHE)).json()['dishes_count'] == 1
+
+
+# Одновременное удаление блюда и его субменю: обе команды блокируют субменю первым, без deadlock
+async def test_delete_dish_and_submenu_concurrently(async_client):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Race', 'description': 'Race'})
+    menu_url = f"/api/v1/menus/{response_menu.json()['id']}"
+    for _ in range(5):
+        response_submenu = await async_client.post(f'{menu_url}/submenus', json={'title': 'Race', 'description': 'Race'})
+        submenu_url = f"{menu_url}/submenus/{response_submenu.json()['id']}"
+        dish_urls = []
+        for number in range(3):
+            response_dish = await async_client.post(f'{submenu_url}/dishes', json={'title': f'Dish {number}',
+                                                                                   'description': 'Dish',
+                                                                                   'price': '1.00'})
+            dish_urls.append(f"{submenu_url}/dishes/{response_dish.json()['id']}")
+        responses = await asyncio.gather(*(async_client.delete(url) for url in (*dish_urls, submenu_url)))
+        assert {response.status_code for response in responses} <= {200, 404}
+        assert responses[-1].status_code == 200
+    response_menu = await async_client.get(menu_url, headers=NO_CACHE)
+    assert (response_menu.json()['submenus_count'], response_menu.json()['dishes_count']) == (0, 0)
+
+
+# не больше стольких SQL-запросов на маршрут при промахе кэша
+QUERY_BUDGETS = {
+    ('GET', '/api/v1/menus'): 1,
+    ('POST', '/api/v1/menus'): 1,
+    ('GET', '/api/v1/menus/tree'): 3,
+    ('GET', '/api/v1/menus/{menu_id}'): 3,
+    ('PATCH', '/api/v1/menus/{menu_id}'): 1,
+    ('DELETE', '/api/v1/menus/{menu_id}'): 1,
+    ('GET', '/api/v1/menus/{menu_id}/submenus'): 1,
+    ('POST', '/api/v1/menus/{menu_id}/submenus'): 1,
+    ('GET', '/api/v1/menus/{menu_id}/submenus/{submenu_id}'): 1,
+    ('PATCH', '/api/v1/menus/{menu_id}/submenus/{submenu_id}'): 1,
+    ('DELETE', '/api/v1/menus/{menu_id}/submenus/{submenu_id}'): 2,
+    ('GET', '/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes'): 1,
+    ('POST', '/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes'): 1,
+    ('GET', '/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}'): 1,
+    ('PATCH', '/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}'): 1,
+    ('DELETE', '/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}'): 2,
+    ('POST', '/api/v1/dishes:batchGet'): 1,
+    ('POST', '/api/v1/submenus:batchGet'): 1,
+    # первый поиск в процессе проверяет, установлен ли pg_trgm
+    ('GET', '/api/v1/search'): 2,
+}
+
+
+# Бюджет SQL-запросов по маршрутам
+async def test_query_budgets(async_client, sql_profiles):
+    response = await async_client.post('/api/v1/menus', json={'title': 'Budget', 'description': 'Budget'})
+    menu_url = f"/api/v1/menus/{response.json()['id']}"
+    response = await async_client.post(f'{menu_url}/submenus', json={'title': 'Budget', 'description': 'Budget'})
+    submenu_url = f"{menu_url}/submenus/{response.json()['id']}"
+    dish = {'title': 'Budget', 'description': 'Budget', 'price': '1.00'}
+    response = await async_client.post(f'{submenu_url}/dishes', json=dish)
+    dish_url = f"{submenu_url}/dishes/{response.json()['id']}"
+
+    for url in ('/api/v1/menus', '/api/v1/menus/tree', menu_url, f'{menu_url}?include=submenus,dishes',
+                f'{menu_url}/submenus', submenu_url, f'{submenu_url}/dishes', dish_url):
+        assert (await async_client.get(url, headers=NO_CACHE)).status_code == 200
+    for url, item_url in (('/api/v1/dishes:batchGet', dish_url), ('/api/v1/submenus:batchGet', submenu_url)):
+        response = await async_client.post(url, json={'ids': [item_url.rsplit('/', 1)[1]]})
+        assert response.status_code == 200
+    assert (await async_client.get('/api/v1/search', params={'q': 'budget'}, headers=NO_CACHE)).status_code == 200
+    for url, body in ((menu_url, {'title': 'Budget 2'}), (submenu_url, {'title': 'Budget 2'}), (dish_url, dish)):
+        assert (await async_client.patch(url, json=body)).status_code == 200
+    for url in (dish_url, submenu_url, menu_url):
+        assert (await async_client.delete(url)).status_code == 200
+
+    used: dict[tuple[str, str], int] = {}
+    for profile in sql_profiles:
+        route = (profile.method, profile.route)
+        used[route] = max(used.get(route, 0), profile.statements)
+    assert used.keys() == QUERY_BUDGETS.keys()
+    assert {route: used[route] for route in used if used[route] > QUERY_BUDGETS[route]} == {}
+
+
+# Server-Timing, лог медленных запросов с планом и поиск N+1
+async def test_sql_profiler(async_client, sql_profiles, caplog, monkeypatch):
+    monkeypatch.setattr(profiler, 'SQL_SLOW_QUERY_MS', 0)
+    with caplog.at_level(logging.WARNING, logger='src.profiler'):
+        response = await async_client.get('/api/v1/menus', headers=NO_CACHE)
+        # отчет с EXPLAIN строится в фоне, после ответа
+        assert 'Slow query' not in caplog.text
+        await asyncio.gather(*profiler.reports)
+    assert response.status_code == 200
+    assert re.fullmatch(r'db;dur=[\d.]+;desc="statements: 1", app;dur=[\d.]+', response.headers['server-timing'])
+    assert [profile.route for profile in sql_profiles] == ['/api/v1/menus']
+    assert 'Slow query' in caplog.text
+    assert 'FROM menu' in caplog.text
+    # план из EXPLAIN
+    assert 'cost=' in caplog.text
+
+    monkeypatch.setattr(profiler, 'SQL_SLOW_QUERY_MS', 1000)
+    profile = profiler.RequestProfile('GET')
+    profile.route = '/api/v1/menus/{menu_id}'
+    profile.queries = [('SELECT * FROM submenu WHERE menu_id = $1', ('id',), 0.001, engine.sync_engine)] * 6
+    profile.queries += [('SELECT * FROM dish WHERE id IN ($1, $2)', (1, 2), 0.001, engine.sync_engine),
+                        ('SELECT * FROM dish WHERE id IN ($1)', (1,), 0.001, engine.sync_engine)]
+    # IN-списки разной длины - одна форма запроса
+    assert profile.repeated(1) == {'SELECT * FROM submenu WHERE menu_id = $?': 6,
+                                   'SELECT * FROM dish WHERE id IN ($?)': 2}
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='src.profiler'):
+        await profiler.report(profile)
+    assert caplog.messages == ['Possible N+1: GET /api/v1/menus/{menu_id} ran the same statement 6 times: '
+                               'SELECT * FROM submenu WHERE menu_id = $?']
+
+
+# удаляем все в конце
+async def test_end_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
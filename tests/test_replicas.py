@@ -0,0 +1,104 @@
+from sqlalchemy import text
+
+from src.config import DB_HOST, DB_PORT
+from src.database import (
+    PRIMARY_COOKIE,
+    Replica,
+    ReplicaSet,
+    get_async_session,
+    make_engine,
+    read_replica,
+    replicas,
+)
+from src.main import app
+from tests.conftest import async_session_maker
+
+# тот же сервер как реплика: он не в режиме восстановления, отставание 0
+REPLICA = f'{DB_HOST}:{DB_PORT}'
+
+
+async def test_start_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
+
+
+# Проверка реплик: отставание, недоступность, выбор по кругу
+async def test_replica_checks():
+    near, far = Replica('near', make_engine(DB_HOST, DB_PORT)), Replica('far', make_engine(DB_HOST, DB_PORT))
+    down = Replica('down', make_engine('127.0.0.1', '1'))
+    replica_set = ReplicaSet([near, far, down], max_lag=5, check_interval=1)
+    assert replica_set.choose() is None
+
+    await replica_set.check()
+    assert (near.healthy, near.lag) == (True, 0)
+    assert (down.healthy, down.lag) == (False, None)
+    assert [replica_set.choose() for _ in range(4)] == [near, far, near, far]
+
+    await far.check(max_lag=-1, timeout=1)
+    assert not far.healthy
+    assert [replica_set.choose() for _ in range(2)] == [near, near]
+
+    # прочитанное из реплики в окне после инвалидации не кэшируется, из основной БД - кэшируется
+    assert replica_set.fill_expire(60) == 60
+    token = read_replica.set(True)
+    assert replica_set.fill_expire(60) == 60
+    replica_set.note_invalidation()
+    assert replica_set.fill_expire(60) == 0
+    read_replica.reset(token)
+    assert replica_set.fill_expire(60) == 60
+    for replica in replica_set.replicas:
+        await replica.engine.dispose()
+
+
+# GET читает из реплики; запись, чтение писавшего клиента сразу после записи и no-cache - из основной БД
+async def test_replica_routing(async_client, monkeypatch):
+    replica = Replica(REPLICA, make_engine(DB_HOST, DB_PORT))
+    await replica.check(max_lag=5, timeout=1)
+    monkeypatch.setattr(replicas, 'replicas', [replica])
+    monkeypatch.setattr(replicas, 'sessions', {'primary': 0, REPLICA: 0})
+    monkeypatch.setattr(replicas, 'invalidated_at', float('-inf'))
+    monkeypatch.delitem(app.dependency_overrides, get_async_session)
+
+    response = await async_client.get('/api/v1/menus', params={'limit': 7})
+    assert response.status_code == 200
+    assert replicas.sessions == {'primary': 0, REPLICA: 1}
+
+    response = await async_client.post('/api/v1/menus', json={'title': 'Menu', 'description': 'Menu'})
+    assert response.status_code == 201
+    assert PRIMARY_COOKIE in response.cookies
+    assert replicas.sessions == {'primary': 1, REPLICA: 1}
+    # писавший клиент читает свою запись из основной БД, мимо кэша
+    for _ in range(2):
+        response = await async_client.get('/api/v1/menus', params={'limit': 7})
+        assert response.json()[0]['title'] == 'Menu'
+    assert replicas.sessions == {'primary': 3, REPLICA: 1}
+
+    # другие клиенты читают из реплики, но в окне после инвалидации прочитанное не кэшируется
+    async_client.cookies.clear()
+    for _ in range(2):
+        await async_client.get('/api/v1/menus', params={'limit': 7})
+    assert replicas.sessions == {'primary': 3, REPLICA: 3}
+
+    monkeypatch.setattr(replicas, 'invalidated_at', float('-inf'))
+    await async_client.get('/api/v1/menus', params={'limit': 7})
+    # попадание в кэш готовых ответов сессию не открывает
+    await async_client.get('/api/v1/menus', params={'limit': 7})
+    assert replicas.sessions == {'primary': 3, REPLICA: 4}
+    await async_client.get('/api/v1/menus', params={'limit': 7}, headers={'Cache-Control': 'no-cache'})
+    assert replicas.sessions == {'primary': 4, REPLICA: 4}
+
+    stats = (await async_client.get('/api/v1/db/stats')).json()
+    assert stats['replicas'][0]['name'] == REPLICA
+    assert stats['replicas'][0]['healthy'] is True
+    await replica.engine.dispose()
+
+
+async def test_end_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
@@ -0,0 +1,149 @@
+import asyncio
+from collections.abc import AsyncGenerator
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import get_async_session
+from src.main import app
+from src.response_cache import COMPRESSORS, accepted_encodings, responses
+from tests.conftest import async_session_maker
+
+
+# удаляем все в начале
+async def test_start_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
+
+
+# Попадание отдается до роутера: без сессии БД и SQL, с тем же телом, ETag и 304
+async def test_hit_skips_dependencies(async_client, statements, monkeypatch):
+    response_menu = await async_client.post('/api/v1/menus', json={'title': 'Menu', 'description': 'Menu'})
+    menu_id = response_menu.json()['id']
+    opened = []
+
+    async def counting_session() -> AsyncGenerator[AsyncSession, None]:
+        opened.append(1)
+        async with async_session_maker() as session:
+            yield session
+
+    monkeypatch.setitem(app.dependency_overrides, get_async_session, counting_session)
+    url = f'/api/v1/menus/{menu_id}'
+    stats = (await async_client.get('/api/v1/cache/stats')).json()
+    first = await async_client.get(url)
+    assert first.status_code == 200
+    assert len(opened) == 1
+
+    statements.clear()
+    second = await async_client.get(url)
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.headers['Cache-Control'].startswith('max-age=')
+    assert second.headers['content-type'] == 'application/json'
+    assert len(opened) == 1
+    assert statements == []
+    # попадания кэша ответов видны в статистике кэша рядом с уровнями @cache
+    after = (await async_client.get('/api/v1/cache/stats')).json()
+    assert after['response_hits'] == stats['response_hits'] + 1
+    assert after['response_misses'] == stats['response_misses'] + 1
+
+    # id в другом регистре и незнакомый обработчику параметр - тот же ключ
+    response = await async_client.get(f'/api/v1/menus/{menu_id.upper()}', params={'utm_source': 'mail'})
+    assert response.content == first.content
+    assert len(opened) == 1
+
+    response = await async_client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == first.headers['ETag']
+    assert len(opened) == 1
+
+    # no-cache и неверный UUID идут через обработчик
+    await async_client.get(url, headers={'Cache-Control': 'no-cache'})
+    assert len(opened) == 2
+    assert len(statements) == 1
+    assert (await async_client.get('/api/v1/menus/not-a-uuid')).status_code == 422
+
+
+# Порядок параметров не важен, ошибки не кэшируются, запись меняет ключ через поколения тегов
+async def test_query_normalization_and_invalidation(async_client, statements):
+    for number in range(2):
+        await async_client.post('/api/v1/menus', json={'title': f'Page {number}', 'description': 'Menu'})
+    first = await async_client.get('/api/v1/menus', params={'limit': 1, 'skip': 0})
+    assert first.status_code == 200
+    assert 'rel="next"' in first.headers['Link']
+    entries = len(responses)
+
+    statements.clear()
+    response = await async_client.get('/api/v1/menus?skip=0&limit=1')
+    assert response.content == first.content
+    assert response.headers['Link'] == first.headers['Link']
+    assert statements == []
+    assert len(responses) == entries
+
+    assert (await async_client.get('/api/v1/menus', params={'limit': 'many'})).status_code == 422
+    assert (await async_client.get('/api/v1/menus', params={'limit': 'many'})).status_code == 422
+    assert len(responses) == entries
+
+    menu_id = first.json()[0]['id']
+    await async_client.patch(f'/api/v1/menus/{menu_id}', json={'title': 'Renamed', 'description': 'Menu'})
+    statements.clear()
+    response = await async_client.get('/api/v1/menus', params={'limit': 1, 'skip': 0})
+    assert response.json()[0]['title'] == 'Renamed'
+    assert len(statements) == 1
+
+
+# Большой ответ сжимается при сохранении: вариант по Accept-Encoding, Vary и слабый ETag у сжатых
+async def test_compressed_variants(async_client):
+    for number in range(10):
+        await async_client.post('/api/v1/menus', json={'title': f'Menu {number}', 'description': 'Long ' * 20})
+    first = await async_client.get('/api/v1/menus', headers={'Accept-Encoding': 'br'})
+    etag = first.headers['ETag']
+    # промах уходит без сжатия
+    assert 'content-encoding' not in first.headers
+    assert first.headers['Vary'] == 'Accept-Encoding'
+
+    for accept_encoding, encoding in (('br', 'br'), ('gzip, deflate', 'gzip'), ('gzip, br;q=0.5', 'gzip'),
+                                      ('*', 'br'), ('identity', None), ('br;q=0, gzip;q=0', None)):
+        response = await async_client.get('/api/v1/menus', headers={'Accept-Encoding': accept_encoding})
+        assert response.headers.get('content-encoding') == encoding
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.content == first.content
+        if encoding is None:
+            assert response.headers['ETag'] == etag
+            assert response.num_bytes_downloaded == len(first.content)
+        else:
+            assert response.headers['ETag'] == f'W/{etag}'
+            assert response.num_bytes_downloaded < len(first.content) // 2
+
+    response = await async_client.get('/api/v1/menus', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == f'W/{etag}'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+    assert accepted_encodings('gzip;q=0.5, br;q=0.8') == ('br', 'gzip')
+    assert accepted_encodings('br;q=abc, deflate') == ()
+
+
+# Одновременные промахи по одному ключу сжимают ответ один раз
+async def test_concurrent_misses_compress_once(async_client, monkeypatch):
+    compressed = []
+    compress = COMPRESSORS['gzip']
+    monkeypatch.setitem(COMPRESSORS, 'gzip', lambda body: compressed.append(1) or compress(body))
+    results = await asyncio.gather(*(async_client.get('/api/v1/menus', params={'limit': 9}) for _ in range(5)))
+    assert {response.status_code for response in results} == {200}
+    assert compressed == [1]
+    response = await async_client.get('/api/v1/menus', params={'limit': 9}, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+
+
+# удаляем все в конце
+async def test_end_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
@@ -0,0 +1,89 @@
+from sqlalchemy import text
+
+from tests.conftest import async_session_maker
+
+SEARCH_URL = '/api/v1/search'
+
+
+# удаляем все в начале
+async def test_start_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))
+
+
+async def create_catalog(async_client, title: str) -> tuple[str, str]:
+    response_menu = await async_client.post('/api/v1/menus', json={'title': title, 'description': title})
+    menu_id = response_menu.json()['id']
+    response_submenu = await async_client.post(f'/api/v1/menus/{menu_id}/submenus',
+                                               json={'title': f'{title} pizza', 'description': 'Italian pizza'})
+    return menu_id, response_submenu.json()['id']
+
+
+# Ранжированный поиск по префиксам слов в блюдах и субменю
+async def test_search(async_client, statements):
+    menu_id, submenu_id = await create_catalog(async_client, 'Menu')
+    dishes_url = f'/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes'
+    for title, description in (('Margherita', 'Tomato and mozzarella'), ('Pepperoni', 'Spicy pizza with salami'),
+                               ('Борщ', 'Суп со сметаной')):
+        await async_client.post(dishes_url, json={'title': title, 'description': description, 'price': '9.50'})
+
+    response = await async_client.get(SEARCH_URL, params={'q': 'Marg'})
+    assert response.status_code == 200
+    assert [(item['type'], item['title']) for item in response.json()] == [('dish', 'Margherita')]
+    assert response.json()[0]['price'] == '9.5'
+    assert response.json()[0]['menu_id'] == menu_id
+    assert response.json()[0]['submenu_id'] == submenu_id
+
+    # совпадение в заголовке выше совпадения в описании
+    response = await async_client.get(SEARCH_URL, params={'q': 'pizzas'})
+    found = [(item['type'], item['title']) for item in response.json()]
+    assert found == [('submenu', 'Menu pizza'), ('dish', 'Pepperoni')]
+    assert response.json()[0]['price'] is None
+
+    response = await async_client.get(SEARCH_URL, params={'q': 'борщи'})
+    assert [item['title'] for item in response.json()] == ['Борщ']
+
+    response = await async_client.get(SEARCH_URL, params={'q': 'pizza', 'limit': 1, 'skip': 1})
+    assert [item['title'] for item in response.json()] == ['Pepperoni']
+
+    # запросы, различающиеся регистром и пунктуацией, попадают в один ключ кэша
+    statements.clear()
+    response = await async_client.get(SEARCH_URL, params={'q': '  MARG! '})
+    assert [item['title'] for item in response.json()] == ['Margherita']
+    assert statements == []
+
+    assert (await async_client.get(SEARCH_URL, params={'q': ''})).status_code == 422
+    assert (await async_client.get(SEARCH_URL, params={'q': '!!'})).json() == []
+
+
+# Запись блюда сбрасывает кэш поиска, поиск ограничивается меню
+async def test_search_invalidation_and_menu_scope(async_client):
+    response = await async_client.get(SEARCH_URL, params={'q': 'pizza'})
+    menu_id = response.json()[0]['menu_id']
+    other_menu_id, other_submenu_id = await create_catalog(async_client, 'Other')
+
+    response = await async_client.get(SEARCH_URL, params={'q': 'pizza'})
+    assert len(response.json()) == 3
+    response = await async_client.get(SEARCH_URL, params={'q': 'pizza', 'menu_id': other_menu_id})
+    assert [item['title'] for item in response.json()] == ['Other pizza']
+
+    await async_client.post(f'/api/v1/menus/{other_menu_id}/submenus/{other_submenu_id}/dishes',
+                            json={'title': 'Quattro formaggi', 'description': 'Four cheese pizza', 'price': '11'})
+    response = await async_client.get(SEARCH_URL, params={'q': 'pizza', 'menu_id': other_menu_id})
+    assert [item['title'] for item in response.json()] == ['Other pizza', 'Quattro formaggi']
+
+    await async_client.delete(f'/api/v1/menus/{menu_id}')
+    response = await async_client.get(SEARCH_URL, params={'q': 'pizza'})
+    assert {item['menu_id'] for item in response.json()} == {other_menu_id}
+
+
+# удаляем все в конце
+async def test_end_clean_tables():
+    async with async_session_maker() as session:
+        async with session.begin():
+            await session.execute(text('DELETE FROM dish'))
+            await session.execute(text('DELETE FROM submenu'))
+            await session.execute(text('DELETE FROM menu'))